@@ -0,0 +1,208 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+
+import main
+from mock_feishu_server import MockFeishuServer, add_config_arguments, config_from_args
+
+# End-to-end benchmark of FeishuDriveBackup against the local mock server (or any server given
+# with --url that speaks the same API plus /_mock/stats). Every combination of the comma-separated
+# worker / polling settings is run once per --repeat, each into a fresh output dir.
+
+GRID_SETTINGS = ("lister_workers", "export_workers", "download_workers", "poll_qps", "poll_interval", "export_order")
+
+
+def parse_grid(value: str, cast: Any) -> List[Any]:
+    return [cast(item) for item in value.split(",") if item.strip()]
+
+
+def mock_stats(base_url: str) -> Dict[str, Any]:
+    root = base_url[: -len("/open-apis")] if base_url.endswith("/open-apis") else base_url
+    response = requests.get(f"{root}/_mock/stats", timeout=10)
+    response.raise_for_status()
+    return response.json()
+
+
+def reset_mock(base_url: str) -> None:
+    root = base_url[: -len("/open-apis")] if base_url.endswith("/open-apis") else base_url
+    requests.post(f"{root}/_mock/reset", timeout=10).raise_for_status()
+
+
+def run_once(base_url: str, source: str, settings: Dict[str, Any], rate_scale: float, verbose: bool) -> Dict[str, Any]:
+    main.BASE_URL = base_url
+    main.BACKUP_SOURCE = source
+    reset_mock(base_url)
+    rate_limits = {
+        family: {"initial": limits["initial"] * rate_scale, "max": limits.get("max", limits["initial"]) * rate_scale}
+        for family, limits in main.RATE_LIMITS.items()
+    }
+    with tempfile.TemporaryDirectory(prefix="feishu-bench-") as work_dir:
+        # Goes through the real refresh flow (the mock rotates tokens with --token-ttl), but
+        # never touches the real token_store.json.
+        main.TOKEN_STORE_FILE = str(Path(work_dir) / "token_store.json")
+        tokens = main.AccessTokenManager("mock.refresh.token")
+        tokens.refresh("")
+        backup = main.FeishuDriveBackup(
+            user_access_token=tokens.token(),
+            output_dir=Path(work_dir) / "backup",
+            timeout_seconds=main.REQUEST_TIMEOUT_SECONDS,
+            max_retries=main.MAX_RETRIES,
+            poll_interval_seconds=settings["poll_interval"],
+            max_export_wait_seconds=main.MAX_EXPORT_WAIT_SECONDS,
+            lister_workers=settings["lister_workers"],
+            export_workers=settings["export_workers"],
+            download_workers=settings["download_workers"],
+            export_poller_threads=main.EXPORT_POLLER_THREADS,
+            export_poll_qps=settings["poll_qps"],
+            max_inflight_exports=main.MAX_INFLIGHT_EXPORTS,
+            export_order=settings["export_order"],
+            rate_limiter=main.AdaptiveRateLimiter(rate_limits),
+            hash_algorithm=main.HASH_ALGORITHM,
+            scan_existing_names=False,
+            token_manager=tokens,
+        )
+        started_at = time.monotonic()
+        log = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(sys.stdout if verbose else log):
+                tokens.start()
+                exit_code = backup.run()
+        finally:
+            tokens.stop()
+            backup.close()
+        elapsed = max(time.monotonic() - started_at, 1e-6)
+
+    metrics = backup.metrics
+    saved_bytes = sum(metrics.counters("saved_bytes_total").values())
+    downloaded_bytes = sum(metrics.counters("download_bytes_total").values())
+    phases = {dict(labels)["phase"]: summary for labels, summary in metrics.histograms("phase_seconds").items()}
+    server = mock_stats(base_url)
+    return {
+        "settings": settings,
+        "exit_code": exit_code,
+        "elapsed_seconds": round(elapsed, 3),
+        "documents": backup.stats["files"],
+        "failed": backup.stats["failed"],
+        "docs_per_second": round(backup.stats["files"] / elapsed, 3),
+        "saved_bytes": int(saved_bytes),
+        "downloaded_bytes": int(downloaded_bytes),
+        "mib_per_second": round(downloaded_bytes / elapsed / 1024 / 1024, 3),
+        "client_requests": int(sum(metrics.counters("requests_total").values())),
+        "client_retries": int(sum(metrics.counters("retries_total").values())),
+        "token_refreshes": tokens.refreshes,
+        "server_requests": server["requests"],
+        "server_endpoints": server["endpoints"],
+        "phases": phases,
+    }
+
+
+def settings_key(settings: Dict[str, Any]) -> str:
+    # Settings missing from an older baseline file count as their defaults.
+    defaults = {"export_order": main.EXPORT_ORDER}
+    return ",".join(f"{name}={settings.get(name, defaults.get(name))}" for name in GRID_SETTINGS)
+
+
+def print_result(result: Dict[str, Any]) -> None:
+    phases = result["phases"]
+    wait = phases.get("export_wait", {})
+    total = phases.get("file_total", {})
+    throttled = sum(counters.get("throttled", 0) for counters in result["server_endpoints"].values())
+    print(
+        f"{settings_key(result['settings'])}: {result['documents']} docs in {result['elapsed_seconds']:.2f}s "
+        f"= {result['docs_per_second']:.2f} docs/s, {result['mib_per_second']:.2f} MiB/s, "
+        f"{result['server_requests']} requests ({throttled} throttled, {result['client_retries']} retries), "
+        f"export wait p95={wait.get('p95', 0):.2f}s, file p95={total.get('p95', 0):.2f}s, "
+        f"failed={result['failed']}"
+    )
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: Path, tolerance: float) -> int:
+    baseline = {settings_key(item["settings"]): item for item in json.loads(baseline_path.read_text(encoding="utf-8"))["results"]}
+    regressions = 0
+    print("\n[COMPARE]")
+    for result in results:
+        key = settings_key(result["settings"])
+        previous = baseline.get(key)
+        if previous is None:
+            print(f"- {key}: not in baseline")
+            continue
+        change = result["docs_per_second"] / max(previous["docs_per_second"], 1e-9) - 1
+        regressed = change < -tolerance
+        regressions += regressed
+        print(
+            f"- {key}: {previous['docs_per_second']:.2f} -> {result['docs_per_second']:.2f} docs/s "
+            f"({change:+.1%}){' REGRESSION' if regressed else ''}"
+        )
+    return regressions
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="基于本地模拟服务的端到端备份压测")
+    parser.add_argument("--url", help="使用已启动的模拟服务（例如 http://127.0.0.1:18080/open-apis），默认在进程内启动")
+    parser.add_argument("--source", choices=sorted(main.VALID_BACKUP_SOURCES), default="drive")
+    parser.add_argument("--lister-workers", default=str(main.LISTER_WORKERS), help="逗号分隔，可给多个值")
+    parser.add_argument("--export-workers", default=str(main.EXPORT_WORKERS), help="逗号分隔，可给多个值")
+    parser.add_argument("--download-workers", default=str(main.DOWNLOAD_WORKERS), help="逗号分隔，可给多个值")
+    parser.add_argument("--poll-qps", default=str(main.EXPORT_POLL_QPS), help="逗号分隔，可给多个值")
+    parser.add_argument("--poll-interval", default=str(main.POLL_INTERVAL_SECONDS), help="逗号分隔，可给多个值")
+    parser.add_argument("--export-order", default=main.EXPORT_ORDER, help="逗号分隔，可给多个值（longest_first / listing）")
+    parser.add_argument("--rate-scale", type=float, default=1.0, help="RATE_LIMITS 的倍数，压测纯流水线时可调大")
+    parser.add_argument("--repeat", type=int, default=1, help="每组设置重复次数")
+    parser.add_argument("--json", dest="json_path", help="把结果写入 JSON 文件，可作为之后的 --baseline")
+    parser.add_argument("--baseline", help="与之前 --json 的结果比较 docs/s")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="docs/s 下降超过该比例视为回退")
+    parser.add_argument("--verbose", action="store_true", help="输出备份过程日志")
+    add_config_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main_benchmark() -> None:
+    args = parse_args()
+    grid = {
+        "lister_workers": parse_grid(args.lister_workers, int),
+        "export_workers": parse_grid(args.export_workers, int),
+        "download_workers": parse_grid(args.download_workers, int),
+        "poll_qps": parse_grid(args.poll_qps, float),
+        "poll_interval": parse_grid(args.poll_interval, float),
+        "export_order": parse_grid(args.export_order, str),
+    }
+    server = None
+    base_url = args.url
+    if not base_url:
+        server = MockFeishuServer(config_from_args(args)).start()
+        base_url = server.base_url
+    print(f"[INFO] Benchmark against {base_url}, source={args.source}")
+
+    results: List[Dict[str, Any]] = []
+    try:
+        for values in itertools.product(*(grid[name] for name in GRID_SETTINGS)):
+            settings = dict(zip(GRID_SETTINGS, values))
+            for _ in range(max(1, args.repeat)):
+                result = run_once(base_url, args.source, settings, args.rate_scale, args.verbose)
+                print_result(result)
+                results.append(result)
+        server_config = mock_stats(base_url)["config"]
+    finally:
+        if server is not None:
+            server.stop()
+
+    if args.json_path:
+        payload = {"created_at": int(time.time()), "source": args.source, "mock": server_config, "results": results}
+        Path(args.json_path).write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[INFO] Results written to {args.json_path}")
+    failed = sum(1 for result in results if result["exit_code"] != 0)
+    regressions = compare(results, Path(args.baseline), args.tolerance) if args.baseline else 0
+    sys.exit(3 if regressions else (2 if failed else 0))
+
+
+if __name__ == "__main__":
+    main_benchmark()
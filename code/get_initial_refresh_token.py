@@ -73,8 +73,7 @@ def exchange_code_for_refresh_token(code: str) -> str:
     return refresh_token
 
 
-def save_initial_refresh_token(refresh_token: str) -> Path:
-    token_file = Path(TOKEN_STORE_FILE)
+def save_initial_refresh_token(refresh_token: str, token_file: Path) -> Path:
     token_file.parent.mkdir(parents=True, exist_ok=True)
     payload = {
         "refresh_token": refresh_token,
@@ -102,7 +101,9 @@ def main() -> None:
 
     code = parse_code(callback_url)
     refresh_token = exchange_code_for_refresh_token(code)
-    token_file = save_initial_refresh_token(refresh_token)
+    # An optional argument stores another account's token, e.g. for a BACKUP_SOURCES token_store.
+    token_file = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(TOKEN_STORE_FILE)
+    token_file = save_initial_refresh_token(refresh_token, token_file)
 
     print("\n[OK] refresh_token 获取成功")
     print(f"已保存到: {token_file}")
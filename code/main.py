@@ -1,16 +1,51 @@
+import argparse
+import contextlib
+import hashlib
+import heapq
+import io
+import itertools
 import json
+import math
+import os
+import random
 import re
+import shutil
+import socket
+import sqlite3
 import sys
+import threading
 import time
+import uuid
+import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from typing import IO, Any, BinaryIO, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
 
 BASE_URL = "https://open.feishu.cn/open-apis"
 RETRYABLE_HTTP_STATUS = {429, 500, 502, 503, 504}
 RETRYABLE_API_CODES = {1069923}
+RATE_LIMITED_API_CODES = {1069923}
 INVALID_REFRESH_TOKEN_CODES = {20026, 20037, 20064, 20073, 20074}
+INVALID_ACCESS_TOKEN_CODES = {99991663, 99991668, 99991677}  # invalid / expired user_access_token
+FOLDER_MISSING_TOKEN_WARN = "[WARN] has_more=true but no next page token returned, stopping pagination to avoid infinite loop"
+LIBRARY_MISSING_TOKEN_WARN = "[WARN] has_more=true but no page token returned, stopping pagination to avoid infinite loop"
 
 # =========================
 # Required user config
@@ -24,18 +59,121 @@ PROJECT_DIR = CODE_DIR.parent
 TOKEN_STORE_FILE = str(CODE_DIR / "token_store.json")
 OUTPUT_DIR = str(PROJECT_DIR / "feishu_backups")
 RUN_SUBDIR_BY_DATE = True
-BACKUP_SOURCE = "my_library"  # "drive" or "my_library"
+INCREMENTAL_MODE = False  # skip documents whose modified time matches the previous run's manifest
+MANIFEST_FILENAME = ".backup_manifest.jsonl"  # per-run record of every saved file
+FAILURES_FILENAME = ".failures.jsonl"  # per-run record of every failed item, written as it happens
+FAILED_LIST_LIMIT = 200  # failures kept in memory for the summary; the full list is in FAILURES_FILENAME
+LATEST_RUN_POINTER = ".latest_run.json"  # under OUTPUT_DIR, points at the last completed run
+PATH_MAP_FILENAME = ".path_map.json"  # under OUTPUT_DIR, token -> local path so names stay stable across runs
+DEDUP_STORE = False  # store file bodies once by content hash and hardlink them into each run dir
+OBJECT_STORE_DIRNAME = ".objects"  # content-addressed store under OUTPUT_DIR
+KEEP_SNAPSHOTS = 30  # dated run dirs kept by `python3 main.py prune`
+OUTPUT_FORMAT = "files"  # "files": one file per document; "zip": stream bodies into rolling zip volumes
+ARCHIVE_BASENAME = "backup"  # volumes are <run dir>/backup.000.zip, backup.001.zip, ...
+ARCHIVE_INDEX_FILENAME = ".archive_index.jsonl"  # member -> volume, local header offset, sizes, crc
+ARCHIVE_VOLUME_BYTES = 4 * 1024 * 1024 * 1024  # start a new volume once the current one reaches this size
+ARCHIVE_MEMBER_BUFFER_BYTES = 64 * 1024 * 1024  # bodies up to this size are buffered in memory, not streamed under the archive lock
+# Already-compressed formats are stored as-is; deflating them again only burns CPU.
+ARCHIVE_STORED_SUFFIXES = {".docx", ".xlsx", ".pptx", ".pdf", ".zip", ".png", ".jpg", ".jpeg", ".gif", ".mp4", ".gz"}
+RUN_JOURNAL = True  # record traversal and completed items so `--resume <run-dir>` can continue a run
+JOURNAL_FILENAME = ".backup_journal.sqlite"
+LISTING_INDEX_FILENAME = ".listing_index.sqlite"  # under OUTPUT_DIR, cached folder / library listings
+LISTING_INDEX_TTL_SECONDS = 6 * 3600  # cached listings younger than this are reused by `plan`
+REUSE_LISTING_INDEX = False  # let backup runs reuse fresh cached listings as well, skipping list calls
+WORK_QUEUE_FILENAME = ".work_queue.sqlite"  # under OUTPUT_DIR, lease queue shared by `coordinator` and `worker` processes
+WORK_LEASE_SECONDS = 120  # a worker that stops renewing its leases for this long is presumed dead; its containers are handed out again
+WORK_LEASE_MAX_ATTEMPTS = 3  # a container whose lease expired this many times is given up and recorded as failed
+WORK_QUEUE_POLL_SECONDS = 2  # idle workers and the coordinator look at the queue this often
+WORK_QUEUE_BUSY_SECONDS = 30  # wait this long for another process's write lock on the queue
+RUN_DIR_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}$")
+BACKUP_SOURCE = "my_library"  # "drive", "my_library" or "wiki:<space_id>"; used when BACKUP_SOURCES is empty
+# Several sources in one run, each into its own sub-directory of the run dir, e.g.
+# [{"source": "drive"}, {"source": "my_library"}, {"source": "wiki:7034...", "name": "team"},
+#  {"source": "drive", "name": "alice", "token_store": "token_store_alice.json"}]
+BACKUP_SOURCES: List[Dict[str, str]] = []
 MY_LIBRARY_SPACE_ID = "my_library"
 VALID_BACKUP_SOURCES = {"drive", "my_library"}
+WIKI_SOURCE_PREFIX = "wiki:"
+VALID_OUTPUT_FORMATS = {"files", "zip"}
 
 REQUEST_TIMEOUT_SECONDS = 30
+TOKEN_REFRESH_MARGIN_SECONDS = 600  # refresh user_access_token this long before it expires
+TOKEN_REFRESH_RETRY_SECONDS = 30  # wait before retrying a failed background refresh
+TOKEN_REFRESH_ATTEMPTS = 4  # tries per refresh while the oauth endpoint answers 429 / 5xx or the request fails
 MAX_RETRIES = 3
-POLL_INTERVAL_SECONDS = 2
+POLL_INTERVAL_SECONDS = 2  # first backoff step once a predicted export time has passed
+POLL_MAX_INTERVAL_SECONDS = 30  # cap for the exponential poll backoff
+POLL_INITIAL_DELAY_SECONDS = 1.0  # first poll delay for (type, size) pairs without history
+EXPORT_HISTORY_FILENAME = ".export_history.json"  # under OUTPUT_DIR, observed export durations
+EXPORT_ROUTES_FILENAME = ".export_routes.json"  # under OUTPUT_DIR, learned export / direct-download route per (type, extension)
+ROUTE_DIRECT_AFTER_FAILURES = 3  # export rejections in a row before a (type, extension) pair skips straight to download
+ROUTE_REPROBE_SECONDS = 7 * 24 * 3600  # a pair routed to download tries one export again after this long
+# Fixed routes that bypass learning, keyed by type or "type:.ext", e.g. {"file": "direct", "file:.pdf": "export"}.
+# Only types with a direct-download fallback ("file") can be routed past the export.
+EXPORT_ROUTE_OVERRIDES: Dict[str, str] = {}
+WIKI_CACHE_FILENAME = ".wiki_cache.json"  # under OUTPUT_DIR, resolved wiki shortcut targets
+WIKI_CACHE_TTL_SECONDS = 6 * 3600  # resolutions older than this are fetched again (bounds edit-time staleness)
+WIKI_CACHE_SIZE = 10000  # in-process LRU entries
 MAX_EXPORT_WAIT_SECONDS = 600
+LISTER_WORKERS = 4  # threads expanding folders / library nodes in parallel
+EXPORT_WORKERS = 4  # threads creating export tasks, fed by traversal
+DOWNLOAD_WORKERS = 4  # threads downloading finished exports and fallback files
+EXPORT_POLLER_THREADS = 2  # threads sharing the central export-ticket poller
+EXPORT_POLL_QPS = 5.0  # total query_export_task rate, independent of tickets in flight
+MAX_INFLIGHT_EXPORTS = 1000  # traversal blocks once this many files are in the pipeline
+EXPORT_ORDER = "longest_first"  # "longest_first": create the most expensive queued exports first; "listing": traversal order
+# Estimated export seconds for types without history in EXPORT_HISTORY_FILENAME (longest_first only).
+EXPORT_COST_DEFAULTS = {"bitable": 30.0, "sheet": 15.0, "slides": 15.0, "docx": 5.0, "doc": 5.0, "file": 1.0}
+EXPORT_COST_DEFAULT_SECONDS = 5.0  # any other type
+VALID_EXPORT_ORDERS = {"longest_first", "listing"}
+# Shared per-endpoint-family token buckets (requests/second). On HTTP 429 or code 1069923 the
+# family's rate is multiplied by RATE_LIMIT_DECREASE; every clean second adds RATE_LIMIT_INCREASE.
+RATE_LIMITS = {
+    "list": {"initial": 5.0, "max": 20.0},
+    "export_create": {"initial": 2.0, "max": 10.0},
+    "export_query": {"initial": 5.0, "max": 20.0},
+    "download": {"initial": 5.0, "max": 20.0},
+}
+RATE_LIMIT_MIN = 0.2
+RATE_LIMIT_INCREASE = 0.5
+RATE_LIMIT_DECREASE = 0.5
+DOWNLOAD_CHUNK_BYTES = 1024 * 256
+DISK_WRITER_THREADS = 2  # threads writing downloaded bytes to disk, so network reads never wait on a slow disk
+WRITE_BUFFER_BYTES = 64 * 1024 * 1024  # downloaded bytes queued for the writers; downloads pause while it is full
+WRITE_COALESCE_BYTES = 4 * 1024 * 1024  # network chunks are gathered into disk writes of this size
+PREALLOCATE_FILES = False  # reserve Content-Length up front with posix_fallocate (on filesystems without it glibc writes zeros)
+FSYNC_POLICY = "none"  # "none"; "file": fsync each file before it is renamed into place; "batch": fsync in groups, off the download threads
+FSYNC_BATCH_FILES = 64  # files per fsync batch with FSYNC_POLICY = "batch"
+VALID_FSYNC_POLICIES = {"none", "file", "batch"}
+PARALLEL_DOWNLOAD_MIN_BYTES = 256 * 1024 * 1024  # attachments at least this big use multi-range download
+PARALLEL_DOWNLOAD_SEGMENTS = 4  # concurrent Range requests per large attachment; 1 disables
+HASH_ALGORITHM = "sha256"  # "sha256", "blake2b", or "blake3" / "xxh3_128" when that package is installed
+VERIFY_WORKERS = os.cpu_count() or 4  # threads re-hashing files in `python3 main.py verify`
+VERIFY_CHUNK_BYTES = 1024 * 1024
+METRICS_FILENAME = ".metrics.json"  # per-run latency / throughput summary written into the run dir
+METRICS_TEXTFILE: Optional[str] = None  # e.g. "/var/lib/node_exporter/textfile/feishu_backup.prom"; rewritten during the run
+METRICS_INTERVAL_SECONDS = 15  # how often the Prometheus textfile is rewritten
+METRICS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)  # histogram upper bounds, seconds
+TRACE_REQUESTS = False  # record every HTTP attempt (endpoint, status, DNS / connect / TLS / TTFB / body timings) for replay_trace.py
+TRACE_FILENAME = ".request_trace.jsonl"  # per-run request trace written with TRACE_REQUESTS
+API_POOL_SIZE = 16  # keep-alive connections per host for JSON API calls
+DOWNLOAD_POOL_SIZE = 8  # keep-alive connections per host for file downloads
 
 
 class FeishuApiError(Exception):
-    pass
+    # http_status / code / attempts are filled in where the API call gave up, for the failure log.
+    def __init__(
+        self,
+        message: str,
+        *,
+        http_status: Optional[int] = None,
+        code: Optional[int] = None,
+        attempts: Optional[int] = None,
+    ) -> None:
+        super().__init__(message)
+        self.http_status = http_status
+        self.code = code
+        self.attempts = attempts
 
 
 def validate_required_config() -> None:
@@ -43,30 +181,148 @@ def validate_required_config() -> None:
         raise ValueError("请在脚本顶部配置 APP_ID")
     if APP_SECRET.strip() in {"", "<YOUR_APP_SECRET>"}:
         raise ValueError("请在脚本顶部配置 APP_SECRET")
-    if not Path(TOKEN_STORE_FILE).exists():
+    if uses_default_token_store() and not Path(TOKEN_STORE_FILE).exists():
         raise ValueError("未找到 token_store.json，请先运行 get_initial_refresh_token.py 完成授权")
-    if BACKUP_SOURCE not in VALID_BACKUP_SOURCES:
-        raise ValueError(f"BACKUP_SOURCE 必须是 {sorted(VALID_BACKUP_SOURCES)} 之一")
+    names: Set[str] = set()
+    for spec in source_specs():
+        parse_source(spec.get("source", ""))
+        name = source_dir_name(spec)
+        if name in names:
+            raise ValueError(f"BACKUP_SOURCES 中的 name 重复: {name}，同一来源配置多次时请分别指定 name")
+        names.add(name)
+        token_store = spec.get("token_store")
+        if token_store and not token_store_path(token_store).exists():
+            raise ValueError(f"未找到 {token_store}，请先用 get_initial_refresh_token.py 为该账号完成授权")
+    if FSYNC_POLICY not in VALID_FSYNC_POLICIES:
+        raise ValueError(f"FSYNC_POLICY 必须是 {sorted(VALID_FSYNC_POLICIES)} 之一")
+    if EXPORT_ORDER not in VALID_EXPORT_ORDERS:
+        raise ValueError(f"EXPORT_ORDER 必须是 {sorted(VALID_EXPORT_ORDERS)} 之一")
+    if OUTPUT_FORMAT not in VALID_OUTPUT_FORMATS:
+        raise ValueError(f"OUTPUT_FORMAT 必须是 {sorted(VALID_OUTPUT_FORMATS)} 之一")
+    if OUTPUT_FORMAT == "zip" and (DEDUP_STORE or not RUN_SUBDIR_BY_DATE):
+        raise ValueError("OUTPUT_FORMAT=zip 需要 RUN_SUBDIR_BY_DATE = True，且不能与 DEDUP_STORE 同时开启")
+    new_hasher(HASH_ALGORITHM)
+
+
+def parse_source(spec: str) -> Tuple[str, str]:
+    # Returns (kind, space_id): kind is "drive" or "wiki"; "my_library" is the personal wiki space.
+    if spec == "drive":
+        return "drive", ""
+    if spec == "my_library":
+        return "wiki", MY_LIBRARY_SPACE_ID
+    if spec.startswith(WIKI_SOURCE_PREFIX) and spec[len(WIKI_SOURCE_PREFIX):].strip():
+        return "wiki", spec[len(WIKI_SOURCE_PREFIX):].strip()
+    raise ValueError(f"备份来源必须是 {sorted(VALID_BACKUP_SOURCES)} 之一或 wiki:<space_id>，当前为 {spec!r}")
+
+
+def source_specs() -> List[Dict[str, str]]:
+    # A single BACKUP_SOURCE keeps the old layout: no name, files directly under the run dir.
+    return BACKUP_SOURCES or [{"source": BACKUP_SOURCE, "name": ""}]
+
+
+def source_dir_name(spec: Dict[str, str]) -> str:
+    if "name" in spec:
+        return sanitize_filename(spec["name"]) if spec["name"] else ""
+    return sanitize_filename(spec.get("source", "").replace(WIKI_SOURCE_PREFIX, "wiki_"))
+
+
+def token_store_path(value: str) -> Path:
+    path = Path(value)
+    return path if path.is_absolute() else CODE_DIR / path
+
 
+def source_token_store(spec: Dict[str, str]) -> str:
+    # Resolved token store of a source, "" for the default TOKEN_STORE_FILE.
+    store = str(token_store_path(spec["token_store"]).resolve()) if spec.get("token_store") else ""
+    return "" if store == str(Path(TOKEN_STORE_FILE).resolve()) else store
 
-def load_refresh_token() -> str:
-    token_file = Path(TOKEN_STORE_FILE)
+
+def uses_default_token_store() -> bool:
+    return any(not source_token_store(spec) for spec in source_specs())
+
+
+def load_refresh_token(token_file: Optional[Path] = None) -> str:
+    token_file = token_file or Path(TOKEN_STORE_FILE)
     try:
         data = json.loads(token_file.read_text(encoding="utf-8"))
     except FileNotFoundError:
-        raise ValueError("未找到 token_store.json，请先运行 get_initial_refresh_token.py 完成授权")
+        raise ValueError(f"未找到 {token_file.name}，请先运行 get_initial_refresh_token.py 完成授权")
     except Exception as exc:
-        raise ValueError(f"token_store.json 解析失败，请重新运行 get_initial_refresh_token.py: {exc}")
+        raise ValueError(f"{token_file.name} 解析失败，请重新运行 get_initial_refresh_token.py: {exc}")
 
     refresh_token = str(data.get("refresh_token", "")).strip()
     if not refresh_token:
-        raise ValueError("token_store.json 中 refresh_token 为空，请重新运行 get_initial_refresh_token.py")
+        raise ValueError(f"{token_file.name} 中 refresh_token 为空，请重新运行 get_initial_refresh_token.py")
     if refresh_token.count(".") != 2:
-        raise ValueError("token_store.json 中 refresh_token 格式无效，请重新运行 get_initial_refresh_token.py")
+        raise ValueError(f"{token_file.name} 中 refresh_token 格式无效，请重新运行 get_initial_refresh_token.py")
     return refresh_token
 
 
-def refresh_user_access_token(refresh_token: str) -> Dict[str, Any]:
+# Connection setup phases (dns_ms / connect_ms / tls_ms) of the request being traced on this
+# thread. Only set while a RequestTrace is recording, and only filled when the pool has to open
+# a new connection; a reused keep-alive connection has no setup phases.
+_connect_phases = threading.local()
+
+
+class _TimedConnectionMixin:
+    def _new_conn(self) -> socket.socket:
+        phases = getattr(_connect_phases, "phases", None)
+        if phases is None:
+            return super()._new_conn()  # type: ignore[misc]
+        started = time.perf_counter()
+        try:
+            # Timed on its own; urllib3's lookup right after is normally answered from the resolver cache.
+            socket.getaddrinfo(self._dns_host, self.port, 0, socket.SOCK_STREAM)  # type: ignore[attr-defined]
+        except OSError:
+            pass  # the connect below reports it
+        resolved = time.perf_counter()
+        sock = super()._new_conn()  # type: ignore[misc]
+        phases["dns_ms"] = round((resolved - started) * 1000, 1)
+        phases["connect_ms"] = round((time.perf_counter() - resolved) * 1000, 1)
+        return sock
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    def connect(self) -> None:
+        phases = getattr(_connect_phases, "phases", None)
+        started = time.perf_counter()
+        super().connect()
+        if phases is not None and "connect_ms" in phases:
+            setup_ms = (time.perf_counter() - started) * 1000
+            phases["tls_ms"] = round(max(0.0, setup_ms - phases["dns_ms"] - phases["connect_ms"]), 1)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    # Opens connections whose DNS / TCP / TLS phases the request trace can time.
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TimedHTTPConnectionPool, "https": _TimedHTTPSConnectionPool}
+
+
+def build_http_session(pool_size: int, timed: bool = False) -> requests.Session:
+    # Session keeps connections alive between calls; the adapter sizes the per-host pool
+    # so concurrent workers reuse TLS connections instead of opening new ones.
+    session = requests.Session()
+    adapter_class = TimedHTTPAdapter if timed else HTTPAdapter
+    adapter = adapter_class(pool_connections=4, pool_maxsize=max(1, pool_size))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def refresh_user_access_token(refresh_token: str, session: Optional[requests.Session] = None) -> Dict[str, Any]:
     url = f"{BASE_URL}/authen/v2/oauth/token"
     payload = {
         "grant_type": "refresh_token",
@@ -76,10 +332,25 @@ def refresh_user_access_token(refresh_token: str) -> Dict[str, Any]:
     }
     headers = {"Content-Type": "application/json; charset=utf-8"}
 
-    try:
-        response = requests.post(url, json=payload, headers=headers, timeout=REQUEST_TIMEOUT_SECONDS)
-    except requests.RequestException as exc:
-        raise FeishuApiError(f"刷新 user_access_token 请求失败: {exc}") from exc
+    # A throttled or failed refresh is retried here, so a transient 429 / 5xx never reaches the
+    # request that is waiting for the new token.
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            response = (session or requests).post(url, json=payload, headers=headers, timeout=REQUEST_TIMEOUT_SECONDS)
+        except requests.RequestException as exc:
+            if attempt >= TOKEN_REFRESH_ATTEMPTS:
+                raise FeishuApiError(f"刷新 user_access_token 请求失败: {exc}") from exc
+            wait_seconds = attempt
+        else:
+            if response.status_code not in RETRYABLE_HTTP_STATUS or attempt >= TOKEN_REFRESH_ATTEMPTS:
+                break
+            retry_after = response.headers.get("Retry-After")
+            wait_seconds = int(retry_after) if retry_after and retry_after.isdigit() else attempt
+            response.close()
+        print(f"[WARN] user_access_token refresh failed (attempt {attempt}/{TOKEN_REFRESH_ATTEMPTS}), retry in {wait_seconds}s")
+        time.sleep(wait_seconds)
 
     if response.status_code != 200:
         raise FeishuApiError(f"刷新 user_access_token 失败: HTTP {response.status_code}, body={response.text[:200]}")
@@ -102,8 +373,8 @@ def refresh_user_access_token(refresh_token: str) -> Dict[str, Any]:
     return data
 
 
-def save_token_store(resp_json: Dict[str, Any]) -> None:
-    token_file = Path(TOKEN_STORE_FILE)
+def save_token_store(resp_json: Dict[str, Any], token_file: Optional[Path] = None) -> None:
+    token_file = token_file or Path(TOKEN_STORE_FILE)
     token_file.parent.mkdir(parents=True, exist_ok=True)
     payload = {
         "refresh_token": resp_json.get("refresh_token", ""),
@@ -111,16 +382,183 @@ def save_token_store(resp_json: Dict[str, Any]) -> None:
         "expires_in": resp_json.get("expires_in", 0),
         "updated_at": int(time.time()),
     }
-    token_file.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    # Each refresh rotates the refresh_token, so a torn write would lock us out until re-authorization.
+    temp_file = token_file.with_name(f".{token_file.name}.{os.getpid()}.tmp")
+    with open(temp_file, "w", encoding="utf-8") as handle:
+        handle.write(json.dumps(payload, ensure_ascii=False, indent=2))
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temp_file, token_file)
+
+
+class AccessTokenManager:
+    # Holds the user_access_token for a whole run and refreshes it ahead of expiry on a
+    # background thread. Refreshes are single-flight: the first thread to see a stale token
+    # calls the token endpoint while the others wait on the lock and then reuse its result.
+    def __init__(
+        self,
+        refresh_token: str = "",
+        access_token: str = "",
+        expires_in: float = 0,
+        session: Optional[requests.Session] = None,
+        margin_seconds: float = TOKEN_REFRESH_MARGIN_SECONDS,
+        retry_seconds: float = TOKEN_REFRESH_RETRY_SECONDS,
+        store_file: Optional[Path] = None,
+    ) -> None:
+        self._refresh_token = refresh_token
+        self.store_file = store_file  # None: TOKEN_STORE_FILE
+        self._access_token = access_token
+        self._session = session
+        self.margin_seconds = margin_seconds
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._expires_at = math.inf
+        self._refresh_at = math.inf
+        self._schedule(expires_in)
+        self.refreshes = 0
+
+    def _schedule(self, expires_in: float) -> None:
+        if expires_in <= 0:
+            self._expires_at = self._refresh_at = math.inf
+            return
+        now = time.time()
+        self._expires_at = now + expires_in
+        # Short-lived tokens are refreshed at half their lifetime rather than immediately.
+        self._refresh_at = now + max(expires_in - self.margin_seconds, expires_in / 2)
+
+    def expires_in(self) -> float:
+        return self._expires_at - time.time()
+
+    def token(self) -> str:
+        token = self._access_token
+        if self._refresh_token and time.time() >= self._expires_at:
+            # The background refresh is late or failing; refresh inline rather than send a dead token.
+            return self.refresh(token)
+        return token
+
+    def refresh(self, stale: str) -> str:
+        # stale is the token the caller saw expire or get rejected; if another thread has
+        # already replaced it, the newer token is returned without calling the endpoint again.
+        with self._lock:
+            if self._access_token != stale:
+                return self._access_token
+            if not self._refresh_token:
+                raise FeishuApiError("user_access_token 已失效，且没有可用的 refresh_token 进行刷新")
+            token_resp = refresh_user_access_token(self._refresh_token, session=self._session)
+            self._refresh_token = str(token_resp["refresh_token"])
+            self._access_token = str(token_resp["access_token"])
+            self._schedule(float(token_resp.get("expires_in") or 0))
+            self.refreshes += 1
+            try:
+                save_token_store(token_resp, self.store_file)
+            except OSError as exc:
+                # The old refresh_token is already revoked; the run can go on, the next one cannot.
+                print(f"[ERROR] 无法写入 {self.store_file or TOKEN_STORE_FILE}（下次运行需重新授权）: {exc}")
+            return self._access_token
+
+    def start(self) -> None:
+        if not self._refresh_token or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="token-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            wait = self._refresh_at - time.time()
+            if self._stop.wait(None if wait == math.inf else max(0.0, wait)):
+                return
+            if time.time() < self._refresh_at:
+                continue  # a worker refreshed inline in the meantime and moved the deadline
+            try:
+                self.refresh(self._access_token)
+                print(f"[INFO] user_access_token 已提前刷新，{self.expires_in():.0f}s 后过期")
+            except Exception as exc:
+                print(f"[WARN] user_access_token 后台刷新失败，{self.retry_seconds:.0f}s 后重试: {exc}")
+                self._refresh_at = time.time() + self.retry_seconds
+
+
+class QueueTokenManager(AccessTokenManager):
+    # Worker side of a distributed run. Feishu rotates the refresh_token on every refresh, so only
+    # the coordinator holds it; workers read the access token it publishes in the work queue and,
+    # when a token is rejected, ask the coordinator for a new one instead of refreshing themselves.
+    def __init__(self, queue: "WorkQueue", store: str, wait_seconds: float = WORK_LEASE_SECONDS) -> None:
+        super().__init__()
+        self.queue = queue
+        self.store = store  # token store path as published by the coordinator, "" = TOKEN_STORE_FILE
+        self.wait_seconds = wait_seconds
+        self._load()
+        if not self._access_token:
+            raise FeishuApiError(f"工作队列中没有协调进程发布的 user_access_token（{store or 'token_store.json'}）")
+
+    def _load(self) -> None:
+        published = self.queue.published_token(self.store)
+        if published is not None:
+            self._access_token, self._expires_at = published
+        self._refresh_at = time.time() + WORK_LEASE_SECONDS / 4
+
+    def token(self) -> str:
+        if time.time() >= self._refresh_at:
+            with self._lock:
+                self._load()
+        return self._access_token
 
+    def refresh(self, stale: str) -> str:
+        with self._lock:
+            self._load()
+            if self._access_token != stale:
+                return self._access_token
+            self.queue.request_token_refresh(self.store, stale)
+            deadline = time.time() + self.wait_seconds
+            while time.time() < deadline:
+                time.sleep(WORK_QUEUE_POLL_SECONDS)
+                self._load()
+                if self._access_token != stale:
+                    self.refreshes += 1
+                    return self._access_token
+            raise FeishuApiError("user_access_token 已失效，协调进程未在等待时间内发布新 token")
 
-def get_runtime_user_access_token() -> str:
+
+def get_runtime_token_manager(
+    session: Optional[requests.Session] = None,
+    store_file: Optional[Path] = None,
+) -> AccessTokenManager:
+    if store_file is None:
+        validate_required_config()
+    tokens = AccessTokenManager(load_refresh_token(store_file), session=session, store_file=store_file)
+    tokens.refresh("")
+    print(f"[INFO] user_access_token 刷新成功{f' ({store_file.name})' if store_file else ''}")
+    return tokens
+
+
+def build_sources(
+    session: requests.Session,
+) -> Tuple[List["BackupSource"], List[AccessTokenManager], AccessTokenManager]:
+    # One token manager per token store: sources of the same account share a token and its refreshes.
+    # TOKEN_STORE_FILE is only loaded when a source uses it; the run's default token is then that
+    # account's, otherwise the first source's.
     validate_required_config()
-    refresh_token = load_refresh_token()
-    token_resp = refresh_user_access_token(refresh_token)
-    save_token_store(token_resp)
-    print("[INFO] user_access_token 刷新成功")
-    return str(token_resp["access_token"])
+    managers: Dict[str, AccessTokenManager] = {}
+    sources: List[BackupSource] = []
+    for spec in source_specs():
+        kind, space_id = parse_source(spec["source"])
+        store = source_token_store(spec)
+        if store not in managers:
+            managers[store] = get_runtime_token_manager(session, Path(store) if store else None)
+        sources.append(BackupSource(source_dir_name(spec), kind, space_id, managers[store]))
+    return sources, list(managers.values()), managers.get("") or next(iter(managers.values()))
+
+
+def get_runtime_user_access_token(session: Optional[requests.Session] = None) -> str:
+    return get_runtime_token_manager(session).token()
 
 
 def sanitize_filename(name: str) -> str:
@@ -128,241 +566,2348 @@ def sanitize_filename(name: str) -> str:
     return sanitized or "untitled"
 
 
-def unique_path(path: Path) -> Path:
-    if not path.exists():
+def load_path_map(path: Path) -> Dict[str, str]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return {str(token): str(relative) for token, relative in data.items()} if isinstance(data, dict) else {}
+
+
+def save_path_map(path: Path, mapping: Dict[str, str]) -> None:
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(mapping, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+class NameAllocator:
+    # Collision-free names per directory, handed out from memory instead of probing the
+    # filesystem with exists(). A directory's registry is filled on first use from the
+    # token -> path map of earlier runs, so a document keeps its local path from run to run,
+    # and (only when the directory may hold files this run did not write) from one scandir.
+    def __init__(self, root: Path, known: Optional[Dict[str, str]] = None, scan_disk: bool = True) -> None:
+        self.root = root
+        self.scan_disk = scan_disk
+        self._known: Dict[str, str] = dict(known or {})  # token -> path relative to root
+        self._known_by_dir: Optional[Dict[Path, Dict[str, str]]] = None
+        self._owners: Dict[Path, Dict[str, str]] = {}  # directory -> name -> owning token ("" = unknown)
+        self._next_index: Dict[Tuple[Path, str], int] = {}
+        self._claimed: Set[Path] = set()
+        self._assigned: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def remember(self, known: Dict[str, str]) -> None:
+        # Adds token -> path pairs not known yet; must run before the first allocation.
+        with self._lock:
+            for token, relative in known.items():
+                self._known.setdefault(token, relative)
+            self._known_by_dir = None
+
+    def _registry(self, directory: Path) -> Dict[str, str]:
+        owners = self._owners.get(directory)
+        if owners is not None:
+            return owners
+        if self._known_by_dir is None:
+            self._known_by_dir = {}
+            for token, relative in self._known.items():
+                known_path = self.root / relative
+                self._known_by_dir.setdefault(known_path.parent, {})[known_path.name] = token
+        owners = {}
+        if self.scan_disk:
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        owners[entry.name] = ""
+            except OSError:
+                pass
+        owners.update(self._known_by_dir.get(directory, {}))
+        self._owners[directory] = owners
+        return owners
+
+    @staticmethod
+    def is_variant(name: str, wanted: str) -> bool:
+        stem, suffix = Path(wanted).stem, Path(wanted).suffix
+        return name == wanted or re.fullmatch(rf"{re.escape(stem)} \(\d+\){re.escape(suffix)}", name) is not None
+
+    def _take(self, path: Path, token: str) -> Path:
+        self._owners[path.parent][path.name] = token
+        self._claimed.add(path)
+        if token:
+            self._assigned[token] = path.relative_to(self.root).as_posix()
         return path
 
-    stem = path.stem
-    suffix = path.suffix
-    parent = path.parent
-    index = 1
-    while True:
-        candidate = parent / f"{stem} ({index}){suffix}"
-        if not candidate.exists():
-            return candidate
-        index += 1
+    def allocate(self, path: Path, token: str = "") -> Path:
+        directory, wanted = path.parent, path.name
+        with self._lock:
+            owners = self._registry(directory)
+            known = self._known.get(token) if token else None
+            if known is not None:
+                previous = self.root / known
+                if (
+                    previous.parent == directory
+                    and previous not in self._claimed
+                    and owners.get(previous.name, token) == token
+                    and self.is_variant(previous.name, wanted)
+                ):
+                    return self._take(previous, token)
 
+            stem, suffix = Path(wanted).stem, Path(wanted).suffix
+            # Every index below the hint is already taken, so runs of "Untitled" stay O(1).
+            index = self._next_index.get((directory, wanted), 0)
+            while True:
+                candidate = wanted if index == 0 else f"{stem} ({index}){suffix}"
+                if candidate not in owners:
+                    break
+                index += 1
+            self._next_index[(directory, wanted)] = index + 1
+            return self._take(directory / candidate, token)
 
-class FeishuDriveBackup:
+    def claim(self, path: Path, token: str = "") -> Path:
+        with self._lock:
+            owners = self._registry(path.parent)
+            return self._take(path, token or owners.get(path.name, ""))
+
+    def release(self, path: Path, token: str = "") -> None:
+        with self._lock:
+            self._claimed.discard(path)
+            if token and self._assigned.get(token) == path.relative_to(self.root).as_posix():
+                del self._assigned[token]
+            owners = self._owners.get(path.parent)
+            if owners is None:
+                return
+            known_owner = (self._known_by_dir or {}).get(path.parent, {}).get(path.name)
+            if known_owner is not None:
+                owners[path.name] = known_owner
+                return
+            owners.pop(path.name, None)
+            for key in [key for key in self._next_index if key[0] == path.parent]:
+                del self._next_index[key]
+
+    def mapping(self, keep_unseen: bool = False) -> Dict[str, str]:
+        # Tokens not seen this run are dropped so their names become free again, unless part
+        # of the tree could not be listed.
+        with self._lock:
+            if keep_unseen:
+                return {**self._known, **self._assigned}
+            return dict(self._assigned)
+
+
+class ExportDurationModel:
+    # Running average of export durations per (obj_type, size bucket), persisted between runs.
+    # The first poll is scheduled a little before the predicted finish, so the estimate can
+    # shrink again when exports speed up instead of only ratcheting upwards.
+    def __init__(self, path: Optional[Path], alpha: float = 0.3) -> None:
+        self.path = path
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._history: Dict[str, Dict[str, float]] = {}
+        if path is not None:
+            try:
+                self._history = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                self._history = {}
+
+    @staticmethod
+    def _key(obj_type: str, size: Optional[int]) -> str:
+        bucket = int(math.log2(size)) if size and size > 0 else -1
+        return f"{obj_type}:{bucket}"
+
+    def predict(self, obj_type: str, size: Optional[int]) -> Optional[float]:
+        with self._lock:
+            entry = self._history.get(self._key(obj_type, size)) or self._history.get(self._key(obj_type, None))
+        return entry["avg"] if entry else None
+
+    def observe(self, obj_type: str, size: Optional[int], seconds: float) -> None:
+        with self._lock:
+            for key in {self._key(obj_type, size), self._key(obj_type, None)}:
+                entry = self._history.get(key)
+                if entry is None:
+                    self._history[key] = {"avg": seconds, "count": 1}
+                else:
+                    entry["avg"] += self.alpha * (seconds - entry["avg"])
+                    entry["count"] += 1
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            payload = json.dumps(self._history, ensure_ascii=False, indent=2, sort_keys=True)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(payload, encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+
+class ExportRouteTable:
+    # Per (type, extension) outcome of export attempts for items that can also be downloaded as-is,
+    # persisted between runs. After ROUTE_DIRECT_AFTER_FAILURES rejections in a row (and no success
+    # since) a pair goes straight to direct download, saving a create + poll round trip per file.
+    # Once per reprobe_seconds one item of such a pair tries the export again, in case it now works.
     def __init__(
         self,
-        user_access_token: str,
-        output_dir: Path,
-        timeout_seconds: int = 30,
-        max_retries: int = 3,
-        poll_interval_seconds: int = 2,
-        max_export_wait_seconds: int = 600,
+        path: Optional[Path],
+        direct_after: int = ROUTE_DIRECT_AFTER_FAILURES,
+        reprobe_seconds: float = ROUTE_REPROBE_SECONDS,
+        overrides: Optional[Dict[str, str]] = None,
     ) -> None:
-        self.user_access_token = user_access_token
-        self.output_dir = output_dir
-        self.timeout_seconds = timeout_seconds
-        self.max_retries = max_retries
-        self.poll_interval_seconds = poll_interval_seconds
-        self.max_export_wait_seconds = max_export_wait_seconds
+        self.path = path
+        self.direct_after = max(1, direct_after)
+        self.reprobe_seconds = reprobe_seconds
+        self.overrides = overrides if overrides is not None else EXPORT_ROUTE_OVERRIDES
+        self._lock = threading.Lock()
+        self._routes: Dict[str, Dict[str, float]] = {}
+        if path is not None:
+            try:
+                self._routes = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                self._routes = {}
 
-        self.stats: Dict[str, int] = {
-            "folders": 0,
-            "files": 0,
-            "exported": 0,
-            "fallback_downloaded": 0,
-            "failed": 0,
-        }
-        self.failures: List[str] = []
+    @staticmethod
+    def _key(obj_type: str, name: str) -> str:
+        return f"{obj_type}:{Path(name).suffix.lower()}"
 
-    @property
-    def _headers(self) -> Dict[str, str]:
-        return {
-            "Authorization": f"Bearer {self.user_access_token}",
-            "Content-Type": "application/json; charset=utf-8",
-        }
+    def route(self, obj_type: str, name: str) -> str:
+        key = self._key(obj_type, name)
+        override = self.overrides.get(key) or self.overrides.get(obj_type)
+        if override:
+            return override
+        with self._lock:
+            entry = self._routes.get(key)
+            if entry is None or entry.get("failures", 0) < self.direct_after:
+                return "export"
+            if time.time() - entry.get("probed_at", 0) >= self.reprobe_seconds:
+                # Claimed here, so concurrent items of the same pair do not all probe.
+                entry["probed_at"] = time.time()
+                return "export"
+            return "direct"
 
-    def _request(
-        self,
-        method: str,
-        path_or_url: str,
-        *,
-        params: Optional[Dict[str, Any]] = None,
-        json_body: Optional[Dict[str, Any]] = None,
-        stream: bool = False,
-        absolute_url: bool = False,
-        include_auth: bool = True,
-    ) -> requests.Response:
-        url = path_or_url if absolute_url else f"{BASE_URL}{path_or_url}"
-        headers: Dict[str, str] = {}
-        if include_auth:
-            headers.update(self._headers)
-        elif not stream:
-            headers["Content-Type"] = "application/json; charset=utf-8"
+    def observe_export(self, obj_type: str, name: str, ok: bool) -> None:
+        with self._lock:
+            entry = self._routes.setdefault(self._key(obj_type, name), {"failures": 0, "exported": 0, "downloaded": 0})
+            entry["failures"] = 0 if ok else entry.get("failures", 0) + 1
+            entry["exported"] = entry.get("exported", 0) + int(ok)
+            entry["probed_at"] = time.time()
 
-        last_error: Optional[Exception] = None
-        for attempt in range(1, self.max_retries + 1):
-            try:
-                response = requests.request(
-                    method=method,
-                    url=url,
-                    headers=headers,
-                    params=params,
-                    json=json_body,
-                    timeout=self.timeout_seconds,
-                    stream=stream,
-                )
+    def observe_download(self, obj_type: str, name: str) -> None:
+        with self._lock:
+            entry = self._routes.setdefault(self._key(obj_type, name), {"failures": 0, "exported": 0, "downloaded": 0})
+            entry["downloaded"] = entry.get("downloaded", 0) + 1
 
-                retry_after = response.headers.get("Retry-After")
-                if response.status_code in RETRYABLE_HTTP_STATUS:
-                    if attempt < self.max_retries:
-                        sleep_seconds = int(retry_after) if retry_after and retry_after.isdigit() else attempt
-                        print(f"[WARN] HTTP {response.status_code}, retry after {sleep_seconds}s: {url}")
-                        time.sleep(sleep_seconds)
-                        continue
+    def direct_pairs(self) -> List[str]:
+        with self._lock:
+            return sorted(key for key, entry in self._routes.items() if entry.get("failures", 0) >= self.direct_after)
 
-                return response
-            except requests.RequestException as exc:
-                last_error = exc
-                if attempt < self.max_retries:
-                    wait_seconds = attempt
-                    print(f"[WARN] Request failed (attempt {attempt}/{self.max_retries}), retry in {wait_seconds}s: {url}")
-                    time.sleep(wait_seconds)
-                    continue
-                break
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            payload = json.dumps(self._routes, ensure_ascii=False, indent=2, sort_keys=True)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(payload, encoding="utf-8")
+        os.replace(tmp_path, self.path)
 
-        if last_error is not None:
-            raise FeishuApiError(f"Request failed after {self.max_retries} attempts: {url} ({last_error})")
-        raise FeishuApiError(f"Request failed after {self.max_retries} attempts: {url}")
 
-    def _request_json(
-        self,
-        method: str,
-        path: str,
-        *,
-        params: Optional[Dict[str, Any]] = None,
-        json_body: Optional[Dict[str, Any]] = None,
-    ) -> Dict[str, Any]:
-        last_response_text = ""
-        for attempt in range(1, self.max_retries + 1):
-            response = self._request(method, path, params=params, json_body=json_body, stream=False)
-            last_response_text = response.text
+class WikiNodeCache:
+    # wiki token -> (obj_token, obj_type, obj_edit_time). An in-process LRU sits in front of a
+    # JSON file whose entries expire after ttl_seconds; concurrent lookups of the same token
+    # share one get_node call. The cached edit time is what incremental mode compares, so the
+    # TTL also bounds how late an edit behind a shortcut can be noticed.
+    def __init__(self, path: Optional[Path], ttl_seconds: float, capacity: int) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.capacity = max(1, capacity)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[str, Tuple[str, str, str]]" = OrderedDict()
+        self._pending: Dict[str, "Future[Tuple[str, str, str]]"] = {}
+        self._disk: Dict[str, Dict[str, Any]] = {}
+        if path is not None:
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+                if isinstance(data, dict):
+                    self._disk = data
+            except (OSError, ValueError):
+                self._disk = {}
 
+    def _fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - float(entry.get("resolved_at") or 0) <= self.ttl_seconds
+
+    def get(self, token: str, resolve: Callable[[str], Tuple[str, str, str]]) -> Tuple[str, str, str]:
+        with self._lock:
+            cached = self._lru.get(token)
+            if cached is None:
+                entry = self._disk.get(token)
+                if entry is not None and self._fresh(entry):
+                    cached = (entry["obj_token"], entry["obj_type"], entry.get("obj_edit_time", ""))
+                    self._remember(token, cached)
+            if cached is not None:
+                self._lru.move_to_end(token)
+                self.hits += 1
+                return cached
+            pending = self._pending.get(token)
+            owner = pending is None
+            if owner:
+                pending = self._pending[token] = Future()
+                self.misses += 1
+        if owner:
             try:
-                payload = response.json()
-            except ValueError:
-                payload = {"code": -1, "msg": f"Non-JSON response: {response.text[:200]}"}
+                resolved = resolve(token)
+            except Exception as exc:
+                with self._lock:
+                    del self._pending[token]
+                pending.set_exception(exc)
+                raise
+            with self._lock:
+                self._remember(token, resolved)
+                self._disk[token] = {
+                    "obj_token": resolved[0],
+                    "obj_type": resolved[1],
+                    "obj_edit_time": resolved[2],
+                    "resolved_at": int(time.time()),
+                }
+                del self._pending[token]
+            pending.set_result(resolved)
+            return resolved
+        return pending.result()
 
-            code = payload.get("code", 0)
-            retriable = response.status_code in RETRYABLE_HTTP_STATUS or code in RETRYABLE_API_CODES
-            if response.status_code < 400 and code == 0:
-                return payload
+    def peek(self, token: str) -> Optional[Tuple[str, str, str]]:
+        # Cached resolution without resolving or counting a hit; used for scheduling estimates.
+        with self._lock:
+            cached = self._lru.get(token)
+            if cached is None:
+                entry = self._disk.get(token)
+                if entry is not None and self._fresh(entry):
+                    cached = (entry["obj_token"], entry["obj_type"], entry.get("obj_edit_time", ""))
+            return cached
 
-            message = payload.get("msg") or f"HTTP {response.status_code}"
-            if retriable and attempt < self.max_retries:
-                wait_seconds = attempt
-                print(f"[WARN] API failed (code={code}, attempt {attempt}/{self.max_retries}), retry in {wait_seconds}s: {message}")
-                time.sleep(wait_seconds)
-                continue
+    def _remember(self, token: str, value: Tuple[str, str, str]) -> None:
+        self._lru[token] = value
+        self._lru.move_to_end(token)
+        while len(self._lru) > self.capacity:
+            self._lru.popitem(last=False)
 
-            raise FeishuApiError(f"API request failed: {message} (code={code}, http={response.status_code})")
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            payload = {token: entry for token, entry in self._disk.items() if self._fresh(entry)}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.path)
 
-        raise FeishuApiError(f"API request failed with no response payload: {last_response_text[:200]}")
 
-    def _request_binary(
-        self,
-        method: str,
-        path_or_url: str,
-        *,
-        params: Optional[Dict[str, Any]] = None,
-        absolute_url: bool = False,
-        include_auth: bool = True,
-    ) -> requests.Response:
-        response = self._request(
-            method,
-            path_or_url,
-            params=params,
-            stream=True,
-            absolute_url=absolute_url,
-            include_auth=include_auth,
-        )
+class TokenBucket:
+    def __init__(self, rate: float, max_rate: float, min_rate: float, increase: float, decrease: float) -> None:
+        self.rate = rate
+        self.max_rate = max(max_rate, rate)
+        self.min_rate = min(min_rate, rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.throttled = 0
+        self._tokens = 1.0
+        self._updated_at = time.monotonic()
+        self._last_cut_at = 0.0
 
-        if response.status_code >= 400:
-            preview = response.text[:200] if response.text else ""
-            raise FeishuApiError(
-                f"Binary download failed: http={response.status_code}, body={preview}"
+    def _refill(self, now: float) -> None:
+        # Allow at most one second of burst.
+        self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_take(self, now: float) -> float:
+        self._refill(now)
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return 0.0
+        return (1.0 - self._tokens) / self.rate
+
+    def on_success(self) -> None:
+        # Additive increase: spread over the requests of one second, so a clean second adds `increase`.
+        self.rate = min(self.max_rate, self.rate + self.increase / max(self.rate, 1.0))
+
+    def on_throttle(self, now: float) -> None:
+        self.throttled += 1
+        # One burst of 429s from requests already in flight should count as a single signal.
+        if now - self._last_cut_at < 1.0 / self.rate:
+            return
+        self._last_cut_at = now
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self._tokens = min(self._tokens, 0.0)
+
+
+class AdaptiveRateLimiter:
+    # AIMD token buckets shared by every worker, one per endpoint family, plus a global pause
+    # so a Retry-After from any endpoint holds back all of them.
+    def __init__(self, limits: Dict[str, Dict[str, float]]) -> None:
+        self._lock = threading.Lock()
+        self._buckets = {
+            family: TokenBucket(
+                rate=float(config["initial"]),
+                max_rate=float(config.get("max", config["initial"])),
+                min_rate=RATE_LIMIT_MIN,
+                increase=RATE_LIMIT_INCREASE,
+                decrease=RATE_LIMIT_DECREASE,
             )
-        return response
+            for family, config in limits.items()
+        }
+        self._paused_until = 0.0
 
-    def list_folder_files(
-        self,
-        folder_token: Optional[str],
-        page_token: Optional[str],
-    ) -> Tuple[List[Dict[str, Any]], bool, Optional[str]]:
-        params: Dict[str, Any] = {"page_size": 200}
-        if folder_token:
-            params["folder_token"] = folder_token
-        if page_token:
-            params["page_token"] = page_token
+    def acquire(self, family: str) -> None:
+        bucket = self._buckets.get(family)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if bucket is None:
+                        return
+                    wait = bucket.try_take(now)
+                    if wait <= 0:
+                        return
+            time.sleep(wait)
 
-        payload = self._request_json("GET", "/drive/v1/files", params=params)
-        data = payload.get("data", {})
-        files = data.get("files", [])
-        has_more = bool(data.get("has_more", False))
-        next_page_token = data.get("next_page_token") or data.get("page_token")
-        return files, has_more, next_page_token
+    def on_success(self, family: str) -> None:
+        bucket = self._buckets.get(family)
+        if bucket is None:
+            return
+        with self._lock:
+            bucket.on_success()
 
-    def iter_folder_files(self, folder_token: Optional[str]) -> Iterator[Dict[str, Any]]:
-        def fetch_page(page_token: Optional[str]) -> Tuple[List[Dict[str, Any]], bool, Optional[str]]:
-            return self.list_folder_files(folder_token, page_token)
+    def on_throttle(self, family: str, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._buckets.get(family)
+            if bucket is not None:
+                bucket.on_throttle(now)
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
 
-        yield from self._iter_paginated(
-            fetch_page=fetch_page,
-            missing_token_warn="[WARN] has_more=true but no next page token returned, stopping pagination to avoid infinite loop",
-        )
+    def snapshot(self) -> Dict[str, Tuple[float, int]]:
+        with self._lock:
+            return {family: (bucket.rate, bucket.throttled) for family, bucket in self._buckets.items()}
 
-    def list_my_library_nodes(
-        self,
-        parent_node_token: Optional[str],
-        page_token: Optional[str],
-    ) -> Tuple[List[Dict[str, Any]], bool, Optional[str]]:
-        params: Dict[str, Any] = {"page_size": 50}
-        if parent_node_token:
-            params["parent_node_token"] = parent_node_token
-        if page_token:
-            params["page_token"] = page_token
 
-        payload = self._request_json(
-            "GET",
-            f"/wiki/v2/spaces/{MY_LIBRARY_SPACE_ID}/nodes",
-            params=params,
-        )
-        data = payload.get("data", {})
-        items = data.get("items", [])
-        has_more = bool(data.get("has_more", False))
-        next_page_token = data.get("page_token")
-        return items, has_more, next_page_token
+class Metrics:
+    # Counters, gauges and fixed-bucket latency histograms for one run. snapshot() is the JSON
+    # summary; render_prometheus() is the text format read by node_exporter's textfile collector.
+    def __init__(self, prefix: str = "feishu_backup", buckets: Iterable[float] = METRICS_BUCKETS) -> None:
+        self.prefix = prefix
+        self.buckets = tuple(sorted(buckets))
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        # [per-bucket counts (last one is +Inf), sum, count, max]
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[Any]] = {}
+        self._gauges: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Callable[[], float]] = {}
+        self._stop = threading.Event()
+        self._writer: Optional[threading.Thread] = None
 
-    def iter_my_library_nodes(self, parent_node_token: Optional[str]) -> Iterator[Dict[str, Any]]:
-        def fetch_page(page_token: Optional[str]) -> Tuple[List[Dict[str, Any]], bool, Optional[str]]:
-            return self.list_my_library_nodes(parent_node_token, page_token)
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
 
-        yield from self._iter_paginated(
-            fetch_page=fetch_page,
-            missing_token_warn="[WARN] has_more=true but no page token returned, stopping pagination to avoid infinite loop",
-        )
+    def incr(self, name: str, amount: float = 1, **labels: Any) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
 
-    def _iter_paginated(
-        self,
-        fetch_page: Callable[[Optional[str]], Tuple[List[Dict[str, Any]], bool, Optional[str]]],
-        missing_token_warn: str,
-    ) -> Iterator[Dict[str, Any]]:
-        page_token: Optional[str] = None
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        key = self._key(name, labels)
+        index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0, 0.0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+            histogram[3] = max(histogram[3], seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started_at, **labels)
+
+    def gauge(self, name: str, read: Callable[[], float], **labels: Any) -> None:
+        with self._lock:
+            self._gauges[self._key(name, labels)] = read
+
+    def _quantile(self, histogram: List[Any], q: float) -> float:
+        # Linear interpolation inside the bucket holding the q-th observation, as histogram_quantile()
+        # does, capped by the largest observation seen.
+        rank = q * histogram[2]
+        seen = 0
+        lower = 0.0
+        for bound, hits in zip(self.buckets, histogram[0]):
+            if hits and seen + hits >= rank:
+                return min(lower + (bound - lower) * (rank - seen) / hits, histogram[3])
+            seen += hits
+            lower = bound
+        return histogram[3]
+
+    @staticmethod
+    def _series(name: str, labels: Tuple[Tuple[str, str], ...]) -> str:
+        if not labels:
+            return name
+        rendered = ",".join(f'{label}="{value}"' for label, value in labels)
+        return f"{name}{{{rendered}}}"
+
+    def _read_gauges(self) -> Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float]:
+        with self._lock:
+            gauges = list(self._gauges.items())
+        values = {}
+        for key, read in gauges:
+            try:
+                values[key] = float(read())
+            except Exception:
+                continue
+        return values
+
+    def counter(self, name: str, **labels: Any) -> float:
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+
+    def counters(self, name: str) -> Dict[Tuple[Tuple[str, str], ...], float]:
+        with self._lock:
+            return {labels: value for (counter, labels), value in self._counters.items() if counter == name}
+
+    def histograms(self, name: str) -> Dict[Tuple[Tuple[str, str], ...], Dict[str, float]]:
+        with self._lock:
+            selected = {labels: [list(h[0]), h[1], h[2], h[3]] for (hist, labels), h in self._histograms.items() if hist == name}
+        summary = {}
+        for labels, histogram in selected.items():
+            _, total, count, largest = histogram
+            summary[labels] = {
+                "count": count,
+                "sum": round(total, 3),
+                "avg": round(total / count, 3) if count else 0.0,
+                "p50": round(self._quantile(histogram, 0.5), 3),
+                "p95": round(self._quantile(histogram, 0.95), 3),
+                "max": round(largest, 3),
+            }
+        return summary
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            names = sorted({name for name, _ in self._histograms})
+        return {
+            "started_at": int(self.started_at),
+            "elapsed_seconds": round(time.time() - self.started_at, 3),
+            "counters": {self._series(name, labels): value for (name, labels), value in sorted(counters.items())},
+            "gauges": {self._series(name, labels): value for (name, labels), value in sorted(self._read_gauges().items())},
+            "histograms": {
+                self._series(name, labels): summary
+                for name in names
+                for labels, summary in sorted(self.histograms(name).items())
+            },
+        }
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h[0]), h[1], h[2])) for key, h in self._histograms.items())
+        gauges = sorted(self._read_gauges().items())
+        lines: List[str] = []
+        typed: Set[str] = set()
+
+        def declare(name: str, kind: str) -> str:
+            full = f"{self.prefix}_{name}"
+            if full not in typed:
+                typed.add(full)
+                lines.append(f"# TYPE {full} {kind}")
+            return full
+
+        for (name, labels), value in counters:
+            lines.append(f"{self._series(declare(name, 'counter'), labels)} {value:g}")
+        for (name, labels), value in gauges:
+            lines.append(f"{self._series(declare(name, 'gauge'), labels)} {value:g}")
+        for (name, labels), (hits, total, count) in histograms:
+            full = declare(name, "histogram")
+            cumulative = 0
+            for bound, bucket_hits in zip(self.buckets + (math.inf,), hits):
+                cumulative += bucket_hits
+                le = "+Inf" if bound == math.inf else f"{bound:g}"
+                lines.append(f"{self._series(full + '_bucket', labels + (('le', le),))} {cumulative}")
+            lines.append(f"{self._series(full + '_sum', labels)} {total:.6f}")
+            lines.append(f"{self._series(full + '_count', labels)} {count}")
+        declare("start_time_seconds", "gauge")
+        lines.append(f"{self.prefix}_start_time_seconds {self.started_at:.0f}")
+        declare("last_update_time_seconds", "gauge")
+        lines.append(f"{self.prefix}_last_update_time_seconds {time.time():.0f}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: Path) -> None:
+        # node_exporter may read at any moment, so never expose a half-written file.
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        temp_path.write_text(self.render_prometheus(), encoding="utf-8")
+        os.replace(temp_path, path)
+
+    def write_json(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{path.name}.tmp")
+        temp_path.write_text(json.dumps(self.snapshot(), ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(temp_path, path)
+
+    def start_textfile(self, path: Path, interval_seconds: float) -> None:
+        def loop() -> None:
+            while not self._stop.wait(interval_seconds):
+                try:
+                    self.write_textfile(path)
+                except OSError as exc:
+                    print(f"[WARN] Cannot write metrics textfile {path}: {exc}")
+
+        self._stop.clear()
+        self.write_textfile(path)
+        self._writer = threading.Thread(target=loop, name="metrics-writer", daemon=True)
+        self._writer.start()
+
+    def stop_textfile(self, path: Path) -> None:
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        self.write_textfile(path)
+
+
+def reflink(source: Path, target: Path) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    ficlone = 0x40049409  # FICLONE, supported by btrfs/xfs/bcachefs on Linux
+    try:
+        with open(source, "rb") as src, open(target, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), ficlone, src.fileno())
+        return True
+    except OSError:
+        target.unlink(missing_ok=True)
+        return False
+
+
+def link_or_copy(source: Path, target: Path) -> None:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # Never write through an existing path: it may itself be a hardlink into older snapshots.
+    target.unlink(missing_ok=True)
+    try:
+        os.link(source, target)
+        return
+    except OSError:
+        # Hardlinks fail across filesystems, on some network shares, or once an inode hits
+        # the filesystem link limit; try a reflink before falling back to a full copy.
+        pass
+    if not reflink(source, target):
+        shutil.copy2(source, target)
+
+
+def new_hasher(algorithm: str) -> Any:
+    # hashlib, blake3 and xxhash all release the GIL while hashing large buffers, so hashing
+    # threads scale across cores.
+    if algorithm == "blake3":
+        if blake3 is None:
+            raise ValueError("HASH_ALGORITHM=blake3 需要先安装 blake3：pip install blake3")
+        return blake3.blake3()
+    if algorithm == "xxh3_128":
+        if xxhash is None:
+            raise ValueError("HASH_ALGORITHM=xxh3_128 需要先安装 xxhash：pip install xxhash")
+        return xxhash.xxh3_128()
+    if algorithm in {"sha256", "blake2b"}:
+        return hashlib.new(algorithm)
+    raise ValueError(f"不支持的 HASH_ALGORITHM: {algorithm}")
+
+
+def manifest_digest(entry: Dict[str, Any]) -> Tuple[str, str]:
+    # Manifests written before HASH_ALGORITHM existed only carry a "sha256" field.
+    if "digest" in entry:
+        return str(entry.get("hash_algorithm") or "sha256"), str(entry["digest"])
+    return "sha256", str(entry.get("sha256") or "")
+
+
+class ObjectStore:
+    # Content-addressed store of file bodies: <root>/<digest[:2]>/<digest[2:]>. Run dirs only
+    # hold hardlinks, so an object whose link count drops to 1 is referenced by no snapshot.
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.tmp_dir = root / "tmp"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def temp_path(self, key: Optional[str] = None) -> Path:
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest() if key else uuid.uuid4().hex
+        return self.tmp_dir / name
+
+    def object_path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:]
+
+    def commit(self, temp_path: Path, digest: str, target: Path) -> None:
+        object_path = self.object_path(digest)
+        with self._lock:
+            if object_path.exists():
+                temp_path.unlink(missing_ok=True)
+            else:
+                object_path.parent.mkdir(parents=True, exist_ok=True)
+                # Objects are shared by every snapshot that links them; keep them read-only.
+                os.chmod(temp_path, 0o444)
+                os.replace(temp_path, object_path)
+        link_or_copy(object_path, target)
+
+    def iter_objects(self) -> Iterator[Path]:
+        for shard in self.root.iterdir():
+            if shard.is_dir() and len(shard.name) == 2:
+                yield from (path for path in shard.iterdir() if path.is_file())
+
+
+def prune_snapshots(output_root: Path, keep: int) -> Tuple[int, int, int]:
+    latest = read_latest_run_dir(output_root)
+    snapshots = sorted(
+        path for path in output_root.iterdir() if path.is_dir() and RUN_DIR_PATTERN.match(path.name)
+    )
+    expired = snapshots[:-keep] if keep > 0 else snapshots
+    removed_snapshots = 0
+    for snapshot in expired:
+        if latest is not None and snapshot.resolve() == latest.resolve():
+            continue
+        print(f"[INFO] Remove snapshot: {snapshot}")
+        shutil.rmtree(snapshot)
+        removed_snapshots += 1
+
+    removed_objects = 0
+    freed_bytes = 0
+    store_root = output_root / OBJECT_STORE_DIRNAME
+    if store_root.is_dir():
+        store = ObjectStore(store_root)
+        for object_path in store.iter_objects():
+            stat = object_path.stat()
+            if stat.st_nlink > 1:
+                continue
+            object_path.unlink()
+            removed_objects += 1
+            freed_bytes += stat.st_size
+        # Leftovers from runs that died mid-download.
+        for temp_path in store.tmp_dir.iterdir():
+            if time.time() - temp_path.stat().st_mtime > 86400:
+                temp_path.unlink(missing_ok=True)
+    return removed_snapshots, removed_objects, freed_bytes
+
+
+def read_latest_run_dir(output_root: Path) -> Optional[Path]:
+    pointer = output_root / LATEST_RUN_POINTER
+    try:
+        data = json.loads(pointer.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    run_dir = data.get("run_dir")
+    if not run_dir:
+        return None
+    return output_root / run_dir
+
+
+def write_latest_run_dir(output_root: Path, run_dir: Path) -> None:
+    pointer = output_root / LATEST_RUN_POINTER
+    payload = {
+        "run_dir": os.path.relpath(run_dir, output_root),
+        "updated_at": int(time.time()),
+    }
+    tmp_pointer = pointer.with_name(pointer.name + ".tmp")
+    tmp_pointer.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_pointer, pointer)
+
+
+class BackupManifest:
+    # Append-only JSONL of saved files, one object per line and keyed by the listing token.
+    # Lines are flushed as they are written so a crashed run still leaves a usable manifest.
+    def __init__(self, path: Path, append: bool = False) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._handle = open(path, "a" if append else "w", encoding="utf-8")
+
+    @staticmethod
+    def load(path: Path) -> Dict[str, Dict[str, Any]]:
+        entries: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as handle:
+                for line in handle:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get("token"):
+                        entries[entry["token"]] = entry
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._handle.write(line + "\n")
+            self._handle.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._handle.close()
+
+
+class FailureLog(BackupManifest):
+    # Same append-and-flush JSONL as the manifest, one record per failed file, node or listing,
+    # so the list survives a crash and `python3 main.py retry-failed` can read it back.
+    @staticmethod
+    def read(path: Path) -> List[Dict[str, Any]]:
+        records: List[Dict[str, Any]] = []
+        try:
+            with open(path, "r", encoding="utf-8") as handle:
+                for line in handle:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return records
+
+
+class RequestTrace:
+    # Compact JSONL of every HTTP attempt made through FeishuDriveBackup._request, one object per
+    # attempt, so a slow production run can be profiled and re-driven offline by replay_trace.py.
+    # "at" is seconds since the trace started; timings are milliseconds. The Authorization header
+    # is never written, but paths, params and bodies carry document tokens: keep traces private.
+    # Unlike the manifest it is not flushed per line; a busy run makes thousands of calls a minute.
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._handle = open(path, "w", encoding="utf-8")
+        self._write({"trace": 1, "started_at": round(time.time(), 3), "base_url": BASE_URL})
+
+    def now(self) -> float:
+        return round(time.monotonic() - self._started, 4)
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        self._handle.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._write({key: value for key, value in entry.items() if value is not None and value != {}})
+
+    def close(self) -> None:
+        with self._lock:
+            self._handle.close()
+
+    @staticmethod
+    def read(path: Path) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        # (header, records); records are in completion order, sort by "at" for issue order.
+        header: Dict[str, Any] = {}
+        records: List[Dict[str, Any]] = []
+        with open(path, "r", encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if "trace" in entry:
+                    header = entry
+                else:
+                    records.append(entry)
+        records.sort(key=lambda entry: entry.get("at", 0))
+        return header, records
+
+
+class ArchiveWriter:
+    # Rolling zip volumes <run dir>/<ARCHIVE_BASENAME>.NNN.zip written straight from the network.
+    # Members are appended one at a time under a lock. Each finished member is also appended to
+    # a JSONL index (volume, local header offset, sizes, crc), so a single document can be
+    # fetched from an off-site copy with one range read, and volumes an interrupted run never
+    # closed can be told apart on resume.
+    def __init__(self, run_dir: Path, volume_bytes: int) -> None:
+        self.run_dir = run_dir
+        self.volume_bytes = volume_bytes
+        self.index_path = run_dir / ARCHIVE_INDEX_FILENAME
+        self.volumes = 0
+        self._lock = threading.Lock()
+        self._next_volume = 0
+        self._volume_name = ""
+        self._volume_handle: Optional[BinaryIO] = None
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._index: Optional[IO[str]] = None
+
+    @staticmethod
+    def volume_number(path: Path) -> int:
+        return int(path.name[len(ARCHIVE_BASENAME) + 1 : -len(".zip")])
+
+    @staticmethod
+    def read_index(run_dir: Path) -> List[Dict[str, Any]]:
+        entries: List[Dict[str, Any]] = []
+        try:
+            with open(run_dir / ARCHIVE_INDEX_FILENAME, "r", encoding="utf-8") as handle:
+                for line in handle:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def open(self, resuming: bool) -> Set[str]:
+        # Returns the listing tokens of members lost with volumes that were never closed; those
+        # volumes are deleted and the caller has to write their members again.
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        kept: List[Dict[str, Any]] = []
+        dropped: List[Dict[str, Any]] = []
+        if resuming:
+            volumes = sorted(self.run_dir.glob(f"{ARCHIVE_BASENAME}.*.zip"))
+            broken = {path.name for path in volumes if not zipfile.is_zipfile(path)}
+            for entry in self.read_index(self.run_dir):
+                (dropped if entry.get("volume") in broken else kept).append(entry)
+            for path in volumes:
+                if path.name in broken:
+                    print(f"[WARN] Discard unfinished archive volume: {path}")
+                    path.unlink()
+                else:
+                    self._next_volume = max(self._next_volume, self.volume_number(path) + 1)
+                    self.volumes += 1
+        tmp_index = self.index_path.with_name(self.index_path.name + ".tmp")
+        with open(tmp_index, "w", encoding="utf-8") as handle:
+            for entry in kept:
+                handle.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        os.replace(tmp_index, self.index_path)
+        self._index = open(self.index_path, "a", encoding="utf-8")
+        return {entry.get("token", "") for entry in dropped} - {entry.get("token", "") for entry in kept}
+
+    def _current_zip(self) -> zipfile.ZipFile:
+        if self._zip is not None and self._volume_handle is not None:
+            if self._volume_handle.tell() < self.volume_bytes:
+                return self._zip
+            self._close_volume()
+        self._volume_name = f"{ARCHIVE_BASENAME}.{self._next_volume:03d}.zip"
+        self._next_volume += 1
+        self.volumes += 1
+        self._volume_handle = open(self.run_dir / self._volume_name, "wb")
+        self._zip = zipfile.ZipFile(self._volume_handle, "w", allowZip64=True)
+        return self._zip
+
+    def _close_volume(self) -> None:
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+        if self._volume_handle is not None:
+            if FSYNC_POLICY != "none":
+                # Volumes are closed only between members, so each closed volume is a durable batch.
+                self._volume_handle.flush()
+                os.fsync(self._volume_handle.fileno())
+            self._volume_handle.close()
+            self._volume_handle = None
+
+    @contextlib.contextmanager
+    def member(self, name: str, compress: bool, token: str = "") -> Iterator[IO[bytes]]:
+        with self._lock:
+            archive = self._current_zip()
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            info.external_attr = 0o644 << 16
+            handle = archive.open(info, "w", force_zip64=True)
+            try:
+                yield handle
+            except BaseException:
+                handle.close()
+                # The bytes stay in the volume, but the broken member is left out of its directory.
+                archive.filelist.remove(info)
+                archive.NameToInfo.pop(name, None)
+                raise
+            handle.close()
+            assert self._index is not None
+            entry = {
+                "path": name,
+                "token": token,
+                "volume": self._volume_name,
+                "header_offset": info.header_offset,
+                "size": info.file_size,
+                "compress_size": info.compress_size,
+                "compression": "deflated" if compress else "stored",
+                "crc32": info.CRC,
+            }
+            self._index.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+            self._index.flush()
+
+    def add(self, name: str, data: bytes, compress: bool, token: str = "") -> None:
+        with self.member(name, compress, token) as handle:
+            handle.write(data)
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_volume()
+            if self._index is not None:
+                self._index.close()
+                self._index = None
+
+
+class ArchiveReader:
+    # Members of a finished zip-format run. Volumes are opened on first use and shared between
+    # threads; zipfile serializes the seeks on a shared volume itself.
+    def __init__(self, run_dir: Path) -> None:
+        self.run_dir = run_dir
+        self.index = {entry["path"]: entry for entry in ArchiveWriter.read_index(run_dir) if entry.get("path")}
+        self._volumes: Dict[str, zipfile.ZipFile] = {}
+        self._lock = threading.Lock()
+
+    def open(self, name: str) -> Optional[IO[bytes]]:
+        entry = self.index.get(name)
+        if entry is None:
+            return None
+        with self._lock:
+            volume = self._volumes.get(entry["volume"])
+            if volume is None:
+                volume = self._volumes[entry["volume"]] = zipfile.ZipFile(self.run_dir / entry["volume"])
+        return volume.open(name)
+
+    def close(self) -> None:
+        with self._lock:
+            for volume in self._volumes.values():
+                volume.close()
+            self._volumes.clear()
+
+
+@dataclass
+class BackupSource:
+    name: str  # sub-directory of the run dir; "" writes straight into it (single-source layout)
+    kind: str  # "drive" or "wiki"
+    space_id: str = ""
+    tokens: Optional["AccessTokenManager"] = None  # None: the backup's default token
+
+    @property
+    def key_prefix(self) -> str:
+        # Journal / listing-index keys; root containers of different sources must not collide.
+        return f"{self.name}/" if self.name else ""
+
+
+@dataclass
+class TraversalEntry:
+    kind: str  # "file", "folder" or "library"
+    token: str
+    info: Dict[str, Any]
+    local_dir: Path
+    id: Optional[int] = None
+    status: str = "pending"
+    source: str = ""  # BackupSource.name; children inherit it from their container
+    lease_id: Optional[int] = None  # distributed runs: the work-queue lease the entry was listed under
+
+
+class RunJournal:
+    # SQLite journal under the run dir. Each listed page is committed together with its
+    # entries and the cursor of the next page, so a resumed run replays what it already
+    # knows, skips finished items and continues listing from the saved cursor.
+    def __init__(self, path: Path, run_dir: Path) -> None:
+        self.path = path
+        self.run_dir = run_dir
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS containers ("
+                "key TEXT PRIMARY KEY, cursor TEXT, listed INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, parent TEXT NOT NULL, kind TEXT NOT NULL, "
+                "token TEXT, info TEXT NOT NULL, local_dir TEXT NOT NULL, target TEXT, "
+                "status TEXT NOT NULL DEFAULT 'pending')"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent, id)")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def container(self, key: str) -> Tuple[Optional[str], bool]:
+        with self._lock:
+            row = self._conn.execute("SELECT cursor, listed FROM containers WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None, False
+        return row[0], bool(row[1])
+
+    def entries(self, parent: str, source: str = "") -> List[TraversalEntry]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, kind, token, info, local_dir, status FROM entries WHERE parent = ? ORDER BY id",
+                (parent,),
+            ).fetchall()
+        return [
+            TraversalEntry(
+                kind=kind,
+                token=token or "",
+                info=json.loads(info),
+                local_dir=self.run_dir / local_dir,
+                id=entry_id,
+                status=status,
+                source=source,
+            )
+            for entry_id, kind, token, info, local_dir, status in rows
+        ]
+
+    def record_page(self, parent: str, entries: List[TraversalEntry], next_cursor: Optional[str]) -> None:
+        with self._lock, self._conn:
+            for entry in entries:
+                cursor = self._conn.execute(
+                    "INSERT INTO entries (parent, kind, token, info, local_dir, status) VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        parent,
+                        entry.kind,
+                        entry.token,
+                        json.dumps(entry.info, ensure_ascii=False),
+                        entry.local_dir.relative_to(self.run_dir).as_posix(),
+                        entry.status,
+                    ),
+                )
+                entry.id = cursor.lastrowid
+            self._conn.execute(
+                "INSERT OR REPLACE INTO containers (key, cursor, listed) VALUES (?, ?, ?)",
+                (parent, next_cursor, 0 if next_cursor else 1),
+            )
+
+    def mark(self, entry_id: int, status: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE entries SET status = ? WHERE id = ?", (status, entry_id))
+
+    def target(self, entry_id: int) -> Optional[Path]:
+        with self._lock:
+            row = self._conn.execute("SELECT target FROM entries WHERE id = ?", (entry_id,)).fetchone()
+        return self.run_dir / row[0] if row and row[0] else None
+
+    def set_target(self, entry_id: int, path: Path) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE entries SET target = ? WHERE id = ?",
+                (path.relative_to(self.run_dir).as_posix(), entry_id),
+            )
+
+    def reserved_paths(self) -> List[Tuple[Path, str]]:
+        # Every output path handed out so far, with its token: file targets and the
+        # directories of sub-containers.
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT target, token FROM entries WHERE target IS NOT NULL "
+                "UNION ALL SELECT local_dir, token FROM entries WHERE kind != 'file'"
+            ).fetchall()
+        return [(self.run_dir / row[0], row[1] or "") for row in rows]
+
+    def reopen_tokens(self, tokens: Iterable[str]) -> int:
+        reopened = 0
+        with self._lock, self._conn:
+            for token in tokens:
+                cursor = self._conn.execute(
+                    "UPDATE entries SET status = 'pending' WHERE kind = 'file' AND status = 'done' AND token = ?",
+                    (token,),
+                )
+                reopened += cursor.rowcount
+        return reopened
+
+    @staticmethod
+    def remove(path: Path) -> None:
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+
+class ListingIndex:
+    # Raw items of every fully listed folder / library node, keyed like the run journal's
+    # containers. A cached listing is reused while it is younger than ttl_seconds and the
+    # container's own modified time, as seen in its parent's listing, has not changed; any
+    # other container is listed again, so a refresh only walks the stale subtrees.
+    def __init__(self, path: Path, ttl_seconds: float) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS containers ("
+                "key TEXT PRIMARY KEY, signature TEXT NOT NULL, listed_at REAL NOT NULL, items TEXT NOT NULL)"
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def lookup(self, key: str, signature: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT signature, listed_at, items FROM containers WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl_seconds:
+            return None
+        if signature and row[0] != signature:
+            return None
+        return json.loads(row[2])
+
+    def store(self, key: str, signature: str, items: List[Dict[str, Any]]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO containers (key, signature, listed_at, items) VALUES (?, ?, ?, ?)",
+                (key, signature, time.time(), json.dumps(items, ensure_ascii=False)),
+            )
+
+
+class WorkQueue:
+    # Lease queue of a distributed run, one row per folder / library node, shared by the coordinator
+    # and every worker through a SQLite file on shared storage. A worker leases a container, lists
+    # it, adds the sub-containers it finds and completes the lease once every file listed in it has
+    # finished. Live workers keep renewing their leases; an expired lease goes back to the pool, so
+    # the containers of a dead worker are listed and processed again by another one.
+    def __init__(self, path: Path, create: bool = False) -> None:
+        if not create and not path.exists():
+            raise ValueError(f"未找到工作队列 {path}，请先启动 coordinator")
+        self.path = path
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit; statements that must see and change rows together take the write lock up front.
+        self._conn = sqlite3.connect(
+            str(path), timeout=WORK_QUEUE_BUSY_SECONDS, isolation_level=None, check_same_thread=False
+        )
+        # WAL needs memory shared between the processes, which network filesystems cannot provide.
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        with self._transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL UNIQUE, kind TEXT NOT NULL, "
+                "token TEXT, source TEXT NOT NULL, info TEXT NOT NULL, local_dir TEXT NOT NULL, "
+                "status TEXT NOT NULL DEFAULT 'pending', owner TEXT, expires_at REAL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, error TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS leases_status ON leases (status, id)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS workers ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, seen_at REAL NOT NULL, "
+                "files INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0)"
+            )
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def add(self, containers: List[Tuple[str, TraversalEntry]], run_dir: Path) -> None:
+        # Keyed like the run journal's containers; a container listed again after its lease
+        # expired finds its sub-containers already queued and keeps their directories.
+        if not containers:
+            return
+        with self._transaction() as conn:
+            for key, entry in containers:
+                conn.execute(
+                    "INSERT OR IGNORE INTO leases (key, kind, token, source, info, local_dir) VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        key,
+                        entry.kind,
+                        entry.token,
+                        entry.source,
+                        json.dumps(entry.info, ensure_ascii=False),
+                        entry.local_dir.relative_to(run_dir).as_posix(),
+                    ),
+                )
+
+    def claim(self, owner: str, run_dir: Path) -> Optional[TraversalEntry]:
+        now = time.time()
+        with self._transaction() as conn:
+            while True:
+                row = conn.execute(
+                    "SELECT id, kind, token, source, info, local_dir, status, attempts FROM leases "
+                    "WHERE status = 'pending' OR (status = 'leased' AND expires_at < ?) ORDER BY id LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    return None
+                lease_id, kind, token, source, info, local_dir, status, attempts = row
+                if status == "leased" and attempts >= WORK_LEASE_MAX_ATTEMPTS:
+                    # Every worker that took it died or hung; do not let it take down the next one.
+                    conn.execute(
+                        "UPDATE leases SET status = 'expired', error = ? WHERE id = ?",
+                        (f"lease expired {attempts} times", lease_id),
+                    )
+                    continue
+                conn.execute(
+                    "UPDATE leases SET status = 'leased', owner = ?, expires_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (owner, now + WORK_LEASE_SECONDS, lease_id),
+                )
+                return TraversalEntry(
+                    kind, token or "", json.loads(info), run_dir / local_dir, source=source, lease_id=lease_id
+                )
+
+    def renew(self, owner: str, lease_ids: List[int]) -> List[int]:
+        # Returns the leases this owner no longer holds.
+        expires_at = time.time() + WORK_LEASE_SECONDS
+        lost: List[int] = []
+        with self._transaction() as conn:
+            for lease_id in lease_ids:
+                cursor = conn.execute(
+                    "UPDATE leases SET expires_at = ? WHERE id = ? AND owner = ? AND status = 'leased'",
+                    (expires_at, lease_id, owner),
+                )
+                if not cursor.rowcount:
+                    lost.append(lease_id)
+        return lost
+
+    def complete(self, lease_id: int, owner: str, status: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE leases SET status = ?, expires_at = NULL WHERE id = ? AND owner = ? AND status = 'leased'",
+                (status, lease_id, owner),
+            )
+        return bool(cursor.rowcount)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM leases GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def unfinished(self) -> int:
+        counts = self.counts()
+        return counts.get("pending", 0) + counts.get("leased", 0)
+
+    def expired(self, run_dir: Path) -> List[Tuple[TraversalEntry, str]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, token, source, info, local_dir, error FROM leases WHERE status = 'expired' ORDER BY id"
+            ).fetchall()
+        return [
+            (TraversalEntry(kind, token or "", json.loads(info), run_dir / local_dir, source=source), error or "")
+            for kind, token, source, info, local_dir, error in rows
+        ]
+
+    def heartbeat(self, worker: str, status: str, files: int, failed: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO workers (id, status, seen_at, files, failed) VALUES (?, ?, ?, ?, ?)",
+                (worker, status, time.time(), files, failed),
+            )
+
+    def workers(self) -> List[Tuple[str, str, float, int, int]]:
+        with self._lock:
+            return self._conn.execute("SELECT id, status, seen_at, files, failed FROM workers ORDER BY id").fetchall()
+
+    def publish_token(self, store: str, access_token: str, expires_at: float) -> None:
+        self.set_meta(f"access_token:{store}", json.dumps({"access_token": access_token, "expires_at": expires_at}))
+
+    def published_token(self, store: str) -> Optional[Tuple[str, float]]:
+        value = self.get_meta(f"access_token:{store}")
+        if value is None:
+            return None
+        published = json.loads(value)
+        return str(published["access_token"]), float(published["expires_at"])
+
+    def request_token_refresh(self, store: str, stale: str) -> None:
+        self.set_meta(f"token_refresh:{store}", stale)
+
+    def refresh_requested(self, store: str) -> Optional[str]:
+        return self.get_meta(f"token_refresh:{store}")
+
+    @staticmethod
+    def remove(path: Path) -> None:
+        for suffix in ("", "-journal"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+
+@dataclass
+class ExportJob:
+    file_info: Dict[str, Any]
+    local_dir: Path
+    journal_id: Optional[int] = None
+    source: str = ""
+    lease_id: Optional[int] = None
+    file_token: str = ""
+    file_type: str = ""
+    target_ext: str = ""
+    target_path: Optional[Path] = None
+    revision: str = ""
+    ticket: str = ""
+    created_at: float = 0.0
+    next_poll_at: float = 0.0
+    polls: int = 0
+    queued_at: float = 0.0  # time.monotonic() when traversal handed the file to the pipeline
+    phase: str = "queued"  # pipeline step the job is in, reported in the failure log
+    # Other jobs for the same document wait on this one's export instead of creating their own.
+    followers: List["ExportJob"] = field(default_factory=list)
+    saved: Optional[Tuple[Path, int, str]] = None  # (path, size, digest) once downloaded
+    outcome: str = ""  # final journal status, set when the job finishes
+
+
+class FairQueue:
+    # FIFO per key, served round-robin across keys, so a source with a huge backlog of
+    # containers cannot keep the listers away from the others. get() returns None once closed.
+    def __init__(self) -> None:
+        self._queues: "OrderedDict[str, Deque[Any]]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, key: str, item: Any) -> None:
+        with self._cond:
+            self._queues.setdefault(key, deque()).append(item)
+            self._cond.notify()
+
+    def get(self) -> Optional[Any]:
+        with self._cond:
+            while not self._closed:
+                for key, items in self._queues.items():
+                    if items:
+                        item = items.popleft()
+                        # Served keys go to the back of the rotation.
+                        self._queues.move_to_end(key)
+                        return item
+                self._cond.wait()
+            return None
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+# Central poller for all in-flight export tickets. Jobs sit in a heap ordered by
+# their next due time, so tickets are polled round-robin; the total query rate is
+# capped by qps instead of growing with the number of tickets. poll(job) returns
+# True once the job has left the table.
+class ExportPoller:
+    def __init__(self, poll: Callable[[ExportJob], bool], threads: int, qps: float) -> None:
+        self._poll = poll
+        self._threads = max(1, threads)
+        self._min_interval = 1.0 / qps if qps > 0 else 0.0
+        self._heap: List[Tuple[float, int, ExportJob]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._next_slot = 0.0
+        self._stopping = False
+        self._workers: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for index in range(self._threads):
+            worker = threading.Thread(target=self._run, name=f"export-poller-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+        self._workers.clear()
+
+    def add(self, job: ExportJob) -> None:
+        with self._cond:
+            heapq.heappush(self._heap, (job.next_poll_at, next(self._seq), job))
+            self._cond.notify()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def _next_due(self) -> Optional[ExportJob]:
+        with self._cond:
+            while not self._stopping:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due_at = self._heap[0][0]
+                now = time.time()
+                if due_at > now:
+                    self._cond.wait(timeout=due_at - now)
+                    continue
+                _, _, job = heapq.heappop(self._heap)
+                slot = max(now, self._next_slot)
+                self._next_slot = slot + self._min_interval
+                break
+            else:
+                return None
+
+        delay = slot - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        return job
+
+    def _run(self) -> None:
+        while True:
+            job = self._next_due()
+            if job is None:
+                return
+            try:
+                finished = self._poll(job)
+            except Exception as exc:
+                print(f"[ERROR] Export poller crashed on ticket {job.ticket}: {exc}")
+                finished = True
+            if not finished:
+                self.add(job)
+
+
+def fsync_dir(path: Path) -> None:
+    # Makes a rename inside path durable; directories cannot be opened for fsync on Windows.
+    if os.name != "posix":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteStream:
+    # File-like handle given to the download code: write() only gathers chunks in memory and hands
+    # coalesced blocks, each with its file offset, to the DiskWriter threads. seek() / truncate()
+    # (a download restarting from byte 0) and close() first wait for the blocks already queued.
+    def __init__(self, writer: "DiskWriter", path: Path, mode: str, offset: int) -> None:
+        self.path = path
+        self._writer = writer
+        if mode == "ab":
+            # Blocks may land out of order, and append mode would ignore their offsets.
+            offset = path.stat().st_size if path.exists() else 0
+            mode = "r+b" if path.exists() else "wb"
+        self._handle = open(path, mode)
+        self._offset = offset
+        self._buffer = bytearray()
+        self._lock = threading.Lock()  # serializes positional writes to _handle
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._error: Optional[BaseException] = None
+
+    def __enter__(self) -> "WriteStream":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def preallocate(self, total: int) -> None:
+        # Only to the full final size: a resumed .part that long is re-requested as bytes=<total>-,
+        # which the server rejects, so a preallocated file is never mistaken for a finished prefix.
+        if PREALLOCATE_FILES and hasattr(os, "posix_fallocate") and total > self._offset:
+            try:
+                os.posix_fallocate(self._handle.fileno(), self._offset, total - self._offset)
+            except OSError:
+                pass
+
+    def write(self, data: bytes) -> int:
+        self._raise_error()
+        self._buffer += data
+        if len(self._buffer) >= self._writer.coalesce_bytes:
+            self._submit()
+        return len(data)
+
+    def _submit(self) -> None:
+        if not self._buffer:
+            return
+        block, offset = bytes(self._buffer), self._offset
+        self._buffer = bytearray()
+        self._offset += len(block)
+        with self._cond:
+            self._pending += 1
+        self._writer.submit(self, offset, block)
+
+    def _write_block(self, offset: int, block: bytes) -> None:
+        try:
+            with self._lock:
+                self._handle.seek(offset)
+                self._handle.write(block)
+        except BaseException as exc:
+            self._error = self._error or exc
+        finally:
+            with self._cond:
+                self._pending -= 1
+                self._cond.notify_all()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise OSError(f"write to {self.path} failed: {self._error}") from self._error
+
+    def flush(self) -> None:
+        self._submit()
+        with self._cond:
+            while self._pending:
+                self._cond.wait()
+        self._raise_error()
+
+    def seek(self, offset: int) -> int:
+        self.flush()
+        self._offset = offset
+        return offset
+
+    def truncate(self) -> None:
+        self.flush()
+        with self._lock:
+            self._handle.truncate(self._offset)
+
+    def close(self) -> None:
+        try:
+            self.flush()
+            if self._writer.fsync_policy == "file":
+                self._handle.flush()
+                os.fsync(self._handle.fileno())
+        finally:
+            self._handle.close()
+
+
+class DiskWriter:
+    # Writer stage between the download threads and the disk. Blocks queue up to buffer_bytes in
+    # total; past that, write() blocks the download until the disk catches up, so memory stays
+    # bounded when storage is the bottleneck. Any writer thread can take any block, since every
+    # block carries its own offset. Durability follows fsync_policy: "file" fsyncs in close() and
+    # the directory after the rename; "batch" queues finished paths and fsyncs them in groups.
+    def __init__(self, threads: int, buffer_bytes: int, coalesce_bytes: int, fsync_policy: str, batch_files: int) -> None:
+        self._threads = max(0, threads)
+        self.buffer_bytes = max(1, buffer_bytes)
+        self.coalesce_bytes = max(1, coalesce_bytes)
+        self.fsync_policy = fsync_policy
+        self.batch_files = max(1, batch_files)
+        self._queue: Deque[Optional[Tuple[WriteStream, int, bytes]]] = deque()
+        self._cond = threading.Condition()
+        self._queued_bytes = 0
+        self._batch: List[Path] = []
+        self._batch_lock = threading.Lock()
+        self._workers: List[threading.Thread] = []
+        self._sync_threads: List[threading.Thread] = []
+        self.stalls = 0  # times a download waited for buffer space
+
+    def start(self) -> None:
+        for index in range(self._threads):
+            worker = threading.Thread(target=self._run, name=f"disk-writer-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self) -> None:
+        with self._cond:
+            self._queue.extend([None] * len(self._workers))
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+        self._workers.clear()
+        for thread in self._sync_threads:
+            thread.join()
+        self._sync_threads.clear()
+        self._sync_batch(force=True)
+
+    def open(self, path: Path, mode: str = "wb", offset: int = 0) -> WriteStream:
+        return WriteStream(self, path, mode, offset)
+
+    def queued_bytes(self) -> int:
+        with self._cond:
+            return self._queued_bytes
+
+    def submit(self, stream: WriteStream, offset: int, block: bytes) -> None:
+        if not self._workers:
+            # Not started (plain use outside a run): write inline.
+            stream._write_block(offset, block)
+            return
+        with self._cond:
+            if self._queued_bytes and self._queued_bytes + len(block) > self.buffer_bytes:
+                self.stalls += 1
+                while self._queued_bytes and self._queued_bytes + len(block) > self.buffer_bytes:
+                    self._cond.wait()
+            self._queued_bytes += len(block)
+            self._queue.append((stream, offset, block))
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                item = self._queue.popleft()
+            if item is None:
+                return
+            stream, offset, block = item
+            stream._write_block(offset, block)
+            with self._cond:
+                self._queued_bytes -= len(block)
+                self._cond.notify_all()
+
+    def durable(self, path: Path) -> None:
+        # Called once path holds the finished file under its final name.
+        if self.fsync_policy == "file":
+            fsync_dir(path.parent)
+        elif self.fsync_policy == "batch":
+            with self._batch_lock:
+                self._batch.append(path)
+            self._sync_batch()
+
+    def _sync_batch(self, force: bool = False) -> None:
+        with self._batch_lock:
+            if not self._batch or (len(self._batch) < self.batch_files and not force):
+                return
+            batch, self._batch = self._batch, []
+        if self._workers and not force:
+            thread = threading.Thread(target=self._fsync_paths, args=(batch,), name="fsync-batch", daemon=True)
+            thread.start()
+            with self._batch_lock:
+                self._sync_threads = [item for item in self._sync_threads if item.is_alive()] + [thread]
+        else:
+            self._fsync_paths(batch)
+
+    @staticmethod
+    def _fsync_paths(paths: List[Path]) -> None:
+        for path in paths:
+            try:
+                with open(path, "rb") as handle:
+                    os.fsync(handle.fileno())
+            except OSError as exc:
+                print(f"[WARN] fsync failed: {path} ({exc})")
+        for directory in {path.parent for path in paths}:
+            try:
+                fsync_dir(directory)
+            except OSError as exc:
+                print(f"[WARN] fsync failed: {directory} ({exc})")
+
+
+class FeishuDriveBackup:
+    def __init__(
+        self,
+        user_access_token: str,
+        output_dir: Path,
+        timeout_seconds: int = 30,
+        max_retries: int = 3,
+        poll_interval_seconds: float = 2,
+        max_export_wait_seconds: int = 600,
+        lister_workers: int = 4,
+        export_workers: int = 4,
+        download_workers: int = 4,
+        export_poller_threads: int = 2,
+        export_poll_qps: float = 5.0,
+        max_inflight_exports: int = 1000,
+        export_order: str = "longest_first",
+        api_session: Optional[requests.Session] = None,
+        download_session: Optional[requests.Session] = None,
+        incremental: bool = False,
+        previous_run_dir: Optional[Path] = None,
+        object_store: Optional[ObjectStore] = None,
+        journal: Optional[RunJournal] = None,
+        rate_limiter: Optional[AdaptiveRateLimiter] = None,
+        duration_model: Optional[ExportDurationModel] = None,
+        export_routes: Optional[ExportRouteTable] = None,
+        wiki_cache: Optional[WikiNodeCache] = None,
+        hash_algorithm: str = "sha256",
+        archive: Optional[ArchiveWriter] = None,
+        listing_index: Optional[ListingIndex] = None,
+        reuse_listing_index: bool = False,
+        path_map_file: Optional[Path] = None,
+        scan_existing_names: bool = True,
+        metrics: Optional[Metrics] = None,
+        metrics_textfile: Optional[Path] = None,
+        metrics_interval_seconds: float = 15,
+        trace_requests: bool = False,
+        token_manager: Optional[AccessTokenManager] = None,
+        sources: Optional[List[BackupSource]] = None,
+    ) -> None:
+        # A bare token (tests, benchmarks) never expires and cannot be refreshed.
+        self.tokens = token_manager or AccessTokenManager(access_token=user_access_token)
+        # Empty: the single BACKUP_SOURCE, resolved when the run starts.
+        self.sources: Dict[str, BackupSource] = {source.name: source for source in sources or []}
+        self.output_dir = output_dir
+        self.timeout_seconds = timeout_seconds
+        self.max_retries = max_retries
+        self.poll_interval_seconds = poll_interval_seconds
+        self.max_export_wait_seconds = max_export_wait_seconds
+        self.lister_workers = max(1, lister_workers)
+        self.export_workers = max(1, export_workers)
+        self.download_workers = max(1, download_workers)
+        self.export_poller_threads = max(1, export_poller_threads)
+        self.export_poll_qps = export_poll_qps
+        self.max_inflight_exports = max(1, max_inflight_exports)
+        self.export_order = export_order
+        # Bulk downloads get their own pool so long transfers never starve API calls of connections.
+        self.api_session = api_session or build_http_session(API_POOL_SIZE, timed=trace_requests)
+        self.download_session = download_session or build_http_session(DOWNLOAD_POOL_SIZE, timed=trace_requests)
+        self.incremental = incremental
+        self.previous_run_dir = previous_run_dir
+        self.previous_manifest: Dict[str, Dict[str, Any]] = {}
+        self.manifest: Optional[BackupManifest] = None
+        self.object_store = object_store
+        self.hash_algorithm = hash_algorithm
+        self.archive = archive
+        self.previous_archive: Optional[ArchiveReader] = None
+        self.listing_index = listing_index
+        self.reuse_listing_index = reuse_listing_index
+        self.planning = False
+        self.plan_types: Dict[str, List[float]] = {}  # type -> [documents, documents to export, known bytes to export, predicted export seconds]
+        self.journal = journal
+        self.resuming = False
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter(RATE_LIMITS)
+        self.duration_model = duration_model or ExportDurationModel(None)
+        self.export_routes = export_routes or ExportRouteTable(None)
+        self.wiki_cache = wiki_cache or WikiNodeCache(None, 0, WIKI_CACHE_SIZE)
+        self._shared_lock = threading.Lock()
+        self._shared_exports: Dict[Tuple[int, str, str], ExportJob] = {}
+        self._carried_members: Dict[str, "Future[Optional[Path]]"] = {}  # previous member -> its copy in this archive
+        self.metrics = metrics or Metrics()
+        self.metrics_textfile = metrics_textfile
+        self.metrics_interval_seconds = metrics_interval_seconds
+        self.trace_requests = trace_requests
+        self.trace: Optional[RequestTrace] = None  # opened by run() / run_worker() with trace_requests
+
+        self.stats: Dict[str, int] = {
+            "folders": 0,
+            "files": 0,
+            "exported": 0,
+            "fallback_downloaded": 0,
+            "direct_downloaded": 0,
+            "unchanged": 0,
+            "resumed_done": 0,
+            "listings_fetched": 0,
+            "listings_cached": 0,
+            "plan_unchanged": 0,
+            "shared_exports": 0,
+            "export_polls": 0,
+            "failed": 0,
+        }
+        self.failures: List[str] = []  # first FAILED_LIST_LIMIT messages; every failure goes to failure_log
+        self.failure_log: Optional[FailureLog] = None
+        self.failure_log_path = output_dir / FAILURES_FILENAME
+        self._stats_lock = threading.Lock()
+        self.path_map_file = path_map_file
+        self.names = NameAllocator(
+            output_dir,
+            load_path_map(path_map_file) if path_map_file is not None else None,
+            scan_disk=scan_existing_names and archive is None,
+        )
+
+        # Traversal stage: containers expanded by lister threads, round-robin across sources.
+        self._containers = FairQueue()
+        self._containers_cond = threading.Condition()
+        self._containers_pending = 0
+
+        # Pipeline stages: create export task -> central poller -> download. Jobs wait for a
+        # create worker in a heap ordered by estimated export cost (largest first).
+        self._export_queue: List[Tuple[float, int, ExportJob]] = []
+        self._export_queue_lock = threading.Lock()
+        self._export_seq = itertools.count()
+        self._create_executor: Optional[ThreadPoolExecutor] = None
+        self.writer = DiskWriter(
+            DISK_WRITER_THREADS, WRITE_BUFFER_BYTES, WRITE_COALESCE_BYTES, FSYNC_POLICY, FSYNC_BATCH_FILES
+        )
+        self._download_executor: Optional[ThreadPoolExecutor] = None
+        self._poller: Optional[ExportPoller] = None
+        self._jobs_cond = threading.Condition()
+        self._jobs_in_flight = 0
+        self._source_in_flight: Dict[str, int] = {}
+        self._source_waiting: Dict[str, int] = {}
+
+        # Distributed runs (run_worker): containers come from the shared work queue instead.
+        self.work_queue: Optional[WorkQueue] = None
+        self.worker_id = ""  # also tags this worker's run files, see _run_file
+        self._leases: Dict[int, List[int]] = {}  # lease id -> [jobs in flight, listing finished, listing failed]
+        self._leases_lock = threading.Lock()
+        self._queue_drained = threading.Event()
+
+    def _incr_stat(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _record_failure(self, message: str, record: Optional[Dict[str, Any]] = None) -> None:
+        with self._stats_lock:
+            self.stats["failed"] += 1
+            if len(self.failures) < FAILED_LIST_LIMIT:
+                self.failures.append(message)
+        if self.failure_log is not None:
+            self.failure_log.record({"failed_at": int(time.time()), "message": message, **(record or {})})
+
+    def _failure_record(
+        self,
+        kind: str,
+        info: Dict[str, Any],
+        local_dir: Path,
+        source: str,
+        phase: str,
+        error: Any,
+        retryable: bool = True,
+    ) -> Dict[str, Any]:
+        # kind "file": info is the listing entry; "node": a library node whose conversion failed;
+        # "folder" / "library": a container whose listing failed. local_dir is relative to the run dir.
+        try:
+            relative_dir = local_dir.relative_to(self.output_dir).as_posix()
+        except ValueError:
+            relative_dir = str(local_dir)
+        return {
+            "kind": kind,
+            "token": info.get("token") or info.get("node_token") or "",
+            "name": info.get("name") or info.get("title") or "",
+            "type": info.get("type") or info.get("obj_type") or "",
+            "source": source,
+            "local_dir": relative_dir,
+            "phase": phase,
+            "error": str(error),
+            "http_status": getattr(error, "http_status", None),
+            "code": getattr(error, "code", None),
+            "attempts": getattr(error, "attempts", None),
+            "retryable": retryable,
+            "info": info,
+        }
+
+    def _job_failure(self, job: ExportJob, phase: str, error: Any) -> Dict[str, Any]:
+        record = self._failure_record("file", job.file_info, job.local_dir, job.source, phase, error)
+        record["obj_type"] = job.file_type
+        return record
+
+    def _reserve_path(self, path: Path, token: str = "") -> Path:
+        return self.names.allocate(path, token)
+
+    def _claim_path(self, path: Path, token: str = "") -> Path:
+        return self.names.claim(path, token)
+
+    def _run_file(self, name: str) -> Path:
+        # Each worker of a distributed run writes its own copy, e.g. .backup_manifest.<worker>.jsonl,
+        # which the coordinator folds into the run's file when the run ends.
+        if self.worker_id:
+            stem, _, extension = name.rpartition(".")
+            name = f"{stem}.{self.worker_id}.{extension}"
+        return self._claim_path(self.output_dir / name)
+
+    def _headers(self, tokens: Optional[AccessTokenManager] = None) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {(tokens or self.tokens).token()}",
+            "Content-Type": "application/json; charset=utf-8",
+        }
+
+    def _renew_token(self, response: requests.Response, tokens: Optional[AccessTokenManager] = None) -> None:
+        # The request was rejected for its access token: refresh once, unless another worker
+        # already replaced the token it was sent with.
+        sent = str(response.request.headers.get("Authorization") or "").removeprefix("Bearer ")
+        response.close()
+        (tokens or self.tokens).refresh(sent)
+        self.metrics.incr("token_renewals_total")
+
+    def _source_tokens(self, source: str) -> Optional[AccessTokenManager]:
+        configured = self.sources.get(source)
+        return configured.tokens if configured is not None else None
+
+    def _request(
+        self,
+        method: str,
+        path_or_url: str,
+        *,
+        params: Optional[Dict[str, Any]] = None,
+        json_body: Optional[Dict[str, Any]] = None,
+        stream: bool = False,
+        absolute_url: bool = False,
+        include_auth: bool = True,
+        family: str = "list",
+        endpoint: str = "other",
+        extra_headers: Optional[Dict[str, str]] = None,
+        tokens: Optional[AccessTokenManager] = None,
+    ) -> requests.Response:
+        url = path_or_url if absolute_url else f"{BASE_URL}{path_or_url}"
+        session = self.download_session if stream else self.api_session
+        last_error: Optional[Exception] = None
+        attempt = 0
+        renewed = False
+        while attempt < self.max_retries:
+            attempt += 1
+            with self.metrics.timer("rate_limit_wait_seconds", family=family):
+                self.rate_limiter.acquire(family)
+            # Built after the rate-limit wait, per attempt, so the token is as fresh as possible.
+            headers: Dict[str, str] = {}
+            if include_auth:
+                headers.update(self._headers(tokens))
+            elif not stream:
+                headers["Content-Type"] = "application/json; charset=utf-8"
+            if extra_headers:
+                headers.update(extra_headers)
+            trace_entry: Optional[Dict[str, Any]] = None
+            if self.trace is not None:
+                trace_entry = self._trace_begin(method, url, params, json_body, stream, family, endpoint, attempt, extra_headers)
+            try:
+                # Streamed downloads return once headers arrive; the body is timed as the download phase.
+                with self.metrics.timer("request_seconds", endpoint=endpoint):
+                    response = session.request(
+                        method=method,
+                        url=url,
+                        headers=headers,
+                        params=params,
+                        json=json_body,
+                        timeout=self.timeout_seconds,
+                        stream=stream,
+                    )
+                if trace_entry is not None:
+                    self._trace_response(trace_entry, response, stream)
+                self.metrics.incr("requests_total", endpoint=endpoint, status=response.status_code)
+                if response.status_code == 401 and include_auth and not renewed:
+                    # Retried once with a fresh token, without using up one of the normal attempts.
+                    renewed = True
+                    attempt -= 1
+                    self._renew_token(response, tokens)
+                    continue
+
+                retry_after = response.headers.get("Retry-After")
+                has_retry_after = bool(retry_after and retry_after.isdigit())
+                if response.status_code == 429:
+                    self.metrics.incr("throttled_total", endpoint=endpoint)
+                    # Slow the whole endpoint family down; an explicit Retry-After also pauses
+                    # every worker, and the next acquire() does that waiting.
+                    self.rate_limiter.on_throttle(family, int(retry_after) if has_retry_after else None)
+                elif response.status_code < 400:
+                    self.rate_limiter.on_success(family)
+
+                if response.status_code in RETRYABLE_HTTP_STATUS:
+                    if attempt < self.max_retries:
+                        sleep_seconds = int(retry_after) if has_retry_after else attempt
+                        print(f"[WARN] HTTP {response.status_code}, retry after {sleep_seconds}s: {url}")
+                        self.metrics.incr("retries_total", endpoint=endpoint, reason=f"http_{response.status_code}")
+                        # Release the connection back to the pool before sleeping.
+                        response.close()
+                        if not (response.status_code == 429 and has_retry_after):
+                            time.sleep(sleep_seconds)
+                        continue
+
+                return response
+            except requests.RequestException as exc:
+                last_error = exc
+                if trace_entry is not None:
+                    self._trace_error(trace_entry, exc)
+                self.metrics.incr("requests_total", endpoint=endpoint, status="error")
+                if attempt < self.max_retries:
+                    self.metrics.incr("retries_total", endpoint=endpoint, reason=type(exc).__name__)
+                    wait_seconds = attempt
+                    print(f"[WARN] Request failed (attempt {attempt}/{self.max_retries}), retry in {wait_seconds}s: {url}")
+                    time.sleep(wait_seconds)
+                    continue
+                break
+
+        if last_error is not None:
+            raise FeishuApiError(
+                f"Request failed after {self.max_retries} attempts: {url} ({last_error})", attempts=self.max_retries
+            )
+        raise FeishuApiError(f"Request failed after {self.max_retries} attempts: {url}", attempts=self.max_retries)
+
+    def _trace_begin(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Dict[str, Any]],
+        json_body: Optional[Dict[str, Any]],
+        stream: bool,
+        family: str,
+        endpoint: str,
+        attempt: int,
+        extra_headers: Optional[Dict[str, str]],
+    ) -> Dict[str, Any]:
+        # One trace record per attempt; retries show up as attempt > 1. API paths are stored relative
+        # to BASE_URL so a replay can point them at another server.
+        assert self.trace is not None
+        _connect_phases.phases = {}
+        return {
+            "at": self.trace.now(),
+            "thread": threading.current_thread().name,
+            "method": method,
+            "endpoint": endpoint,
+            "family": family,
+            "path": url[len(BASE_URL):] if url.startswith(BASE_URL) else None,
+            "url": None if url.startswith(BASE_URL) else url,
+            "params": params,
+            "json": json_body,
+            "range": (extra_headers or {}).get("Range"),
+            "stream": stream or None,
+            "attempt": attempt,
+            "_started": time.perf_counter(),
+        }
+
+    def _trace_response(self, entry: Dict[str, Any], response: requests.Response, stream: bool) -> None:
+        phases = getattr(_connect_phases, "phases", None) or {}
+        _connect_phases.phases = None
+        started = entry.pop("_started")
+        # response.elapsed runs from sending the request to parsed headers, connection setup included.
+        headers_ms = response.elapsed.total_seconds() * 1000
+        entry.update(phases)
+        entry["status"] = response.status_code
+        entry["ttfb_ms"] = round(max(0.0, headers_ms - sum(phases.values())), 1)
+        if not stream:
+            total_ms = (time.perf_counter() - started) * 1000
+            entry["body_ms"] = round(max(0.0, total_ms - headers_ms), 1)
+            entry["total_ms"] = round(total_ms, 1)
+            entry["bytes"] = len(response.content)
+            entry["code"], entry["ids"] = self._trace_payload(response)
+            self._trace_record(entry)
+            return
+
+        # Streamed bodies are read later by the caller; the record is written when the response is
+        # closed, which every download path does in its finally block.
+        close = response.close
+        closed = threading.Event()
+
+        def traced_close() -> None:
+            if not closed.is_set():
+                closed.set()
+                total_ms = (time.perf_counter() - started) * 1000
+                entry["body_ms"] = round(max(0.0, total_ms - headers_ms), 1)
+                entry["total_ms"] = round(total_ms, 1)
+                entry["bytes"] = response.raw.tell() if response.raw is not None else None
+                if getattr(response, "_content_consumed", False):
+                    entry["code"], entry["ids"] = self._trace_payload(response)
+                self._trace_record(entry)
+            close()
+
+        response.close = traced_close  # type: ignore[method-assign]
+
+    def _trace_error(self, entry: Dict[str, Any], exc: Exception) -> None:
+        _connect_phases.phases = None
+        entry["total_ms"] = round((time.perf_counter() - entry.pop("_started")) * 1000, 1)
+        entry["error"] = type(exc).__name__
+        self._trace_record(entry)
+
+    def _trace_record(self, entry: Dict[str, Any]) -> None:
+        if self.trace is not None:
+            self.trace.record(entry)
+
+    @staticmethod
+    def _trace_payload(response: requests.Response) -> Tuple[Optional[int], Dict[str, str]]:
+        # API code plus the ids later calls are built from (export ticket, exported file token),
+        # which replay_trace.py swaps for the ones the replay target hands out.
+        if "json" not in response.headers.get("Content-Type", ""):
+            return None, {}
+        try:
+            payload = response.json()
+        except ValueError:
+            return None, {}
+        if not isinstance(payload, dict):
+            return None, {}
+        data = payload.get("data") if isinstance(payload.get("data"), dict) else {}
+        result = data.get("result") if isinstance(data.get("result"), dict) else {}
+        ids = {"ticket": data.get("ticket"), "file_token": result.get("file_token")}
+        return payload.get("code"), {key: value for key, value in ids.items() if isinstance(value, str) and value}
+
+    def _request_json(
+        self,
+        method: str,
+        path: str,
+        *,
+        params: Optional[Dict[str, Any]] = None,
+        json_body: Optional[Dict[str, Any]] = None,
+        family: str = "list",
+        endpoint: str = "other",
+        tokens: Optional[AccessTokenManager] = None,
+    ) -> Dict[str, Any]:
+        last_response_text = ""
+        attempt = 0
+        renewed = False
+        while attempt < self.max_retries:
+            attempt += 1
+            response = self._request(
+                method,
+                path,
+                params=params,
+                json_body=json_body,
+                stream=False,
+                family=family,
+                endpoint=endpoint,
+                tokens=tokens,
+            )
+            last_response_text = response.text
+
+            try:
+                payload = response.json()
+            except ValueError:
+                payload = {"code": -1, "msg": f"Non-JSON response: {response.text[:200]}"}
+
+            code = payload.get("code", 0)
+            retriable = response.status_code in RETRYABLE_HTTP_STATUS or code in RETRYABLE_API_CODES
+            if response.status_code < 400 and code == 0:
+                return payload
+            # A 401 was already retried with a fresh token inside _request.
+            if code in INVALID_ACCESS_TOKEN_CODES and response.status_code != 401 and not renewed:
+                renewed = True
+                attempt -= 1
+                self._renew_token(response, tokens)
+                continue
+
+            message = payload.get("msg") or f"HTTP {response.status_code}"
+            if retriable and attempt < self.max_retries:
+                wait_seconds = attempt
+                print(f"[WARN] API failed (code={code}, attempt {attempt}/{self.max_retries}), retry in {wait_seconds}s: {message}")
+                self.metrics.incr("retries_total", endpoint=endpoint, reason=f"code_{code}")
+                if code in RATE_LIMITED_API_CODES:
+                    self.metrics.incr("throttled_total", endpoint=endpoint)
+                    self.rate_limiter.on_throttle(family)
+                time.sleep(wait_seconds)
+                continue
+
+            raise FeishuApiError(
+                f"API request failed: {message} (code={code}, http={response.status_code})",
+                http_status=response.status_code,
+                code=code,
+                attempts=attempt,
+            )
+
+        raise FeishuApiError(
+            f"API request failed with no response payload: {last_response_text[:200]}", attempts=attempt
+        )
+
+    def _request_binary(
+        self,
+        method: str,
+        path_or_url: str,
+        *,
+        params: Optional[Dict[str, Any]] = None,
+        absolute_url: bool = False,
+        include_auth: bool = True,
+        range_header: Optional[str] = None,
+        endpoint: str = "other",
+        tokens: Optional[AccessTokenManager] = None,
+    ) -> requests.Response:
+        response = self._request(
+            method,
+            path_or_url,
+            params=params,
+            stream=True,
+            absolute_url=absolute_url,
+            include_auth=include_auth,
+            family="download",
+            endpoint=endpoint,
+            extra_headers={"Range": range_header} if range_header else None,
+            tokens=tokens,
+        )
+
+        if response.status_code >= 400:
+            preview = response.text[:200] if response.text else ""
+            response.close()
+            raise FeishuApiError(
+                f"Binary download failed: http={response.status_code}, body={preview}",
+                http_status=response.status_code,
+            )
+        return response
+
+    def list_folder_files(
+        self,
+        folder_token: Optional[str],
+        page_token: Optional[str],
+        tokens: Optional[AccessTokenManager] = None,
+    ) -> Tuple[List[Dict[str, Any]], bool, Optional[str]]:
+        params: Dict[str, Any] = {"page_size": 200}
+        if folder_token:
+            params["folder_token"] = folder_token
+        if page_token:
+            params["page_token"] = page_token
+
+        payload = self._request_json("GET", "/drive/v1/files", params=params, endpoint="list_files", tokens=tokens)
+        data = payload.get("data", {})
+        files = data.get("files", [])
+        has_more = bool(data.get("has_more", False))
+        next_page_token = data.get("next_page_token") or data.get("page_token")
+        return files, has_more, next_page_token
+
+    def iter_folder_files(self, folder_token: Optional[str]) -> Iterator[Dict[str, Any]]:
+        def fetch_page(page_token: Optional[str]) -> Tuple[List[Dict[str, Any]], bool, Optional[str]]:
+            return self.list_folder_files(folder_token, page_token)
+
+        yield from self._iter_paginated(
+            fetch_page=fetch_page,
+            missing_token_warn=FOLDER_MISSING_TOKEN_WARN,
+        )
+
+    def list_my_library_nodes(
+        self,
+        parent_node_token: Optional[str],
+        page_token: Optional[str],
+    ) -> Tuple[List[Dict[str, Any]], bool, Optional[str]]:
+        return self.list_wiki_nodes(MY_LIBRARY_SPACE_ID, parent_node_token, page_token)
+
+    def list_wiki_nodes(
+        self,
+        space_id: str,
+        parent_node_token: Optional[str],
+        page_token: Optional[str],
+        tokens: Optional[AccessTokenManager] = None,
+    ) -> Tuple[List[Dict[str, Any]], bool, Optional[str]]:
+        params: Dict[str, Any] = {"page_size": 50}
+        if parent_node_token:
+            params["parent_node_token"] = parent_node_token
+        if page_token:
+            params["page_token"] = page_token
+
+        payload = self._request_json(
+            "GET",
+            f"/wiki/v2/spaces/{space_id}/nodes",
+            params=params,
+            endpoint="list_nodes",
+            tokens=tokens,
+        )
+        data = payload.get("data", {})
+        items = data.get("items", [])
+        has_more = bool(data.get("has_more", False))
+        next_page_token = data.get("page_token")
+        return items, has_more, next_page_token
+
+    def iter_my_library_nodes(self, parent_node_token: Optional[str]) -> Iterator[Dict[str, Any]]:
+        def fetch_page(page_token: Optional[str]) -> Tuple[List[Dict[str, Any]], bool, Optional[str]]:
+            return self.list_my_library_nodes(parent_node_token, page_token)
+
+        yield from self._iter_paginated(
+            fetch_page=fetch_page,
+            missing_token_warn=LIBRARY_MISSING_TOKEN_WARN,
+        )
+
+    def _iter_pages(
+        self,
+        fetch_page: Callable[[Optional[str]], Tuple[List[Dict[str, Any]], bool, Optional[str]]],
+        missing_token_warn: str,
+        start_page_token: Optional[str] = None,
+    ) -> Iterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        # Yields (items, cursor of the next page); the cursor is None on the last page.
+        page_token = start_page_token
         while True:
             items, has_more, next_page_token = fetch_page(page_token)
-            for node in items:
-                yield node
-            if not has_more:
-                break
-            if not next_page_token:
+            if has_more and not next_page_token:
                 print(missing_token_warn)
+            if not has_more or not next_page_token:
+                yield items, None
                 break
+            yield items, next_page_token
             page_token = next_page_token
 
+    def _iter_paginated(
+        self,
+        fetch_page: Callable[[Optional[str]], Tuple[List[Dict[str, Any]], bool, Optional[str]]],
+        missing_token_warn: str,
+    ) -> Iterator[Dict[str, Any]]:
+        for items, _ in self._iter_pages(fetch_page, missing_token_warn):
+            yield from items
+
     @staticmethod
     def library_node_to_file_info(node: Dict[str, Any]) -> Dict[str, Any]:
         obj_token = node.get("obj_token")
@@ -373,6 +2918,7 @@ class FeishuDriveBackup:
             "token": obj_token,
             "type": obj_type,
             "name": node.get("title") or obj_token,
+            "modified_time": node.get("obj_edit_time"),
         }
 
     @staticmethod
@@ -385,286 +2931,2117 @@ class FeishuDriveBackup:
             return "pptx"
         return "pdf"
 
-    def create_export_task(self, file_token: str, file_type: str, extension: str) -> str:
+    def create_export_task(
+        self,
+        file_token: str,
+        file_type: str,
+        extension: str,
+        tokens: Optional[AccessTokenManager] = None,
+    ) -> str:
         payload = {
             "token": file_token,
             "type": file_type,
             "file_extension": extension,
         }
-        resp = self._request_json("POST", "/drive/v1/export_tasks", json_body=payload)
+        resp = self._request_json(
+            "POST",
+            "/drive/v1/export_tasks",
+            json_body=payload,
+            family="export_create",
+            endpoint="export_create",
+            tokens=tokens,
+        )
         ticket = (resp.get("data") or {}).get("ticket")
         if not ticket:
             raise FeishuApiError("Export task created but no ticket returned")
         return ticket
 
-    def resolve_wiki_node(self, wiki_token: str) -> Tuple[str, str]:
-        resp = self._request_json(
-            "GET",
-            "/wiki/v2/spaces/get_node",
-            params={"token": wiki_token},
-        )
-        data = resp.get("data") or {}
-        node = data.get("node") or data
-        obj_token = node.get("obj_token")
-        obj_type = node.get("obj_type")
-        if not obj_token or not obj_type:
-            raise FeishuApiError("Wiki node resolved without obj_token/obj_type")
-        return obj_token, obj_type
+    def get_wiki_node(self, wiki_token: str, tokens: Optional[AccessTokenManager] = None) -> Dict[str, Any]:
+        resp = self._request_json(
+            "GET",
+            "/wiki/v2/spaces/get_node",
+            params={"token": wiki_token},
+            endpoint="get_node",
+            tokens=tokens,
+        )
+        data = resp.get("data") or {}
+        return data.get("node") or data
+
+    def resolve_wiki_node(self, wiki_token: str, tokens: Optional[AccessTokenManager] = None) -> Tuple[str, str, str]:
+        return self.wiki_cache.get(wiki_token, lambda token: self._fetch_wiki_node(token, tokens))
+
+    def _fetch_wiki_node(self, wiki_token: str, tokens: Optional[AccessTokenManager] = None) -> Tuple[str, str, str]:
+        node = self.get_wiki_node(wiki_token, tokens)
+        obj_token = node.get("obj_token")
+        obj_type = node.get("obj_type")
+        if not obj_token or not obj_type:
+            raise FeishuApiError("Wiki node resolved without obj_token/obj_type")
+        return obj_token, obj_type, str(node.get("obj_edit_time") or "")
+
+    def query_export_task(
+        self,
+        ticket: str,
+        file_token: str,
+        tokens: Optional[AccessTokenManager] = None,
+    ) -> Dict[str, Any]:
+        resp = self._request_json(
+            "GET",
+            f"/drive/v1/export_tasks/{ticket}",
+            params={"token": file_token},
+            family="export_query",
+            endpoint="export_query",
+            tokens=tokens,
+        )
+        data = resp.get("data") or {}
+        result = data.get("result") or {}
+
+        # Compatibility with possible older schema.
+        if not result and data:
+            result = data
+
+        return result
+
+    @staticmethod
+    def parse_export_status(result: Dict[str, Any]) -> Tuple[str, str]:
+        if "job_status" in result:
+            status_code = result.get("job_status")
+            if status_code in (1, 2):
+                return "processing", ""
+            if status_code == 0:
+                return "success", ""
+            return "failed", str(result.get("job_error_msg") or f"job_status={status_code}")
+
+        status = str(result.get("status", "")).lower()
+        if status in {"processing", "running", "queued", "pending"}:
+            return "processing", ""
+        if status in {"success", "succeeded", "done"}:
+            return "success", ""
+        if status in {"failed", "error"}:
+            return "failed", str(result.get("error_msg") or "export failed")
+
+        return "processing", ""
+
+    @staticmethod
+    def extract_export_file(result: Dict[str, Any]) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        file_info = result.get("file") or {}
+        exported_file_token = result.get("file_token") or file_info.get("token")
+        exported_url = file_info.get("url") or result.get("url")
+        file_name = result.get("file_name") or file_info.get("name")
+        return exported_file_token, exported_url, file_name
+
+    def download_export_file(
+        self,
+        exported_file_token: Optional[str],
+        exported_url: Optional[str],
+        range_header: Optional[str] = None,
+        tokens: Optional[AccessTokenManager] = None,
+    ) -> requests.Response:
+        if exported_file_token:
+            return self._request_binary(
+                "GET",
+                f"/drive/v1/export_tasks/file/{exported_file_token}/download",
+                range_header=range_header,
+                endpoint="export_download",
+                tokens=tokens,
+            )
+        if exported_url:
+            # Some older responses may return a direct download URL.
+            return self._request_binary(
+                "GET",
+                exported_url,
+                absolute_url=True,
+                include_auth=False,
+                range_header=range_header,
+                endpoint="export_download",
+            )
+        raise FeishuApiError("No exported file token or URL returned")
+
+    def download_regular_file(
+        self,
+        file_token: str,
+        range_header: Optional[str] = None,
+        tokens: Optional[AccessTokenManager] = None,
+    ) -> requests.Response:
+        return self._request_binary(
+            "GET",
+            f"/drive/v1/files/{file_token}/download",
+            range_header=range_header,
+            endpoint="file_download",
+            tokens=tokens,
+        )
+
+    @staticmethod
+    def build_export_filename(original_name: str, extension: str) -> str:
+        sanitized = sanitize_filename(original_name)
+        suffix = f".{extension.lower()}"
+
+        # Keep clean names like "foo.docx" instead of "foo.docx.docx".
+        if sanitized.lower().endswith(suffix):
+            return sanitized
+
+        stem = Path(sanitized).stem if Path(sanitized).suffix else sanitized
+        return f"{stem}{suffix}"
+
+    @staticmethod
+    def _response_total(response: requests.Response, offset: int) -> Optional[int]:
+        content_range = response.headers.get("Content-Range", "")
+        if response.status_code == 206 and "/" in content_range:
+            total = content_range.rsplit("/", 1)[1]
+            return int(total) if total.isdigit() else None
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit() and not response.headers.get("Content-Encoding"):
+            return int(length) + (offset if response.status_code == 206 else 0)
+        return None
+
+    def stream_to_file(
+        self,
+        fetch: Callable[[Optional[str]], requests.Response],
+        path: Path,
+        resume_after: Optional[float] = None,
+        allow_segments: bool = False,
+    ) -> Tuple[int, str]:
+        # fetch(range_header) opens the download. The body goes to "<path>.part" and is renamed
+        # into place only when complete, so a partial file never sits at the final path. A
+        # dropped connection resumes with a Range request. A .part left by an earlier run is
+        # resumed only if it was written after resume_after (the source's modified time).
+        path.parent.mkdir(parents=True, exist_ok=True)
+        part_path = path.with_name(path.name + ".part")
+        digest = new_hasher(self.hash_algorithm)
+        offset = 0
+        if part_path.exists():
+            part_stat = part_path.stat()
+            if resume_after is not None and part_stat.st_mtime > resume_after:
+                offset = part_stat.st_size
+            else:
+                part_path.unlink()
+
+        response: Optional[requests.Response] = None
+        if offset:
+            try:
+                response = fetch(f"bytes={offset}-")
+            except FeishuApiError:
+                response = None
+            if response is not None and response.status_code != 206:
+                response.close()
+                response = None
+            if response is None:
+                offset = 0
+        if response is None:
+            response = fetch(None)
+
+        total = self._response_total(response, offset)
+        if (
+            allow_segments
+            and offset == 0
+            and PARALLEL_DOWNLOAD_SEGMENTS > 1
+            and total is not None
+            and total >= PARALLEL_DOWNLOAD_MIN_BYTES
+            and response.headers.get("Accept-Ranges", "").lower() == "bytes"
+        ):
+            response.close()
+            return self._segmented_download(fetch, part_path, path, total)
+
+        if offset:
+            # Hash the bytes kept from the earlier attempt once, then keep streaming.
+            with open(part_path, "rb") as existing:
+                for chunk in iter(lambda: existing.read(DOWNLOAD_CHUNK_BYTES), b""):
+                    digest.update(chunk)
+
+        # Network reads stay on this thread; the writer stage does the (coalesced) disk writes.
+        with self.writer.open(part_path, "ab" if offset else "wb") as handle:
+            if total is not None:
+                handle.preallocate(total)
+            offset, digest = self._copy_body(fetch, response, handle, offset, digest, path.name)
+        if total is not None and offset != total:
+            raise FeishuApiError(f"Download size mismatch: got {offset} bytes, expected {total}")
+        os.replace(part_path, path)
+        return offset, digest.hexdigest()
+
+    def _copy_body(
+        self,
+        fetch: Callable[[Optional[str]], requests.Response],
+        response: requests.Response,
+        handle: Any,
+        offset: int,
+        digest: Any,
+        name: str,
+        restartable: bool = True,
+    ) -> Tuple[int, Any]:
+        # Copies the body into handle while hashing it; a dropped connection resumes with a
+        # Range request. If the server ignores Range the copy restarts from byte 0, which
+        # needs a handle that can be truncated.
+        failures = 0
+        while True:
+            try:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                    if chunk:
+                        handle.write(chunk)
+                        digest.update(chunk)
+                        offset += len(chunk)
+                break
+            except requests.RequestException as exc:
+                failures += 1
+                if failures >= self.max_retries:
+                    raise FeishuApiError(f"Download interrupted at byte {offset}: {exc}") from exc
+                print(f"[WARN] Download interrupted at byte {offset}, resuming: {name} ({exc})")
+            finally:
+                response.close()
+
+            response = fetch(f"bytes={offset}-")
+            if response.status_code != 206:
+                if not restartable:
+                    response.close()
+                    raise FeishuApiError(f"Range request ignored after {offset} bytes (http={response.status_code})")
+                handle.seek(0)
+                handle.truncate()
+                digest = new_hasher(self.hash_algorithm)
+                offset = 0
+        return offset, digest
+
+    def _segmented_download(
+        self,
+        fetch: Callable[[Optional[str]], requests.Response],
+        part_path: Path,
+        path: Path,
+        total: int,
+    ) -> Tuple[int, str]:
+        segment_size = math.ceil(total / PARALLEL_DOWNLOAD_SEGMENTS)
+        with open(part_path, "wb") as handle:
+            # Preallocate; a sparse .part must never be mistaken for a resumable prefix.
+            handle.truncate(total)
+
+        def fetch_segment(start: int, end: int) -> None:
+            position = start
+            failures = 0
+            with self.writer.open(part_path, "r+b", start) as handle:
+                while position <= end:
+                    # Only an attempt that leaves position where it was (an error before the first
+                    # byte, an empty 206) counts against max_retries; one that made progress simply
+                    # resumes. Writes stop at end, so a server sending more than the requested
+                    # range cannot overwrite the next segment.
+                    before = position
+                    error: Optional[requests.RequestException] = None
+                    try:
+                        response = fetch(f"bytes={position}-{end}")
+                        try:
+                            if response.status_code != 206:
+                                raise FeishuApiError(f"Range request ignored (http={response.status_code})")
+                            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                                if chunk:
+                                    chunk = chunk[: end - position + 1]
+                                    handle.write(chunk)
+                                    position += len(chunk)
+                                    if position > end:
+                                        break
+                        finally:
+                            response.close()
+                    except requests.RequestException as exc:
+                        error = exc
+                    if position > before:
+                        continue
+                    failures += 1
+                    reason = str(error) if error is not None else "no bytes received"
+                    if failures >= self.max_retries:
+                        raise FeishuApiError(f"Segment {start}-{end} interrupted at byte {position}: {reason}") from error
+                    print(f"[WARN] Segment {start}-{end} interrupted at byte {position}, resuming: {path.name} ({reason})")
+
+        print(f"[INFO] Multi-range download ({PARALLEL_DOWNLOAD_SEGMENTS} segments, {total} bytes): {path.name}")
+        ranges = [(start, min(start + segment_size, total) - 1) for start in range(0, total, segment_size)]
+        try:
+            with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="segment") as pool:
+                for future in [pool.submit(fetch_segment, start, end) for start, end in ranges]:
+                    future.result()
+        except Exception:
+            part_path.unlink(missing_ok=True)
+            raise
+
+        # Segments arrive out of order, so this is the one case that needs a second read pass.
+        digest = new_hasher(self.hash_algorithm)
+        with open(part_path, "rb") as handle:
+            for chunk in iter(lambda: handle.read(DOWNLOAD_CHUNK_BYTES), b""):
+                digest.update(chunk)
+        os.replace(part_path, path)
+        return total, digest.hexdigest()
+
+    def _stream_to_archive(
+        self,
+        fetch: Callable[[Optional[str]], requests.Response],
+        target_path: Path,
+        token: str,
+    ) -> Tuple[int, str]:
+        assert self.archive is not None
+        member = target_path.relative_to(self.output_dir).as_posix()
+        compress = target_path.suffix.lower() not in ARCHIVE_STORED_SUFFIXES
+        digest = new_hasher(self.hash_algorithm)
+        response = fetch(None)
+        total = self._response_total(response, 0)
+        if total is not None and total <= ARCHIVE_MEMBER_BUFFER_BYTES:
+            # Buffer small bodies so downloads stay parallel and only the append is serialized.
+            buffer = io.BytesIO()
+            size, digest = self._copy_body(fetch, response, buffer, 0, digest, target_path.name)
+            if size != total:
+                raise FeishuApiError(f"Download size mismatch: got {size} bytes, expected {total}")
+            self.archive.add(member, buffer.getvalue(), compress, token)
+            return size, digest.hexdigest()
+
+        # Large or unsized bodies stream straight into the volume while other writers wait.
+        with self.archive.member(member, compress, token) as handle:
+            size, digest = self._copy_body(fetch, response, handle, 0, digest, target_path.name, restartable=False)
+            if total is not None and size != total:
+                raise FeishuApiError(f"Download size mismatch: got {size} bytes, expected {total}")
+        return size, digest.hexdigest()
+
+    def save_download(
+        self,
+        fetch: Callable[[Optional[str]], requests.Response],
+        target_path: Path,
+        resume_after: Optional[float] = None,
+        allow_segments: bool = False,
+        token: str = "",
+    ) -> Tuple[int, str]:
+        if self.archive is not None:
+            return self._stream_to_archive(fetch, target_path, token)
+        if self.object_store is None:
+            size, digest = self.stream_to_file(fetch, target_path, resume_after, allow_segments)
+            self.writer.durable(target_path)
+            return size, digest
+        # Keyed by target so an interrupted download can resume from the store's tmp dir.
+        temp_path = self.object_store.temp_path(str(target_path))
+        try:
+            size, digest = self.stream_to_file(fetch, temp_path, resume_after, allow_segments)
+            self.object_store.commit(temp_path, digest, target_path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+        self.writer.durable(target_path)
+        return size, digest
+
+    def open_journal(self) -> None:
+        if self.journal is None:
+            return
+        # Single-source runs keep the plain BACKUP_SOURCE value, so older journals still resume.
+        expected = ",".join(
+            f"{source.name}={source.space_id or source.kind}" if source.name else BACKUP_SOURCE
+            for source in self._configured_sources()
+        )
+        source = self.journal.get_meta("source")
+        if source is None:
+            self.journal.set_meta("source", expected)
+            self.journal.set_meta("started_at", str(int(time.time())))
+            return
+        if source != expected:
+            raise ValueError(f"续跑目录的 source={source} 与当前备份来源 {expected} 不一致")
+        self.resuming = True
+        # Names handed out before the interruption stay taken, even if nothing was written yet.
+        reserved = self.journal.reserved_paths()
+        for path, token in reserved:
+            self._claim_path(path, token)
+        print(f"[INFO] Resuming run from journal {self.journal.path} ({len(reserved)} reserved paths)")
+
+    def open_archive(self) -> None:
+        if self.archive is None:
+            return
+        lost = self.archive.open(self.resuming)
+        if lost and self.journal is not None:
+            reopened = self.journal.reopen_tokens(lost)
+            print(f"[INFO] {reopened} completed files were in unfinished archive volumes, writing them again")
+
+    def close_archive(self) -> None:
+        if self.archive is not None:
+            self.archive.close()
+        if self.previous_archive is not None:
+            self.previous_archive.close()
+            self.previous_archive = None
+
+    def open_manifest(self) -> None:
+        if self.incremental and self.previous_run_dir is not None:
+            # Load before opening the new manifest: with RUN_SUBDIR_BY_DATE off both are the same file.
+            self.previous_manifest = BackupManifest.load(self.previous_run_dir / MANIFEST_FILENAME)
+            # Runs from before the path map existed still name their files consistently.
+            self.names.remember({token: entry["path"] for token, entry in self.previous_manifest.items() if entry.get("path")})
+            if self.archive is not None and (self.previous_run_dir / ARCHIVE_INDEX_FILENAME).exists():
+                self.previous_archive = ArchiveReader(self.previous_run_dir)
+            print(
+                f"[INFO] Incremental mode: {len(self.previous_manifest)} entries from previous run "
+                f"{self.previous_run_dir}"
+            )
+        elif self.incremental:
+            print("[INFO] Incremental mode: no previous run found, exporting everything")
+        self.manifest = BackupManifest(self._run_file(MANIFEST_FILENAME), append=self.resuming)
+
+    def close_manifest(self) -> None:
+        if self.manifest is not None:
+            self.manifest.close()
+            self.manifest = None
+
+    def _record_saved(
+        self,
+        file_info: Dict[str, Any],
+        path: Path,
+        size: int,
+        digest: str,
+        mode: str,
+        revision: str = "",
+        obj_token: str = "",
+        obj_type: str = "",
+        hash_algorithm: str = "",
+    ) -> None:
+        self.metrics.incr("files_total", type=file_info.get("type") or "unknown", mode=mode)
+        self.metrics.incr("saved_bytes_total", size, type=file_info.get("type") or "unknown")
+        if self.manifest is None:
+            return
+        self.manifest.record(
+            {
+                "token": file_info.get("token"),
+                "type": file_info.get("type"),
+                "obj_token": obj_token or file_info.get("token"),
+                "obj_type": obj_type or file_info.get("type"),
+                "name": file_info.get("name"),
+                "revision": revision,
+                "path": path.relative_to(self.output_dir).as_posix(),
+                "size": size,
+                "hash_algorithm": hash_algorithm or self.hash_algorithm,
+                "digest": digest,
+                "mode": mode,
+                "saved_at": int(time.time()),
+            }
+        )
+
+    def _same_dir_as_previous_run(self) -> bool:
+        return self.previous_run_dir is not None and self.previous_run_dir.resolve() == self.output_dir.resolve()
+
+    def _target_path(
+        self,
+        file_info: Dict[str, Any],
+        local_dir: Path,
+        file_name: str,
+        journal_id: Optional[int] = None,
+    ) -> Path:
+        if self.journal is not None and journal_id is not None:
+            # A resumed item overwrites its own half-written file rather than getting a new name.
+            token = file_info.get("token") or ""
+            journaled = self.journal.target(journal_id)
+            if journaled is not None and journaled.parent == local_dir:
+                if NameAllocator.is_variant(journaled.name, file_name):
+                    return self._claim_path(journaled, token)
+                # Journaled for another output, e.g. the export's .pdf before a direct-download fallback.
+                self.names.release(journaled, token)
+            target = self._reserve_path(local_dir / file_name, token)
+            self.journal.set_target(journal_id, target)
+            return target
+        # Without dated run dirs the allocator hands a changed document its previous path, so
+        # it overwrites its old copy instead of landing next to it as "name (1)".
+        return self._reserve_path(local_dir / file_name, file_info.get("token") or "")
+
+    def _carry_forward(self, job: ExportJob) -> bool:
+        if not self.incremental or not job.revision or self.previous_run_dir is None:
+            return False
+        previous = self.previous_manifest.get(job.file_info["token"])
+        if not previous or previous.get("type") != job.file_info.get("type") or previous.get("revision") != job.revision:
+            return False
+
+        source = self.previous_run_dir / previous["path"]
+        token = job.file_info["token"]
+        mode = "carried"
+        if self.archive is not None:
+            # Shortcuts to one document point at the same previous member: the first of them copies
+            # it, the rest are recorded as shared references to that copy, as in the run that made it.
+            with self._shared_lock:
+                carried = self._carried_members.get(previous["path"])
+                first = carried is None
+                if carried is None:
+                    carried = self._carried_members[previous["path"]] = Future()
+            if first:
+                target = self._reserve_path(job.local_dir / self._carried_name(job, previous), token)
+                if not self._carry_into_archive(previous, source, target, token):
+                    self.names.release(target, token)
+                    carried.set_result(None)
+                    return False
+                carried.set_result(target)
+            else:
+                shared_target = carried.result()
+                if shared_target is None:
+                    return False
+                target, mode = shared_target, "shared"
+        else:
+            try:
+                if source.stat().st_size != previous.get("size"):
+                    return False
+            except OSError:
+                return False
+            if self._same_dir_as_previous_run():
+                target = self._claim_path(source, token)
+            else:
+                target = self._reserve_path(job.local_dir / source.name, token)
+                link_or_copy(source, target)
+
+        hash_algorithm, digest = manifest_digest(previous)
+        self._record_saved(
+            job.file_info,
+            target,
+            previous["size"],
+            digest,
+            mode,
+            revision=job.revision,
+            obj_token=previous.get("obj_token", ""),
+            obj_type=previous.get("obj_type", ""),
+            hash_algorithm=hash_algorithm,
+        )
+        self._incr_stat("unchanged")
+        print(f"[SKIP] Unchanged: {target}")
+        return True
+
+    def _carried_name(self, job: ExportJob, previous: Dict[str, Any]) -> str:
+        # From the document's own listing entry: a shared previous entry's path is another
+        # document's member and carries that document's name.
+        original_name = job.file_info.get("name") or job.file_info["token"]
+        if previous.get("mode") == "downloaded":
+            name = sanitize_filename(original_name)
+            return name if Path(name).suffix else f"{name}.bin"
+        extension = Path(previous["path"]).suffix.lstrip(".")
+        return self.build_export_filename(original_name, extension) if extension else sanitize_filename(original_name)
+
+    def _carry_into_archive(self, previous: Dict[str, Any], source: Path, target: Path, token: str) -> bool:
+        # The previous run may be an archive run (read the member) or a plain one (read the file).
+        assert self.archive is not None
+        try:
+            reader = self.previous_archive.open(previous["path"]) if self.previous_archive is not None else None
+            handle = reader or open(source, "rb")
+        except (OSError, KeyError, zipfile.BadZipFile):
+            return False
+        member = target.relative_to(self.output_dir).as_posix()
+        try:
+            with handle, self.archive.member(member, target.suffix.lower() not in ARCHIVE_STORED_SUFFIXES, token) as out:
+                copied = 0
+                for chunk in iter(lambda: handle.read(DOWNLOAD_CHUNK_BYTES), b""):
+                    out.write(chunk)
+                    copied += len(chunk)
+                if copied != previous.get("size"):
+                    raise FeishuApiError(f"size {copied} != {previous.get('size')}")
+        except (OSError, zipfile.BadZipFile, FeishuApiError) as exc:
+            print(f"[WARN] Cannot carry {previous['path']} from previous run, exporting again: {exc}")
+            return False
+        return True
+
+    def start_pipeline(self) -> None:
+        self._create_executor = ThreadPoolExecutor(max_workers=self.export_workers, thread_name_prefix="export")
+        self._download_executor = ThreadPoolExecutor(max_workers=self.download_workers, thread_name_prefix="download")
+        self._poller = ExportPoller(self._poll_export_job, self.export_poller_threads, self.export_poll_qps)
+        self._poller.start()
+        self.writer.start()
+
+    def drain_pipeline(self) -> None:
+        with self._jobs_cond:
+            while self._jobs_in_flight:
+                self._jobs_cond.wait()
+        if self._poller is not None:
+            self._poller.stop()
+        for executor in (self._create_executor, self._download_executor):
+            if executor is not None:
+                executor.shutdown(wait=True)
+        self.writer.stop()
+        self._poller = None
+        self._create_executor = None
+        self._download_executor = None
+
+    def _job_started(self, source: str = "") -> None:
+        with self._jobs_cond:
+            self._source_waiting[source] = self._source_waiting.get(source, 0) + 1
+            while self._jobs_in_flight >= self.max_inflight_exports or self._over_fair_share(source):
+                self._jobs_cond.wait()
+            self._source_waiting[source] -= 1
+            self._source_in_flight[source] = self._source_in_flight.get(source, 0) + 1
+            self._jobs_in_flight += 1
+
+    def _over_fair_share(self, source: str) -> bool:
+        # Called under _jobs_cond. While another source is waiting for a slot, no source may hold
+        # more than an equal share of MAX_INFLIGHT_EXPORTS; a source running alone may use all of it.
+        if not any(waiting for name, waiting in self._source_waiting.items() if name != source):
+            return False
+        active = {name for name, count in self._source_in_flight.items() if count}
+        active.update(name for name, waiting in self._source_waiting.items() if waiting)
+        share = max(1, self.max_inflight_exports // max(1, len(active)))
+        return self._source_in_flight.get(source, 0) >= share
+
+    def _job_finished(self, job: ExportJob, status: str) -> None:
+        if job.queued_at:
+            self.metrics.observe("phase_seconds", time.monotonic() - job.queued_at, phase="file_total")
+        if self.journal is not None and job.journal_id is not None:
+            self.journal.mark(job.journal_id, status)
+        if job.lease_id is not None:
+            self._settle_lease(job.lease_id)
+        with self._shared_lock:
+            job.outcome = status
+            followers, job.followers = job.followers, []
+        for follower in followers:
+            self._settle_follower(job, follower)
+        with self._jobs_cond:
+            self._jobs_in_flight -= 1
+            self._source_in_flight[job.source] -= 1
+            self._jobs_cond.notify_all()
+
+    def _shared_export_leader(self, job: ExportJob) -> Optional[ExportJob]:
+        # Shortcuts (and the document itself) resolving to one obj_token are exported once per run.
+        if job.file_type == "file":
+            return None
+        # Sources backed up with another account's token only share within that account.
+        tokens = self._source_tokens(job.source) or self.tokens
+        with self._shared_lock:
+            leader = self._shared_exports.setdefault((id(tokens), job.file_token, job.target_ext), job)
+        return None if leader is job else leader
+
+    def _follow_export(self, leader: ExportJob, job: ExportJob) -> None:
+        with self._shared_lock:
+            if not leader.outcome:
+                leader.followers.append(job)
+                return
+        self._settle_follower(leader, job)
+
+    def _settle_follower(self, leader: ExportJob, job: ExportJob) -> None:
+        file_name = job.file_info.get("name", "<unknown>")
+        file_token = job.file_info.get("token", "<unknown>")
+        if leader.outcome != "done" or leader.saved is None:
+            self._record_failure(
+                f"{file_name} ({file_token}) export_error=shared export of {job.file_token} failed",
+                self._job_failure(job, "shared_export", f"shared export of {job.file_token} failed"),
+            )
+            print(f"[ERROR] Failed file: {file_name} ({file_token})")
+            self._job_finished(job, "failed")
+            return
+        source, size, digest = leader.saved
+        try:
+            target = source
+            if job.target_path is not None:
+                link_or_copy(source, job.target_path)
+                target = job.target_path
+            self._record_saved(
+                job.file_info,
+                target,
+                size,
+                digest,
+                "shared",
+                revision=job.revision,
+                obj_token=job.file_token,
+                obj_type=job.file_type,
+            )
+        except Exception as exc:
+            self._record_failure(f"{file_name} ({file_token}) copy_error={exc}", self._job_failure(job, "copy", exc))
+            print(f"[ERROR] Failed file: {file_name} ({file_token})")
+            self._job_finished(job, "failed")
+            return
+        self._incr_stat("shared_exports")
+        print(f"[OK] Shared export: {target}")
+        self._job_finished(job, "done")
+
+    def process_file(
+        self,
+        file_info: Dict[str, Any],
+        local_dir: Path,
+        journal_id: Optional[int] = None,
+        source: str = "",
+        lease_id: Optional[int] = None,
+    ) -> None:
+        if self._create_executor is None:
+            raise RuntimeError("export pipeline is not running, call start_pipeline() first")
+
+        self._incr_stat("files")
+        file_name = file_info.get("name", "<unknown>")
+        file_type = file_info.get("type", "<unknown>")
+        file_token = file_info.get("token", "<unknown>")
+        print(f"[INFO] Processing file: {file_name} (type={file_type}, token={file_token})")
 
-    def query_export_task(self, ticket: str, file_token: str) -> Dict[str, Any]:
-        resp = self._request_json(
-            "GET",
-            f"/drive/v1/export_tasks/{ticket}",
-            params={"token": file_token},
+        self.metrics.incr("source_documents_total", source=source or BACKUP_SOURCE)
+        self._job_started(source)
+        if lease_id is not None:
+            with self._leases_lock:
+                self._leases[lease_id][0] += 1
+        job = ExportJob(
+            file_info=file_info,
+            local_dir=local_dir,
+            journal_id=journal_id,
+            source=source,
+            lease_id=lease_id,
+            queued_at=time.monotonic(),
         )
-        data = resp.get("data") or {}
-        result = data.get("result") or {}
+        entry = (-self._export_cost(job), next(self._export_seq), job)
+        with self._export_queue_lock:
+            heapq.heappush(self._export_queue, entry)
+        try:
+            # Each submission runs whichever queued job is most expensive when a worker frees up.
+            self._create_executor.submit(self._start_next_export)
+        except Exception:
+            with self._export_queue_lock:
+                self._export_queue.remove(entry)
+                heapq.heapify(self._export_queue)
+            self._job_finished(job, "pending")
+            raise
 
-        # Compatibility with possible older schema.
-        if not result and data:
-            result = data
+    def _export_cost(self, job: ExportJob) -> float:
+        # Longest-processing-time-first: starting the slowest exports early keeps one large bitable
+        # listed last from running alone at the end of the run. Ties keep traversal order.
+        if self.export_order != "longest_first":
+            return 0.0
+        listing_type = str(job.file_info.get("type") or "")
+        file_type, revision = listing_type, str(job.file_info.get("modified_time") or "")
+        if listing_type == "wiki":
+            cached = self.wiki_cache.peek(str(job.file_info.get("token") or ""))
+            if cached is not None:
+                file_type, revision = cached[1], cached[2]
+        # Matched the way _carry_forward does: the manifest keeps the listing type ("wiki") and,
+        # for shortcuts, the resolved document's revision.
+        previous = self.previous_manifest.get(job.file_info.get("token") or "")
+        if previous and previous.get("type") == listing_type and previous.get("revision") == revision:
+            # Likely carried forward without an export; clearing it first frees its in-flight slot.
+            return math.inf
+        predicted = self.duration_model.predict(file_type, self._file_size(job))
+        if predicted is None:
+            predicted = EXPORT_COST_DEFAULTS.get(file_type, EXPORT_COST_DEFAULT_SECONDS)
+        return predicted
 
-        return result
+    def _start_next_export(self) -> None:
+        with self._export_queue_lock:
+            _, _, job = heapq.heappop(self._export_queue)
+        self._start_export(job)
 
-    @staticmethod
-    def parse_export_status(result: Dict[str, Any]) -> Tuple[str, str]:
-        if "job_status" in result:
-            status_code = result.get("job_status")
-            if status_code in (1, 2):
-                return "processing", ""
-            if status_code == 0:
-                return "success", ""
-            return "failed", str(result.get("job_error_msg") or f"job_status={status_code}")
+    def _start_export(self, job: ExportJob) -> None:
+        job.phase = "prepare"
+        try:
+            file_info = job.file_info
+            job.file_token = file_info["token"]
+            job.file_type = file_info["type"]
+            original_name = file_info.get("name") or job.file_token
+            job.revision = str(file_info.get("modified_time") or "")
 
-        status = str(result.get("status", "")).lower()
-        if status in {"processing", "running", "queued", "pending"}:
-            return "processing", ""
-        if status in {"success", "succeeded", "done"}:
-            return "success", ""
-        if status in {"failed", "error"}:
-            return "failed", str(result.get("error_msg") or "export failed")
+            if job.file_type == "wiki":
+                # A shortcut's own modified_time does not track edits to the target document.
+                job.phase = "resolve"
+                job.file_token, job.file_type, job.revision = self.resolve_wiki_node(
+                    job.file_token, self._source_tokens(job.source)
+                )
 
-        return "processing", ""
+            if self._carry_forward(job):
+                self._job_finished(job, "done")
+                return
 
-    def wait_for_export(self, ticket: str, file_token: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
-        start = time.time()
-        while True:
-            result = self.query_export_task(ticket, file_token)
-            status, err = self.parse_export_status(result)
+            if job.file_type == "file" and self.export_routes.route(job.file_type, original_name) == "direct":
+                job.phase = "download"
+                self._submit_download(self._direct_download, job)
+                return
 
-            if status == "success":
-                exported_file_token = result.get("file_token")
-                exported_url = None
+            job.target_ext = self.export_extension_for_type(job.file_type)
+            target_name = self.build_export_filename(original_name, job.target_ext)
+            leader = self._shared_export_leader(job)
+            if leader is not None:
+                # Archive runs do not store the document twice; the manifest points at the leader's member.
+                if self.archive is None:
+                    job.target_path = self._target_path(file_info, job.local_dir, target_name, journal_id=job.journal_id)
+                self._follow_export(leader, job)
+                return
+            job.target_path = self._target_path(file_info, job.local_dir, target_name, journal_id=job.journal_id)
 
-                file_info = result.get("file") or {}
-                if not exported_file_token:
-                    exported_file_token = file_info.get("token")
-                exported_url = file_info.get("url") or result.get("url")
+            job.phase = "export_create"
+            with self.metrics.timer("phase_seconds", phase="export_create"):
+                job.ticket = self.create_export_task(
+                    job.file_token, job.file_type, job.target_ext, self._source_tokens(job.source)
+                )
+            job.created_at = time.time()
+            job.next_poll_at = job.created_at + self._first_poll_delay(job)
+        except Exception as exc:
+            self._export_failed(job, exc)
+            return
 
-                file_name = result.get("file_name") or file_info.get("name")
-                return exported_file_token, exported_url, file_name
+        assert self._poller is not None
+        self._poller.add(job)
 
-            if status == "failed":
-                raise FeishuApiError(f"Export task failed: {err}")
+    @staticmethod
+    def _file_size(job: ExportJob) -> Optional[int]:
+        try:
+            return int(job.file_info.get("size") or 0) or None
+        except (TypeError, ValueError):
+            return None
+
+    def _first_poll_delay(self, job: ExportJob) -> float:
+        predicted = self.duration_model.predict(job.file_type, self._file_size(job))
+        if predicted is None:
+            return POLL_INITIAL_DELAY_SECONDS
+        return min(POLL_MAX_INTERVAL_SECONDS, max(0.2, predicted * 0.8))
+
+    def _next_poll_delay(self, job: ExportJob) -> float:
+        # Exponential backoff with equal jitter, so tickets created together do not poll in lockstep.
+        base = min(POLL_MAX_INTERVAL_SECONDS, self.poll_interval_seconds * (2 ** (job.polls - 1)))
+        return base / 2 + random.uniform(0, base / 2)
 
-            if time.time() - start > self.max_export_wait_seconds:
+    def _poll_export_job(self, job: ExportJob) -> bool:
+        job.polls += 1
+        job.phase = "export_wait"
+        self._incr_stat("export_polls")
+        try:
+            result = self.query_export_task(job.ticket, job.file_token, self._source_tokens(job.source))
+            status, err = self.parse_export_status(result)
+            if status == "failed":
+                # job_status doubles as the error code, so a rejected export is told apart from an outage.
+                raise FeishuApiError(f"Export task failed: {err}", code=result.get("job_status"))
+            if status != "success" and time.time() - job.created_at > self.max_export_wait_seconds:
                 raise FeishuApiError(
-                    f"Export task timeout after {self.max_export_wait_seconds}s (ticket={ticket})"
+                    f"Export task timeout after {self.max_export_wait_seconds}s (ticket={job.ticket})"
                 )
+        except Exception as exc:
+            self._export_failed(job, exc)
+            return True
 
-            time.sleep(self.poll_interval_seconds)
-
-    def download_export_file(self, exported_file_token: Optional[str], exported_url: Optional[str]) -> requests.Response:
-        if exported_file_token:
-            return self._request_binary(
-                "GET",
-                f"/drive/v1/export_tasks/file/{exported_file_token}/download",
-            )
-        if exported_url:
-            # Some older responses may return a direct download URL.
-            return self._request_binary(
-                "GET",
-                exported_url,
-                absolute_url=True,
-                include_auth=False,
-            )
-        raise FeishuApiError("No exported file token or URL returned")
+        if status != "success":
+            job.next_poll_at = time.time() + self._next_poll_delay(job)
+            return False
 
-    def download_regular_file(self, file_token: str) -> requests.Response:
-        return self._request_binary("GET", f"/drive/v1/files/{file_token}/download")
+        waited = time.time() - job.created_at
+        self.duration_model.observe(job.file_type, self._file_size(job), waited)
+        self.metrics.observe("phase_seconds", waited, phase="export_wait")
 
-    @staticmethod
-    def build_export_filename(original_name: str, extension: str) -> str:
-        sanitized = sanitize_filename(original_name)
-        suffix = f".{extension.lower()}"
+        exported_file_token, exported_url, _ = self.extract_export_file(result)
+        self._submit_download(self._download_export, job, exported_file_token, exported_url)
+        return True
 
-        # Keep clean names like "foo.docx" instead of "foo.docx.docx".
-        if sanitized.lower().endswith(suffix):
-            return sanitized
+    def _submit_download(self, fn: Callable[..., None], job: ExportJob, *args: Any) -> None:
+        assert self._download_executor is not None
+        try:
+            self._download_executor.submit(fn, job, *args)
+        except Exception as exc:
+            self._record_failure(
+                f"{job.file_info.get('name')} ({job.file_info.get('token')}) download_error={exc}",
+                self._job_failure(job, "download", exc),
+            )
+            self._job_finished(job, "failed")
 
-        stem = Path(sanitized).stem if Path(sanitized).suffix else sanitized
-        return f"{stem}{suffix}"
+    def _download_export(self, job: ExportJob, exported_file_token: Optional[str], exported_url: Optional[str]) -> None:
+        job.phase = "download"
+        try:
+            assert job.target_path is not None
+            with self.metrics.timer("download_seconds", type=job.file_type):
+                size, digest = self.save_download(
+                    lambda range_header: self.download_export_file(
+                        exported_file_token, exported_url, range_header, self._source_tokens(job.source)
+                    ),
+                    job.target_path,
+                    token=job.file_info["token"],
+                )
+            self.metrics.incr("download_bytes_total", size, type=job.file_type)
+            job.saved = (job.target_path, size, digest)
+            self._record_saved(
+                job.file_info,
+                job.target_path,
+                size,
+                digest,
+                "exported",
+                revision=job.revision,
+                obj_token=job.file_token,
+                obj_type=job.file_type,
+            )
+            self._incr_stat("exported")
+            print(f"[OK] Exported: {job.target_path}")
+        except Exception as exc:
+            self._export_failed(job, exc, downloading=True)
+        else:
+            self._job_finished(job, "done")
 
     @staticmethod
-    def stream_to_file(response: requests.Response, path: Path) -> None:
-        path.parent.mkdir(parents=True, exist_ok=True)
-        with open(path, "wb") as handle:
-            for chunk in response.iter_content(chunk_size=1024 * 256):
-                if chunk:
-                    handle.write(chunk)
+    def _export_rejected(error: Exception) -> bool:
+        # Only a definite answer from the API counts against a route, not throttling or outages.
+        return (
+            isinstance(error, FeishuApiError)
+            and error.code is not None
+            and error.code not in RETRYABLE_API_CODES
+            and error.http_status not in RETRYABLE_HTTP_STATUS
+        )
 
-    def export_and_save(self, file_info: Dict[str, Any], local_dir: Path) -> None:
-        file_token = file_info["token"]
-        file_type = file_info["type"]
-        original_name = file_info.get("name") or file_token
+    def _export_failed(self, job: ExportJob, export_error: Exception, downloading: bool = False) -> None:
+        file_name = job.file_info.get("name", "<unknown>")
+        file_token = job.file_info.get("token", "<unknown>")
+        if job.file_type == "file" and job.phase in {"export_create", "export_wait"} and self._export_rejected(export_error):
+            self.export_routes.observe_export(job.file_type, job.file_info.get("name") or "", ok=False)
+        if job.file_info.get("type") == "file":
+            if downloading:
+                self._fallback_download(job, export_error)
+            else:
+                self._submit_download(self._fallback_download, job, export_error)
+            return
 
-        if file_type == "wiki":
-            file_token, file_type = self.resolve_wiki_node(file_token)
+        self._record_failure(
+            f"{file_name} ({file_token}) export_error={export_error}", self._job_failure(job, job.phase, export_error)
+        )
+        print(f"[ERROR] Failed file: {file_name} ({file_token})")
+        self._job_finished(job, "failed")
 
-        target_ext = self.export_extension_for_type(file_type)
-        target_name = self.build_export_filename(original_name, target_ext)
-        target_path = unique_path(local_dir / target_name)
+    def _direct_download(self, job: ExportJob) -> None:
+        # Routed past the export: this (type, extension) pair has only ever been rejected by it.
+        file_name = job.file_info.get("name", "<unknown>")
+        file_token = job.file_info.get("token", "<unknown>")
+        try:
+            self.direct_download_and_save(
+                job.file_info,
+                job.local_dir,
+                journal_id=job.journal_id,
+                tokens=self._source_tokens(job.source),
+                fallback=False,
+            )
+        except Exception as exc:
+            self._record_failure(f"{file_name} ({file_token}) download_error={exc}", self._job_failure(job, "download", exc))
+            print(f"[ERROR] Failed file: {file_name} ({file_token})")
+            self._job_finished(job, "failed")
+        else:
+            self.export_routes.observe_download(job.file_type, job.file_info.get("name") or "")
+            self._job_finished(job, "done")
 
-        ticket = self.create_export_task(file_token, file_type, target_ext)
-        exported_file_token, exported_url, _ = self.wait_for_export(ticket, file_token)
-        response = self.download_export_file(exported_file_token, exported_url)
-        self.stream_to_file(response, target_path)
-        self.stats["exported"] += 1
-        print(f"[OK] Exported: {target_path}")
+    def _fallback_download(self, job: ExportJob, export_error: Exception) -> None:
+        file_name = job.file_info.get("name", "<unknown>")
+        file_token = job.file_info.get("token", "<unknown>")
+        try:
+            self.direct_download_and_save(
+                job.file_info, job.local_dir, journal_id=job.journal_id, tokens=self._source_tokens(job.source)
+            )
+        except Exception as download_error:
+            record = self._job_failure(job, "fallback_download", download_error)
+            record["export_error"] = str(export_error)
+            self._record_failure(
+                f"{file_name} ({file_token}) export_error={export_error}; download_error={download_error}", record
+            )
+            print(f"[ERROR] Failed file: {file_name} ({file_token})")
+            self._job_finished(job, "failed")
+        else:
+            self._job_finished(job, "done")
 
-    def direct_download_and_save(self, file_info: Dict[str, Any], local_dir: Path) -> None:
+    def direct_download_and_save(
+        self,
+        file_info: Dict[str, Any],
+        local_dir: Path,
+        journal_id: Optional[int] = None,
+        tokens: Optional[AccessTokenManager] = None,
+        fallback: bool = True,
+    ) -> None:
         file_token = file_info["token"]
         original_name = sanitize_filename(file_info.get("name") or file_token)
         if not Path(original_name).suffix:
             original_name = f"{original_name}.bin"
-        target_path = unique_path(local_dir / original_name)
+        target_path = self._target_path(file_info, local_dir, original_name, journal_id=journal_id)
+
+        modified_time = str(file_info.get("modified_time") or "")
+        with self.metrics.timer("download_seconds", type="file"):
+            size, digest = self.save_download(
+                lambda range_header: self.download_regular_file(file_token, range_header, tokens),
+                target_path,
+                resume_after=float(modified_time) if modified_time.isdigit() else None,
+                allow_segments=True,
+                token=file_token,
+            )
+        self.metrics.incr("download_bytes_total", size, type="file")
+        self._record_saved(
+            file_info,
+            target_path,
+            size,
+            digest,
+            "downloaded",
+            revision=str(file_info.get("modified_time") or ""),
+        )
+        if fallback:
+            self._incr_stat("fallback_downloaded")
+            print(f"[WARN] Fallback direct download (non-PDF): {target_path}")
+        else:
+            self._incr_stat("direct_downloaded")
+            print(f"[OK] Downloaded: {target_path}")
 
-        response = self.download_regular_file(file_token)
-        self.stream_to_file(response, target_path)
-        self.stats["fallback_downloaded"] += 1
-        print(f"[WARN] Fallback direct download (non-PDF): {target_path}")
+    def _folder_page_entries(self, items: List[Dict[str, Any]], local_dir: Path) -> List[TraversalEntry]:
+        entries: List[TraversalEntry] = []
+        for file_info in items:
+            if file_info.get("type") == "folder":
+                file_name = file_info.get("name") or file_info.get("token") or "untitled"
+                self._incr_stat("folders")
+                subfolder = self._reserve_path(local_dir / sanitize_filename(file_name), file_info.get("token") or "")
+                entries.append(TraversalEntry("folder", file_info.get("token") or "", file_info, subfolder))
+                continue
+            entries.append(TraversalEntry("file", file_info.get("token") or "", file_info, local_dir))
+        return entries
 
-    def process_file(self, file_info: Dict[str, Any], local_dir: Path) -> None:
-        self.stats["files"] += 1
+    def _library_page_entries(
+        self, nodes: List[Dict[str, Any]], local_dir: Path, source: str = ""
+    ) -> List[TraversalEntry]:
+        entries: List[TraversalEntry] = []
+        for node in nodes:
+            node_name = node.get("title") or node.get("obj_token") or "untitled"
+            node_token = node.get("node_token") or "<unknown>"
 
-        file_name = file_info.get("name", "<unknown>")
-        file_type = file_info.get("type", "<unknown>")
-        file_token = file_info.get("token", "<unknown>")
+            try:
+                file_info = self.library_node_to_file_info(node)
+                entries.append(TraversalEntry("file", file_info["token"], file_info, local_dir))
+            except Exception as exc:
+                self._record_failure(
+                    f"{node_name} ({node_token}) node_error={exc}",
+                    self._failure_record("node", node, local_dir, source, "node", exc),
+                )
+                print(f"[ERROR] Failed node: {node_name} ({node_token})")
 
-        print(f"[INFO] Processing file: {file_name} (type={file_type}, token={file_token})")
+            if not node.get("has_child"):
+                continue
 
-        try:
-            self.export_and_save(file_info, local_dir)
-        except Exception as export_error:
-            if file_type == "file":
-                try:
-                    self.direct_download_and_save(file_info, local_dir)
-                    return
-                except Exception as download_error:
-                    self.stats["failed"] += 1
-                    self.failures.append(
-                        f"{file_name} ({file_token}) export_error={export_error}; download_error={download_error}"
-                    )
-                    print(f"[ERROR] Failed file: {file_name} ({file_token})")
-                    return
+            child_parent_token = node.get("node_token")
+            if not child_parent_token:
+                self._record_failure(
+                    f"{node_name} ({node_token}) missing node_token for child traversal",
+                    self._failure_record(
+                        "node", node, local_dir, source, "list", "missing node_token", retryable=False
+                    ),
+                )
+                print(f"[ERROR] Failed node child traversal: {node_name} ({node_token})")
+                continue
 
-            self.stats["failed"] += 1
-            self.failures.append(f"{file_name} ({file_token}) export_error={export_error}")
-            print(f"[ERROR] Failed file: {file_name} ({file_token})")
+            self._incr_stat("folders")
+            subfolder = self._reserve_path(local_dir / sanitize_filename(node_name), child_parent_token)
+            entries.append(TraversalEntry("library", child_parent_token, node, subfolder))
+        return entries
+
+    def _walk_container(
+        self,
+        key: str,
+        local_dir: Path,
+        fetch_page: Callable[[Optional[str]], Tuple[List[Dict[str, Any]], bool, Optional[str]]],
+        to_entries: Callable[[List[Dict[str, Any]], Path], List[TraversalEntry]],
+        missing_token_warn: str,
+        signature: str = "",
+        source: str = "",
+        lease_id: Optional[int] = None,
+    ) -> None:
+        if self.archive is None and not self.planning:
+            local_dir.mkdir(parents=True, exist_ok=True)
+        cursor: Optional[str] = None
+        if self.journal is not None:
+            cursor, listed = self.journal.container(key)
+            # Replay what an interrupted run already listed before touching the API again.
+            for entry in self.journal.entries(key, source):
+                self._dispatch_entry(entry)
+            if listed:
+                return
+
+        if self.listing_index is not None and self.reuse_listing_index and cursor is None:
+            cached = self.listing_index.lookup(key, signature)
+            if cached is not None:
+                self._incr_stat("listings_cached")
+                entries = self._tag_source(to_entries(cached, local_dir), source, lease_id)
+                if self.journal is not None:
+                    self.journal.record_page(key, entries, None)
+                self._dispatch_entries(entries)
+                return
+
+        def timed_page(page_token: Optional[str]) -> Tuple[List[Dict[str, Any]], bool, Optional[str]]:
+            # Timed per page: dispatching a page can block on the in-flight limit, which is not listing time.
+            with self.metrics.timer("phase_seconds", phase="list_page"):
+                return fetch_page(page_token)
+
+        self._incr_stat("listings_fetched")
+        listed_items: List[Dict[str, Any]] = []
+        for items, next_cursor in self._iter_pages(timed_page, missing_token_warn, start_page_token=cursor):
+            listed_items.extend(items)
+            entries = self._tag_source(to_entries(items, local_dir), source, lease_id)
+            if self.journal is not None:
+                self.journal.record_page(key, entries, next_cursor)
+            self._dispatch_entries(entries)
+        # A listing resumed from a saved cursor is missing its first pages; do not cache it.
+        if self.listing_index is not None and cursor is None:
+            self.listing_index.store(key, signature, listed_items)
+
+    @staticmethod
+    def _tag_source(entries: List[TraversalEntry], source: str, lease_id: Optional[int] = None) -> List[TraversalEntry]:
+        for entry in entries:
+            entry.source = source
+            entry.lease_id = lease_id
+        return entries
+
+    def _dispatch_entries(self, entries: List[TraversalEntry]) -> None:
+        if self.work_queue is not None:
+            # Sub-containers of a leased container become leases of their own, one transaction per page.
+            containers = [entry for entry in entries if entry.kind in {"folder", "library"}]
+            self.work_queue.add([(self._container_key(entry), entry) for entry in containers], self.output_dir)
+            entries = [entry for entry in entries if entry.kind not in {"folder", "library"}]
+        for entry in entries:
+            self._dispatch_entry(entry)
+
+    def _dispatch_entry(self, entry: TraversalEntry) -> None:
+        if entry.kind in {"folder", "library"}:
+            self._enqueue_container(entry)
+        elif self.planning:
+            self._plan_file(entry.info)
+        elif entry.status == "done":
+            self._incr_stat("resumed_done")
+        else:
+            self.process_file(
+                entry.info, entry.local_dir, journal_id=entry.id, source=entry.source, lease_id=entry.lease_id
+            )
+
+    def _enqueue_container(self, entry: TraversalEntry) -> None:
+        with self._containers_cond:
+            self._containers_pending += 1
+        self._containers.put(entry.source, entry)
+
+    def _expand_container(self, entry: TraversalEntry) -> None:
+        token = entry.token or None
+        source = self.sources.get(entry.source) or BackupSource(entry.source, "drive")
+        tokens = source.tokens
+        signature = str(entry.info.get("modified_time") or entry.info.get("obj_edit_time") or "")
+        if entry.kind == "folder":
+            if token:
+                print(f"[INFO] Enter folder: {entry.local_dir}")
+            self._walk_container(
+                self._container_key(entry),
+                entry.local_dir,
+                fetch_page=lambda page_token: self.list_folder_files(token, page_token, tokens),
+                to_entries=self._folder_page_entries,
+                missing_token_warn=FOLDER_MISSING_TOKEN_WARN,
+                signature=signature,
+                source=entry.source,
+                lease_id=entry.lease_id,
+            )
+            return
+
+        if token:
+            print(f"[INFO] Enter {'wiki' if source.space_id else 'my_library'} node: {entry.local_dir}")
+        self._walk_container(
+            self._container_key(entry),
+            entry.local_dir,
+            fetch_page=lambda page_token: self.list_wiki_nodes(
+                source.space_id or MY_LIBRARY_SPACE_ID, token, page_token, tokens
+            ),
+            to_entries=lambda nodes, local_dir: self._library_page_entries(nodes, local_dir, entry.source),
+            missing_token_warn=LIBRARY_MISSING_TOKEN_WARN,
+            signature=signature,
+            source=entry.source,
+            lease_id=entry.lease_id,
+        )
+
+    def _container_key(self, entry: TraversalEntry) -> str:
+        source = self.sources.get(entry.source) or BackupSource(entry.source, "drive")
+        return f"{source.key_prefix}{entry.kind}:{entry.token}"
+
+    def _record_listing_failure(self, entry: TraversalEntry, error: Exception) -> None:
+        record = self._failure_record(entry.kind, entry.info, entry.local_dir, entry.source, "list", error)
+        record["token"] = entry.token
+        self._record_failure(f"{entry.local_dir} ({entry.token or 'root'}) listing_error={error}", record)
+        print(f"[ERROR] Failed listing: {entry.local_dir} ({entry.token or 'root'})")
+
+    def _lister_loop(self) -> None:
+        while True:
+            entry = self._containers.get()
+            if entry is None:
+                return
+            try:
+                self._expand_container(entry)
+            except Exception as exc:
+                # The container stays unlisted in the journal, so --resume retries it.
+                self._record_listing_failure(entry, exc)
+            finally:
+                with self._containers_cond:
+                    self._containers_pending -= 1
+                    self._containers_cond.notify_all()
+
+    def traverse(self, roots: List[TraversalEntry]) -> None:
+        # Iterative, breadth-first expansion: listers pull containers from the queue, stream
+        # files into the export pipeline and push sub-containers back, so tree depth never
+        # turns into Python recursion depth. With several sources the queue hands out their
+        # containers round-robin, so one large tree cannot starve the others' listing.
+        self._containers = FairQueue()
+        listers = [
+            threading.Thread(target=self._lister_loop, name=f"lister-{index}", daemon=True)
+            for index in range(self.lister_workers)
+        ]
+        for lister in listers:
+            lister.start()
+        for root in roots:
+            self._enqueue_container(root)
+        with self._containers_cond:
+            while self._containers_pending:
+                self._containers_cond.wait()
+        self._containers.close()
+        for lister in listers:
+            lister.join()
 
     def process_folder(self, folder_token: Optional[str], local_dir: Path) -> None:
-        local_dir.mkdir(parents=True, exist_ok=True)
-
-        for file_info in self.iter_folder_files(folder_token):
-            file_type = file_info.get("type")
-            file_name = file_info.get("name") or file_info.get("token") or "untitled"
-            safe_name = sanitize_filename(file_name)
-
-            if file_type == "folder":
-                self.stats["folders"] += 1
-                subfolder = unique_path(local_dir / safe_name)
-                print(f"[INFO] Enter folder: {subfolder}")
-                self.process_folder(file_info.get("token"), subfolder)
-                continue
+        self.traverse([TraversalEntry("folder", folder_token or "", {}, local_dir)])
+
+    def process_my_library(self, local_dir: Path) -> None:
+        self.traverse([TraversalEntry("library", "", {}, local_dir)])
 
-            self.process_file(file_info, local_dir)
+    def _settle_lease(self, lease_id: int, listed: bool = False, failed: bool = False) -> None:
+        # Called as each file of a leased container finishes, and once more (listed=True) when its
+        # listing is done. The lease completes when both have happened for every file.
+        assert self.work_queue is not None
+        with self._leases_lock:
+            state = self._leases[lease_id]
+            if listed:
+                state[1], state[2] = 1, int(failed)
+            else:
+                state[0] -= 1
+            if not state[1] or state[0]:
+                return
+            del self._leases[lease_id]
+        if not self.work_queue.complete(lease_id, self.worker_id, "failed" if state[2] else "done"):
+            print(f"[WARN] Lease {lease_id} expired before it was completed; another worker redoes it")
 
-    def process_my_library_node(self, node: Dict[str, Any], local_dir: Path) -> None:
-        node_name = node.get("title") or node.get("obj_token") or "untitled"
-        node_token = node.get("node_token") or "<unknown>"
-        safe_name = sanitize_filename(node_name)
+    def _queue_lister_loop(self) -> None:
+        assert self.work_queue is not None
+        while not self._queue_drained.is_set():
+            try:
+                entry = self.work_queue.claim(self.worker_id, self.output_dir)
+            except sqlite3.Error as exc:
+                print(f"[WARN] Cannot lease from work queue, retrying: {exc}")
+                self._queue_drained.wait(WORK_QUEUE_POLL_SECONDS)
+                continue
+            if entry is None:
+                # Containers leased elsewhere may still add sub-containers; stop once nothing is left.
+                if not self.work_queue.unfinished():
+                    self._queue_drained.set()
+                self._queue_drained.wait(WORK_QUEUE_POLL_SECONDS)
+                continue
+            assert entry.lease_id is not None
+            with self._leases_lock:
+                if entry.lease_id in self._leases:
+                    continue  # our own lease, expired while still in progress; claiming it renewed it
+                self._leases[entry.lease_id] = [0, 0, 0]
+            failed = False
+            try:
+                self._expand_container(entry)
+            except Exception as exc:
+                failed = True
+                self._record_listing_failure(entry, exc)
+            finally:
+                self._settle_lease(entry.lease_id, listed=True, failed=failed)
 
+    def _heartbeat(self, status: str) -> None:
+        assert self.work_queue is not None
+        with self._leases_lock:
+            held = list(self._leases)
         try:
-            file_info = self.library_node_to_file_info(node)
-            self.process_file(file_info, local_dir)
-        except Exception as exc:
-            self.stats["failed"] += 1
-            self.failures.append(f"{node_name} ({node_token}) node_error={exc}")
-            print(f"[ERROR] Failed node: {node_name} ({node_token})")
+            for lease_id in self.work_queue.renew(self.worker_id, held):
+                print(f"[WARN] Lease {lease_id} was handed to another worker while still in progress")
+            self.work_queue.heartbeat(self.worker_id, status, self.stats["files"], self.stats["failed"])
+        except sqlite3.Error as exc:
+            print(f"[WARN] Cannot renew leases in work queue: {exc}")
 
-        if not node.get("has_child"):
-            return
+    def _heartbeat_loop(self, stop: threading.Event) -> None:
+        while not stop.wait(WORK_LEASE_SECONDS / 4):
+            self._heartbeat("running")
 
-        child_parent_token = node.get("node_token")
-        if not child_parent_token:
-            self.stats["failed"] += 1
-            self.failures.append(f"{node_name} ({node_token}) missing node_token for child traversal")
-            print(f"[ERROR] Failed node child traversal: {node_name} ({node_token})")
+    def traverse_queue(self) -> None:
+        # Distributed counterpart of traverse(): the listers lease containers from the shared
+        # queue until no container of the run is pending or leased by any worker.
+        self._queue_drained.clear()
+        listers = [
+            threading.Thread(target=self._queue_lister_loop, name=f"lister-{index}", daemon=True)
+            for index in range(self.lister_workers)
+        ]
+        for lister in listers:
+            lister.start()
+        for lister in listers:
+            lister.join()
+
+    def _plan_file(self, file_info: Dict[str, Any]) -> None:
+        file_type = str(file_info.get("type") or "<unknown>")
+        size = self._file_size(ExportJob(file_info=file_info, local_dir=self.output_dir))
+        revision = str(file_info.get("modified_time") or "")
+        previous = self.previous_manifest.get(file_info.get("token") or "")
+        # Same test as _carry_forward, minus the check that the previous copy is still on disk.
+        unchanged = bool(
+            self.incremental
+            and revision
+            and previous
+            and previous.get("type") == file_type
+            and previous.get("revision") == revision
+        )
+        predicted = self.duration_model.predict(file_type, size)
+        with self._stats_lock:
+            self.stats["files"] += 1
+            totals = self.plan_types.setdefault(file_type, [0, 0, 0, 0.0])
+            totals[0] += 1
+            if unchanged:
+                self.stats["plan_unchanged"] += 1
+                return
+            totals[1] += 1
+            totals[2] += size or 0
+            totals[3] += predicted or 0.0
+
+    def _configured_sources(self) -> List[BackupSource]:
+        if not self.sources:
+            for spec in source_specs():
+                kind, space_id = parse_source(spec["source"])
+                name = source_dir_name(spec)
+                self.sources[name] = BackupSource(name, kind, space_id)
+        return list(self.sources.values())
+
+    def _source_roots(self) -> List[TraversalEntry]:
+        roots: List[TraversalEntry] = []
+        for source in self._configured_sources():
+            local_dir = self._claim_path(self.output_dir / source.name, source.name) if source.name else self.output_dir
+            if source.kind == "drive":
+                print(f"[INFO] Source {source.name or BACKUP_SOURCE}: drive homepage -> {local_dir}")
+                roots.append(TraversalEntry("folder", "", {}, local_dir, source=source.name))
+            else:
+                print(f"[INFO] Source {source.name or BACKUP_SOURCE}: wiki (space_id={source.space_id}) -> {local_dir}")
+                roots.append(TraversalEntry("library", "", {}, local_dir, source=source.name))
+        return roots
+
+    def print_source_summary(self) -> None:
+        if len(self.sources) < 2:
             return
+        documents = {dict(labels)["source"]: count for labels, count in self.metrics.counters("source_documents_total").items()}
+        for name in self.sources:
+            print(f"- source {name}: {documents.get(name, 0):.0f} documents")
 
-        self.stats["folders"] += 1
-        subfolder = unique_path(local_dir / safe_name)
-        print(f"[INFO] Enter my_library node: {subfolder}")
-        subfolder.mkdir(parents=True, exist_ok=True)
-        for child_node in self.iter_my_library_nodes(parent_node_token=child_parent_token):
-            self.process_my_library_node(child_node, subfolder)
+    def plan(self) -> int:
+        # Listing-only run: walks the tree (reusing fresh cached listings) and reports what a
+        # backup would export, without creating export tasks or writing any output.
+        self.planning = True
+        self.reuse_listing_index = self.listing_index is not None
+        print(f"[INFO] Plan Feishu backup, lister_workers={self.lister_workers}")
+        if self.incremental and self.previous_run_dir is not None:
+            self.previous_manifest = BackupManifest.load(self.previous_run_dir / MANIFEST_FILENAME)
+        self.traverse(self._source_roots())
 
-    def process_my_library(self, local_dir: Path) -> None:
-        local_dir.mkdir(parents=True, exist_ok=True)
-        for root_node in self.iter_my_library_nodes(parent_node_token=None):
-            self.process_my_library_node(root_node, local_dir)
-
-    def run(self) -> int:
-        print(f"[INFO] Start Feishu backup, source={BACKUP_SOURCE}")
-        if BACKUP_SOURCE == "drive":
-            print("[INFO] Source mode: drive homepage")
-            self.process_folder(folder_token=None, local_dir=self.output_dir)
-        else:
-            print(f"[INFO] Source mode: my_library (space_id={MY_LIBRARY_SPACE_ID})")
-            self.process_my_library(local_dir=self.output_dir)
+        to_export = sum(int(totals[1]) for totals in self.plan_types.values())
+        to_export_bytes = sum(int(totals[2]) for totals in self.plan_types.values())
+        predicted_seconds = sum(totals[3] for totals in self.plan_types.values())
+        print("\n[PLAN]")
+        print(f"Folders: {self.stats['folders']}")
+        print(
+            f"Listings fetched: {self.stats['listings_fetched']}, "
+            f"reused from index: {self.stats['listings_cached']}"
+        )
+        print(f"Documents: {self.stats['files']}")
+        for file_type, totals in sorted(self.plan_types.items()):
+            print(f"- {file_type}: {int(totals[0])} documents, {int(totals[1])} to export, {int(totals[2])} bytes")
+        if self.incremental:
+            print(f"Unchanged since previous run: {self.stats['plan_unchanged']}")
+        print(f"To export: {to_export} documents, {to_export_bytes} bytes (listed sizes)")
+        print(f"Predicted export time: {predicted_seconds:.0f}s summed over documents with export history")
+        if self.failures:
+            print("\n[FAILED LIST]")
+            for item in self.failures:
+                print(f"- {item}")
+            return 2
+        return 0
+
+    def register_gauges(self) -> None:
+        self.metrics.gauge("jobs_in_flight", lambda: self._jobs_in_flight)
+        self.metrics.gauge("access_token_expires_in_seconds", lambda: min(self.tokens.expires_in(), 1e9))
+        self.metrics.gauge("containers_pending", lambda: self._containers_pending)
+        self.metrics.gauge("export_create_queued", lambda: len(self._export_queue))
+        self.metrics.gauge("write_buffer_bytes", self.writer.queued_bytes)
+        self.metrics.gauge("write_stalls", lambda: self.writer.stalls)
+        self.metrics.gauge("export_tickets_pending", lambda: self._poller.pending() if self._poller is not None else 0)
+        for family in RATE_LIMITS:
+            self.metrics.gauge(
+                "rate_limit_per_second",
+                lambda family=family: self.rate_limiter.snapshot().get(family, (0.0, 0))[0],
+                family=family,
+            )
+        for key in ("files", "exported", "fallback_downloaded", "unchanged", "shared_exports", "failed"):
+            self.metrics.gauge("run_files", lambda key=key: self.stats[key], stat=key)
+
+    def print_metrics_summary(self, metrics_path: Path) -> None:
+        elapsed = max(time.time() - self.metrics.started_at, 1e-6)
+        print(f"Elapsed: {elapsed:.1f}s, metrics: {metrics_path}")
+        for labels, summary in sorted(self.metrics.histograms("phase_seconds").items()):
+            print(
+                f"- phase {dict(labels)['phase']}: n={summary['count']} avg={summary['avg']:.2f}s "
+                f"p50={summary['p50']:.2f}s p95={summary['p95']:.2f}s max={summary['max']:.2f}s"
+            )
+        downloaded = self.metrics.counters("download_bytes_total")
+        for labels, summary in sorted(self.metrics.histograms("download_seconds").items()):
+            size = downloaded.get(labels, 0)
+            busy = summary["sum"] or 1e-6
+            print(
+                f"- download {dict(labels)['type']}: n={summary['count']} {size / 1024 / 1024:.1f} MiB, "
+                f"{size / busy / 1024 / 1024:.2f} MiB/s per stream, p95={summary['p95']:.2f}s"
+            )
+        requests_total = sum(self.metrics.counters("requests_total").values())
+        retries = sum(self.metrics.counters("retries_total").values())
+        throttled = sum(self.metrics.counters("throttled_total").values())
+        print(f"API requests: {requests_total:.0f} ({retries:.0f} retries, {throttled:.0f} throttled)")
+        if self.trace_requests:
+            print(f"Request trace: {self._run_file(TRACE_FILENAME)} (python3 replay_trace.py --analyze <trace>)")
+
+    def close(self) -> None:
+        self.api_session.close()
+        self.download_session.close()
+
+    def retry_failed(self, records: List[Dict[str, Any]]) -> None:
+        # Re-processes items from a previous failure log into the same run dir: files and library
+        # nodes go straight into the export pipeline, containers whose listing failed are listed again.
+        self._configured_sources()
+        containers: List[TraversalEntry] = []
+        for record in records:
+            local_dir = self.output_dir / record.get("local_dir", "")
+            source = record.get("source", "")
+            info = record.get("info") or {}
+            if record.get("kind") in {"folder", "library"}:
+                containers.append(TraversalEntry(record["kind"], record.get("token", ""), info, local_dir, source=source))
+                continue
+            try:
+                file_info = self.library_node_to_file_info(info) if record.get("kind") == "node" else info
+            except Exception as exc:
+                self._record_failure(
+                    f"{record.get('name')} ({record.get('token')}) node_error={exc}",
+                    self._failure_record("node", info, local_dir, source, "node", exc),
+                )
+                continue
+            self.process_file(file_info, local_dir, source=source)
+        if containers:
+            self.traverse(containers)
+
+    def open_failure_log(self) -> None:
+        self.failure_log_path = self._run_file(FAILURES_FILENAME)
+        self.failure_log = FailureLog(self.failure_log_path)
+
+    def close_failure_log(self) -> None:
+        if self.failure_log is not None:
+            self.failure_log.close()
+            self.failure_log = None
 
+    def open_trace(self) -> None:
+        if self.trace_requests:
+            self.trace = RequestTrace(self._run_file(TRACE_FILENAME))
+
+    def close_trace(self) -> None:
+        if self.trace is not None:
+            trace, self.trace = self.trace, None
+            trace.close()
+
+    def run(self, retry: Optional[List[Dict[str, Any]]] = None) -> int:
+        # retry: records from take_failed_records(); only those items are processed, into output_dir.
+        print(
+            f"[INFO] {'Retry failed items of' if retry is not None else 'Start'} Feishu backup, "
+            f"lister_workers={self.lister_workers}, export_workers={self.export_workers}, "
+            f"download_workers={self.download_workers}, poll_qps={self.export_poll_qps}"
+        )
+        if retry is not None:
+            # Keeps the existing manifest lines and archive volumes, like a resumed run.
+            self.resuming = True
+        self.open_journal()
+        self.open_archive()
+        self.open_manifest()
+        self.open_failure_log()
+        self.open_trace()
+        metrics_path = self._run_file(METRICS_FILENAME)
+        self.register_gauges()
+        self.start_pipeline()
+        if self.metrics_textfile is not None:
+            self.metrics.start_textfile(self.metrics_textfile, self.metrics_interval_seconds)
+        try:
+            if retry is not None:
+                self.retry_failed(retry)
+            else:
+                self.traverse(self._source_roots())
+        finally:
+            self.drain_pipeline()
+            self.close_archive()
+            self.close_manifest()
+            self.close_failure_log()
+            if self.path_map_file is not None:
+                save_path_map(self.path_map_file, self.names.mapping(keep_unseen=bool(self.failures) or retry is not None))
+            self.duration_model.save()
+            self.export_routes.save()
+            self.wiki_cache.save()
+            if self.journal is not None:
+                self.journal.close()
+            self.metrics.write_json(metrics_path)
+            if self.metrics_textfile is not None:
+                self.metrics.stop_textfile(self.metrics_textfile)
+            self.close_trace()
+        return self.print_summary(metrics_path, retry is not None)
+
+    def print_summary(self, metrics_path: Path, retry: bool = False) -> int:
         print("\n[SUMMARY]")
         print(f"Output dir: {self.output_dir}")
         print(f"Folders visited: {self.stats['folders']}")
+        if self.reuse_listing_index:
+            print(f"Listings reused from index: {self.stats['listings_cached']}")
         print(f"Files processed: {self.stats['files']}")
+        self.print_source_summary()
         print(f"Exported files: {self.stats['exported']}")
         print(f"Fallback downloaded files: {self.stats['fallback_downloaded']}")
+        direct_pairs = self.export_routes.direct_pairs()
+        if self.stats["direct_downloaded"] or direct_pairs:
+            print(
+                f"Direct downloads (export skipped): {self.stats['direct_downloaded']}, "
+                f"learned download-only: {', '.join(direct_pairs) or '-'}"
+            )
+        if self.archive is not None:
+            print(f"Archive volumes: {self.archive.volumes}")
+        if self.incremental:
+            print(f"Unchanged files (carried forward): {self.stats['unchanged']}")
+        if self.resuming and not retry:
+            print(f"Already completed before resume: {self.stats['resumed_done']}")
+        print(f"Shared exports (same document linked from several places): {self.stats['shared_exports']}")
+        print(f"Wiki resolutions: {self.wiki_cache.misses} fetched, {self.wiki_cache.hits} cached")
+        print(f"Export status queries: {self.stats['export_polls']}")
+        rates = ", ".join(
+            f"{family}={rate:.1f}/s ({throttled} throttled)"
+            for family, (rate, throttled) in self.rate_limiter.snapshot().items()
+        )
+        print(f"Rate limits at end: {rates}")
+        self.print_metrics_summary(metrics_path)
         print(f"Failed files: {self.stats['failed']}")
 
         if self.failures:
             print("\n[FAILED LIST]")
             for item in self.failures:
                 print(f"- {item}")
+            if self.stats["failed"] > len(self.failures):
+                print(f"- ... {self.stats['failed'] - len(self.failures)} more in {self.failure_log_path}")
+            print(f"Retry only these: python3 main.py retry-failed --run-dir {self.output_dir}")
+            return 2
+        return 0
+
+    def run_worker(self, queue: WorkQueue, worker_id: str) -> int:
+        # One process of a distributed run: leases containers from the shared queue and runs their
+        # files through this process's own pipeline until the whole run is finished.
+        self.work_queue = queue
+        self.worker_id = worker_id
+        print(
+            f"[INFO] Worker {worker_id} joins {queue.path}, output dir {self.output_dir}, "
+            f"lister_workers={self.lister_workers}, export_workers={self.export_workers}, "
+            f"download_workers={self.download_workers}, poll_qps={self.export_poll_qps}"
+        )
+        self.open_manifest()
+        self.open_failure_log()
+        self.open_trace()
+        metrics_path = self._run_file(METRICS_FILENAME)
+        self.register_gauges()
+        self.start_pipeline()
+        self._heartbeat("running")
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat_loop, args=(stop_heartbeat,), name="lease-heartbeat", daemon=True)
+        heartbeat.start()
+        try:
+            self.traverse_queue()
+        finally:
+            self.drain_pipeline()
+            stop_heartbeat.set()
+            heartbeat.join()
+            self.close_manifest()
+            self.close_failure_log()
+            # Only the names this worker handed out; the coordinator merges them into PATH_MAP_FILENAME.
+            save_path_map(self._run_file(PATH_MAP_FILENAME), self.names.mapping())
+            self.duration_model.save()
+            self.export_routes.save()
+            self.wiki_cache.save()
+            self.metrics.write_json(metrics_path)
+            self.close_trace()
+            self._heartbeat("finished")
+        return self.print_summary(metrics_path)
+
+    @staticmethod
+    def _publish_tokens(queue: WorkQueue, managers: List[AccessTokenManager], published: Dict[str, str]) -> None:
+        for manager in managers:
+            store = str(manager.store_file or "")
+            token = manager.token()
+            if queue.refresh_requested(store) == token:
+                # A worker had this token rejected; refresh once for everybody.
+                try:
+                    token = manager.refresh(token)
+                except Exception as exc:
+                    print(f"[WARN] user_access_token refresh requested by a worker failed: {exc}")
+            if published.get(store) != token:
+                queue.publish_token(store, token, time.time() + manager.expires_in())
+                published[store] = token
+
+    def coordinate(
+        self,
+        queue: WorkQueue,
+        managers: List[AccessTokenManager],
+        meta: Optional[Dict[str, str]] = None,
+    ) -> int:
+        # Seeds the queue with the source roots (meta: a new run's settings for the workers), then
+        # keeps the workers' access tokens fresh until every container is finished and every live
+        # worker has closed its files, and finally merges the workers' run files.
+        print(f"[INFO] Coordinate distributed Feishu backup through {queue.path}, output dir {self.output_dir}")
+        published: Dict[str, str] = {}
+        self._publish_tokens(queue, managers, published)
+        if meta is not None:
+            queue.add([(self._container_key(root), root) for root in self._source_roots()], self.output_dir)
+            # run_dir last: workers only join once it is there.
+            for key, value in meta.items():
+                queue.set_meta(key, value)
+        shown: Optional[Tuple[Any, ...]] = None
+        while True:
+            self._publish_tokens(queue, managers, published)
+            counts = queue.counts()
+            workers = queue.workers()
+            alive = [row for row in workers if row[1] == "running" and time.time() - row[2] < WORK_LEASE_SECONDS]
+            progress = (tuple(sorted(counts.items())), len(alive), sum(row[3] for row in workers))
+            if progress != shown:
+                shown = progress
+                print(
+                    f"[INFO] Containers {', '.join(f'{status}={count}' for status, count in progress[0])}; "
+                    f"workers alive={progress[1]}, files={progress[2]}"
+                )
+            if not counts.get("pending") and not counts.get("leased") and not alive:
+                break
+            time.sleep(WORK_QUEUE_POLL_SECONDS)
+
+        expired = queue.expired(self.output_dir)
+        self.merge_worker_files(expired)
+        print("\n[SUMMARY]")
+        print(f"Output dir: {self.output_dir}")
+        print(f"Work queue: {queue.path}")
+        counts = queue.counts()
+        print(
+            f"Containers: {counts.get('done', 0)} done, {counts.get('failed', 0)} listing failed, "
+            f"{counts.get('expired', 0)} given up after {WORK_LEASE_MAX_ATTEMPTS} expired leases"
+        )
+        failed = len(expired)
+        for worker, status, _, files, worker_failed in queue.workers():
+            print(f"- worker {worker}: {files} files, {worker_failed} failed ({status})")
+            failed += worker_failed
+        print(f"Files processed: {sum(row[3] for row in queue.workers())}")
+        print(f"Failed items: {failed}")
+        if failed:
+            print(f"Retry only these: python3 main.py retry-failed --run-dir {self.output_dir}")
             return 2
         return 0
 
+    def merge_worker_files(self, expired: List[Tuple[TraversalEntry, str]]) -> None:
+        # Folds every worker's manifest and failure log into the run's own files, so verify,
+        # incremental runs and retry-failed see one ordinary run.
+        for name in (MANIFEST_FILENAME, FAILURES_FILENAME):
+            stem, _, extension = name.rpartition(".")
+            with open(self.output_dir / name, "a", encoding="utf-8") as merged:
+                for part in sorted(self.output_dir.glob(f"{stem}.*.{extension}")):
+                    text = part.read_text(encoding="utf-8")
+                    # A worker that died mid-line must not glue its last line to the next worker's first.
+                    merged.write(text if not text or text.endswith("\n") else text + "\n")
+                    part.unlink()
+        if expired:
+            self.failure_log = FailureLog(self.output_dir / FAILURES_FILENAME, append=True)
+            for entry, error in expired:
+                record = self._failure_record(entry.kind, entry.info, entry.local_dir, entry.source, "lease", error)
+                record["token"] = entry.token
+                self._record_failure(f"{entry.local_dir} ({entry.token or 'root'}) {error}", record)
+            self.close_failure_log()
+        stem, _, extension = PATH_MAP_FILENAME.rpartition(".")
+        parts = sorted(self.output_dir.glob(f"{stem}.*.{extension}"))
+        if self.path_map_file is not None:
+            # Like run(): names of documents not seen this time are only kept when part of the tree failed.
+            incomplete = bool(expired) or (self.output_dir / FAILURES_FILENAME).stat().st_size > 0
+            mapping = load_path_map(self.path_map_file) if incomplete else {}
+            for part in parts:
+                mapping.update(load_path_map(part))
+            save_path_map(self.path_map_file, mapping)
+        for part in parts:
+            part.unlink()
+
+
+def take_failed_records(run_dir: Path) -> List[Dict[str, Any]]:
+    # Moves the failure log aside before the retry writes a fresh one. A retry that dies keeps the
+    # set-aside file, and the next retry merges it back in, so no failed item is ever dropped.
+    path = run_dir / FAILURES_FILENAME
+    pending = path.with_name(path.name + ".retrying")
+    if path.exists():
+        if pending.exists():
+            with open(pending, "a", encoding="utf-8") as handle:
+                handle.write(path.read_text(encoding="utf-8"))
+            path.unlink()
+        else:
+            os.replace(path, pending)
+    records: Dict[Tuple[str, str, str, str], Dict[str, Any]] = {}
+    for record in FailureLog.read(pending):
+        if record.get("retryable", True):
+            key = (record.get("kind", ""), record.get("source", ""), record.get("token", ""), record.get("local_dir", ""))
+            records[key] = record
+    return list(records.values())
+
+
+def finish_failed_retry(run_dir: Path) -> None:
+    (run_dir / FAILURES_FILENAME).with_name(FAILURES_FILENAME + ".retrying").unlink(missing_ok=True)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="飞书云文档备份")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="backup",
+        choices=["backup", "plan", "prune", "verify", "retry-failed", "coordinator", "worker"],
+        help=(
+            "backup: 执行备份（默认）；plan: 只列目录，统计将导出的文档数量、类型与大小；"
+            "prune: 按 KEEP_SNAPSHOTS 清理旧快照并回收无引用对象；"
+            "verify: 按清单并行校验快照中每个文件的大小与哈希；"
+            "retry-failed: 按失败记录只重新处理失败的条目，写回原运行目录；"
+            "coordinator / worker: 分布式备份的协调进程与工作进程，通过共享的工作队列分配目录"
+        ),
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="RUN_DIR",
+        help="继续一次中断的备份：复用该运行目录及其中的进度日志，跳过已完成的条目",
+    )
+    parser.add_argument(
+        "--run-dir",
+        metavar="RUN_DIR",
+        help="verify / retry-failed 使用的运行目录，默认为最近一次运行",
+    )
+    parser.add_argument(
+        "--queue",
+        metavar="PATH",
+        help=f"coordinator / worker 共用的工作队列文件，需位于各机器都能访问的共享存储，默认为 OUTPUT_DIR/{WORK_QUEUE_FILENAME}",
+    )
+    parser.add_argument("--worker-id", help="worker 的名字，用于租约与运行文件命名，默认为 <主机名>-<进程号>")
+    return parser.parse_args(argv)
+
+
+def run_prune(output_root: Path) -> int:
+    removed_snapshots, removed_objects, freed_bytes = prune_snapshots(output_root, KEEP_SNAPSHOTS)
+    print("\n[SUMMARY]")
+    print(f"Output dir: {output_root}")
+    print(f"Removed snapshots: {removed_snapshots}")
+    print(f"Removed objects: {removed_objects}")
+    print(f"Freed bytes: {freed_bytes}")
+    return 0
+
+
+def verify_snapshot(run_dir: Path, workers: int) -> Tuple[int, int, List[str]]:
+    manifest = BackupManifest.load(run_dir / MANIFEST_FILENAME)
+    # Deduplicated snapshots hardlink one object into many paths; hash each inode only once.
+    inode_digests: Dict[Tuple[int, int, str], "Future[str]"] = {}
+    inode_lock = threading.Lock()
+
+    archive = ArchiveReader(run_dir) if (run_dir / ARCHIVE_INDEX_FILENAME).exists() else None
+
+    def hash_stream(handle: IO[bytes], algorithm: str) -> str:
+        digest = new_hasher(algorithm)
+        with handle:
+            for chunk in iter(lambda: handle.read(VERIFY_CHUNK_BYTES), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def check_member(entry: Dict[str, Any], member: Dict[str, Any]) -> Tuple[int, Optional[str]]:
+        assert archive is not None
+        algorithm, expected = manifest_digest(entry)
+        if member.get("size") != entry.get("size"):
+            return 0, f"{entry['path']}: size {member.get('size')} != {entry.get('size')}"
+        try:
+            handle = archive.open(entry["path"])
+            if handle is None:
+                return 0, f"{entry['path']}: missing from archive index"
+            # zipfile also checks the member's crc32 while reading.
+            actual = hash_stream(handle, algorithm)
+        except (OSError, zipfile.BadZipFile) as exc:
+            return 0, f"{entry['path']}: read error in {member.get('volume')} ({exc})"
+        if actual != expected:
+            return 0, f"{entry['path']}: {algorithm} {actual} != {expected}"
+        return int(member["size"]), None
+
+    def check(entry: Dict[str, Any]) -> Tuple[int, Optional[str]]:
+        if archive is not None and entry["path"] in archive.index:
+            return check_member(entry, archive.index[entry["path"]])
+        path = run_dir / entry["path"]
+        algorithm, expected = manifest_digest(entry)
+        try:
+            stat = path.stat()
+        except OSError as exc:
+            return 0, f"{entry['path']}: missing ({exc})"
+        if stat.st_size != entry.get("size"):
+            return 0, f"{entry['path']}: size {stat.st_size} != {entry.get('size')}"
+        if not expected:
+            return 0, f"{entry['path']}: no digest in manifest"
+        key = (stat.st_dev, stat.st_ino, algorithm)
+        with inode_lock:
+            pending = inode_digests.get(key)
+            owner = pending is None
+            if owner:
+                pending = inode_digests[key] = Future()
+        if owner:
+            try:
+                pending.set_result(hash_stream(open(path, "rb"), algorithm))
+            except Exception as exc:
+                pending.set_exception(exc)
+        try:
+            actual = pending.result()
+        except Exception as exc:
+            return 0, f"{entry['path']}: read error ({exc})"
+        if actual != expected:
+            return 0, f"{entry['path']}: {algorithm} {actual} != {expected}"
+        return (stat.st_size if owner else 0), None
+
+    hashed_bytes = 0
+    problems: List[str] = []
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="verify") as pool:
+            for size, problem in pool.map(check, manifest.values()):
+                hashed_bytes += size
+                if problem:
+                    problems.append(problem)
+                    print(f"[FAIL] {problem}")
+    finally:
+        if archive is not None:
+            archive.close()
+    return len(manifest), hashed_bytes, problems
+
+
+def run_verify(run_dir: Optional[Path]) -> int:
+    run_dir = run_dir or read_latest_run_dir(Path(OUTPUT_DIR))
+    if run_dir is None or not (run_dir / MANIFEST_FILENAME).exists():
+        raise ValueError(f"未找到可校验的运行目录或清单 {MANIFEST_FILENAME}")
+    started_at = time.monotonic()
+    checked, hashed_bytes, problems = verify_snapshot(run_dir, VERIFY_WORKERS)
+    elapsed = max(time.monotonic() - started_at, 1e-6)
+    print("\n[SUMMARY]")
+    print(f"Run dir: {run_dir}")
+    print(f"Files checked: {checked}")
+    print(f"Bytes hashed: {hashed_bytes} ({hashed_bytes / elapsed / 1024 / 1024:.1f} MiB/s)")
+    print(f"Problems: {len(problems)}")
+    return 2 if problems else 0
+
+
+def run_coordinator(queue_path: Path) -> int:
+    if OUTPUT_FORMAT == "zip":
+        raise ValueError('分布式备份不支持 OUTPUT_FORMAT = "zip"：多个进程不能写同一组压缩卷')
+    api_session = build_http_session(API_POOL_SIZE)
+    sources, managers, tokens = build_sources(api_session)
+    output_root = Path(OUTPUT_DIR)
+    queue = WorkQueue(queue_path, create=True)
+    meta: Optional[Dict[str, str]] = None
+    run_dir_value = queue.get_meta("run_dir")
+    if run_dir_value is not None and queue.get_meta("finished") is None:
+        # A restarted coordinator picks the unfinished run up again; the workers may still be running.
+        output_dir = output_root / run_dir_value
+        print(f"[INFO] Continuing distributed run {output_dir}")
+    else:
+        queue.close()
+        WorkQueue.remove(queue_path)
+        queue = WorkQueue(queue_path, create=True)
+        output_dir = output_root / time.strftime("%Y-%m-%d_%H-%M-%S") if RUN_SUBDIR_BY_DATE else output_root
+        previous_run_dir = read_latest_run_dir(output_root)
+        meta = {
+            "sources": json.dumps(
+                [
+                    {
+                        "name": source.name,
+                        "kind": source.kind,
+                        "space_id": source.space_id,
+                        "store": str(source.tokens.store_file or "") if source.tokens is not None else "",
+                    }
+                    for source in sources
+                ],
+                ensure_ascii=False,
+            ),
+            "previous_run_dir": os.path.relpath(previous_run_dir, output_root) if previous_run_dir else "",
+            "started_at": str(int(time.time())),
+            "run_dir": os.path.relpath(output_dir, output_root),
+        }
+    coordinator = FeishuDriveBackup(
+        user_access_token=tokens.token(),
+        output_dir=output_dir,
+        api_session=api_session,
+        path_map_file=output_root / PATH_MAP_FILENAME,
+        token_manager=tokens,
+        sources=sources,
+    )
+    for manager in managers:
+        manager.start()
+    try:
+        exit_code = coordinator.coordinate(queue, managers, meta)
+        queue.set_meta("finished", str(int(time.time())))
+    finally:
+        for manager in managers:
+            manager.stop()
+        coordinator.close()
+        queue.close()
+    write_latest_run_dir(output_root, output_dir)
+    return exit_code
+
+
+def open_work_queue(queue_path: Path) -> Tuple[WorkQueue, str]:
+    # Workers may be started before the coordinator has set the run up; wait for it for a while.
+    deadline = time.time() + WORK_LEASE_SECONDS
+    while True:
+        if queue_path.exists():
+            queue = WorkQueue(queue_path)
+            run_dir_value = queue.get_meta("run_dir")
+            if run_dir_value is not None and queue.get_meta("finished") is None:
+                return queue, run_dir_value
+            queue.close()
+        if time.time() >= deadline:
+            raise ValueError(f"工作队列 {queue_path} 中没有进行中的分布式备份，请先启动 coordinator")
+        time.sleep(WORK_QUEUE_POLL_SECONDS)
+
+
+def run_worker_process(queue_path: Path, worker_id: Optional[str]) -> int:
+    queue, run_dir_value = open_work_queue(queue_path)
+    output_root = Path(OUTPUT_DIR)
+    # Only the coordinator refreshes tokens; workers need neither APP_SECRET nor a token store.
+    managers: Dict[str, AccessTokenManager] = {}
+    sources: List[BackupSource] = []
+    for spec in json.loads(queue.get_meta("sources") or "[]"):
+        if spec["store"] not in managers:
+            managers[spec["store"]] = QueueTokenManager(queue, spec["store"])
+        sources.append(BackupSource(spec["name"], spec["kind"], spec["space_id"], managers[spec["store"]]))
+    previous_run_dir = queue.get_meta("previous_run_dir")
+    backup = FeishuDriveBackup(
+        user_access_token="",
+        output_dir=output_root / run_dir_value,
+        timeout_seconds=REQUEST_TIMEOUT_SECONDS,
+        max_retries=MAX_RETRIES,
+        poll_interval_seconds=POLL_INTERVAL_SECONDS,
+        max_export_wait_seconds=MAX_EXPORT_WAIT_SECONDS,
+        lister_workers=LISTER_WORKERS,
+        export_workers=EXPORT_WORKERS,
+        download_workers=DOWNLOAD_WORKERS,
+        export_poller_threads=EXPORT_POLLER_THREADS,
+        export_poll_qps=EXPORT_POLL_QPS,
+        max_inflight_exports=MAX_INFLIGHT_EXPORTS,
+        export_order=EXPORT_ORDER,
+        incremental=INCREMENTAL_MODE,
+        previous_run_dir=output_root / previous_run_dir if previous_run_dir else None,
+        object_store=ObjectStore(output_root / OBJECT_STORE_DIRNAME) if DEDUP_STORE else None,
+        duration_model=ExportDurationModel(output_root / EXPORT_HISTORY_FILENAME),
+        export_routes=ExportRouteTable(output_root / EXPORT_ROUTES_FILENAME),
+        wiki_cache=WikiNodeCache(output_root / WIKI_CACHE_FILENAME, WIKI_CACHE_TTL_SECONDS, WIKI_CACHE_SIZE),
+        hash_algorithm=HASH_ALGORITHM,
+        path_map_file=output_root / PATH_MAP_FILENAME,
+        # Each directory is written by the one worker holding its container's lease; a container
+        # redone after a lease expired gets the same names again and overwrites its partial files.
+        scan_existing_names=False,
+        trace_requests=TRACE_REQUESTS,
+        token_manager=managers.get("") or next(iter(managers.values())),
+        sources=sources,
+    )
+    worker_id = re.sub(r"[^A-Za-z0-9_-]", "_", worker_id or f"{socket.gethostname()}-{os.getpid()}")
+    try:
+        return backup.run_worker(queue, worker_id)
+    finally:
+        backup.close()
+        queue.close()
+
 
 def main() -> None:
+    args = parse_args()
     try:
-        user_access_token = get_runtime_user_access_token()
-        output_dir = Path(OUTPUT_DIR)
-        if RUN_SUBDIR_BY_DATE:
-            output_dir = output_dir / time.strftime("%Y-%m-%d_%H-%M-%S")
+        if args.command == "prune":
+            sys.exit(run_prune(Path(OUTPUT_DIR)))
+        if args.command == "verify":
+            sys.exit(run_verify(Path(args.run_dir) if args.run_dir else None))
+        queue_path = Path(args.queue) if args.queue else Path(OUTPUT_DIR) / WORK_QUEUE_FILENAME
+        if args.command == "coordinator":
+            sys.exit(run_coordinator(queue_path))
+        if args.command == "worker":
+            sys.exit(run_worker_process(queue_path, args.worker_id))
+
+        api_session = build_http_session(API_POOL_SIZE)
+        sources, managers, tokens = build_sources(api_session)
+        output_root = Path(OUTPUT_DIR)
+        listing_index = ListingIndex(output_root / LISTING_INDEX_FILENAME, LISTING_INDEX_TTL_SECONDS)
+        if args.command == "plan":
+            planner = FeishuDriveBackup(
+                user_access_token=tokens.token(),
+                output_dir=output_root,
+                timeout_seconds=REQUEST_TIMEOUT_SECONDS,
+                max_retries=MAX_RETRIES,
+                lister_workers=LISTER_WORKERS,
+                api_session=api_session,
+                incremental=INCREMENTAL_MODE,
+                previous_run_dir=read_latest_run_dir(output_root),
+                duration_model=ExportDurationModel(output_root / EXPORT_HISTORY_FILENAME),
+                listing_index=listing_index,
+                token_manager=tokens,
+                sources=sources,
+            )
+            for manager in managers:
+                manager.start()
+            try:
+                exit_code = planner.plan()
+            finally:
+                for manager in managers:
+                    manager.stop()
+                planner.close()
+                listing_index.close()
+            sys.exit(exit_code)
+
+        output_dir = output_root
+        retry: Optional[List[Dict[str, Any]]] = None
+        if args.command == "retry-failed":
+            output_dir = Path(args.run_dir) if args.run_dir else read_latest_run_dir(output_root)
+            if output_dir is None or not (output_dir / MANIFEST_FILENAME).exists():
+                raise ValueError(f"未找到要重试的运行目录或清单 {MANIFEST_FILENAME}")
+            retry = take_failed_records(output_dir)
+            if not retry:
+                print(f"[INFO] {output_dir} 中没有可重试的失败记录（{FAILURES_FILENAME}）")
+                finish_failed_retry(output_dir)
+                sys.exit(0)
+            print(f"[INFO] {len(retry)} failed items to retry in {output_dir}")
+        elif args.resume:
+            output_dir = Path(args.resume)
+            if not (output_dir / JOURNAL_FILENAME).exists():
+                raise ValueError(f"{output_dir} 中未找到进度日志 {JOURNAL_FILENAME}，无法续跑")
+        elif RUN_SUBDIR_BY_DATE:
+            output_dir = output_root / time.strftime("%Y-%m-%d_%H-%M-%S")
+        journal = None
+        if (RUN_JOURNAL or args.resume) and retry is None:
+            journal_path = output_dir / JOURNAL_FILENAME
+            if not args.resume:
+                # Without dated run dirs the journal of the previous run is still here; start clean.
+                RunJournal.remove(journal_path)
+            journal = RunJournal(journal_path, output_dir)
 
         backup = FeishuDriveBackup(
-            user_access_token=user_access_token,
+            user_access_token=tokens.token(),
             output_dir=output_dir,
             timeout_seconds=REQUEST_TIMEOUT_SECONDS,
             max_retries=MAX_RETRIES,
             poll_interval_seconds=POLL_INTERVAL_SECONDS,
             max_export_wait_seconds=MAX_EXPORT_WAIT_SECONDS,
+            lister_workers=LISTER_WORKERS,
+            export_workers=EXPORT_WORKERS,
+            download_workers=DOWNLOAD_WORKERS,
+            export_poller_threads=EXPORT_POLLER_THREADS,
+            export_poll_qps=EXPORT_POLL_QPS,
+            max_inflight_exports=MAX_INFLIGHT_EXPORTS,
+            export_order=EXPORT_ORDER,
+            api_session=api_session,
+            incremental=INCREMENTAL_MODE and retry is None,
+            previous_run_dir=read_latest_run_dir(output_root),
+            object_store=ObjectStore(output_root / OBJECT_STORE_DIRNAME) if DEDUP_STORE else None,
+            journal=journal,
+            duration_model=ExportDurationModel(output_root / EXPORT_HISTORY_FILENAME),
+            export_routes=ExportRouteTable(output_root / EXPORT_ROUTES_FILENAME),
+            wiki_cache=WikiNodeCache(output_root / WIKI_CACHE_FILENAME, WIKI_CACHE_TTL_SECONDS, WIKI_CACHE_SIZE),
+            hash_algorithm=HASH_ALGORITHM,
+            # A retry keeps the format of the run it repairs, whatever OUTPUT_FORMAT says now.
+            archive=(
+                ArchiveWriter(output_dir, ARCHIVE_VOLUME_BYTES)
+                if (OUTPUT_FORMAT == "zip" if retry is None else (output_dir / ARCHIVE_INDEX_FILENAME).exists())
+                else None
+            ),
+            listing_index=listing_index,
+            reuse_listing_index=REUSE_LISTING_INDEX,
+            path_map_file=output_root / PATH_MAP_FILENAME,
+            # A dated run dir starts empty (or is resumed with its journal), so only a shared
+            # output dir needs one scandir per directory to see what is already there.
+            scan_existing_names=not RUN_SUBDIR_BY_DATE or retry is not None,
+            metrics_textfile=Path(METRICS_TEXTFILE) if METRICS_TEXTFILE else None,
+            metrics_interval_seconds=METRICS_INTERVAL_SECONDS,
+            trace_requests=TRACE_REQUESTS,
+            token_manager=tokens,
+            sources=sources,
         )
-        exit_code = backup.run()
+        # Full runs outlast the token lifetime; refresh every account's token in the background.
+        for manager in managers:
+            manager.start()
+        try:
+            exit_code = backup.run(retry)
+        finally:
+            for manager in managers:
+                manager.stop()
+            backup.close()
+            listing_index.close()
+        if retry is not None:
+            finish_failed_retry(output_dir)
+            sys.exit(exit_code)
+        # Failed items are absent from the manifest, so the next incremental run retries them.
+        write_latest_run_dir(output_root, output_dir)
         sys.exit(exit_code)
     except Exception as exc:
         print(f"[FATAL] {exc}", file=sys.stderr)
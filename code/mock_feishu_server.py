@@ -0,0 +1,586 @@
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlparse
+
+# Local stand-in for the Feishu open API endpoints main.py calls, for offline benchmarks and
+# regression runs without real tokens. Only the standard library is used. The tree is generated
+# from the config, so the same config (and seed) always serves the same documents.
+
+DOC_TYPES = ("docx", "sheet", "bitable", "doc", "slides", "file", "wiki")
+BASE_MODIFIED_TIME = 1700000000
+PATTERN_BYTES = 4096  # payloads repeat a per-token block, so any Range is cheap to serve
+THROTTLE_CODE = 99991400
+INVALID_TOKEN_CODE = 99991663
+EXPIRED_TOKEN_CODE = 99991677
+SERVER_ERROR_CODE = 1061045
+
+
+@dataclass
+class MockConfig:
+    depth: int = 2  # folder levels below the root
+    folders: int = 3  # sub-folders per folder
+    files: int = 10  # documents per folder
+    page_size: int = 50  # upper bound for page_size; the client's own value is used if smaller
+    types: Tuple[str, ...] = DOC_TYPES  # cycled per document; "wiki" items are drive shortcuts
+    shared_docs: int = 5  # wiki shortcuts resolve into this many shared documents
+    export_delay: float = 1.0  # seconds until an export task finishes
+    export_jitter: float = 0.5  # +/- fraction applied per task
+    export_delay_by_type: Dict[str, float] = field(default_factory=dict)  # per-type export_delay overrides
+    export_bytes: int = 64 * 1024  # mean size of an exported document
+    file_bytes: int = 1024 * 1024  # mean size of an attachment
+    latency: float = 0.0  # added to every response, seconds
+    bandwidth: int = 0  # bytes/second per download stream, 0 = unlimited
+    download_cut_rate: float = 0.0  # fraction of download ranges whose body is dropped halfway, once per range
+    throttle_rate: float = 0.0  # fraction of requests answered with HTTP 429
+    throttle_endpoints: Tuple[str, ...] = ()  # endpoints throttle_rate applies to, empty = all (e.g. "oauth_token")
+    error_rate: float = 0.0  # fraction of requests answered with HTTP 500
+    export_fail_rate: float = 0.0  # fraction of export tasks that end in job_status=3
+    qps_limit: float = 0.0  # per-endpoint requests/second before answering 429, 0 = unlimited
+    edit_rate: float = 0.0  # fraction of documents whose modified_time is the server start time
+    token_ttl: int = 0  # expires_in of issued access tokens; 0 accepts any bearer token
+    seed: int = 0
+
+
+def endpoint_name(method: str, path: str) -> str:
+    parts = path.strip("/").split("/")
+    if path == "/authen/v2/oauth/token":
+        return "oauth_token"
+    if path == "/drive/v1/files":
+        return "list_files"
+    if path.startswith("/drive/v1/files/") and path.endswith("/download"):
+        return "file_download"
+    if path == "/drive/v1/export_tasks" and method == "POST":
+        return "export_create"
+    if path.startswith("/drive/v1/export_tasks/file/"):
+        return "export_download"
+    if path.startswith("/drive/v1/export_tasks/"):
+        return "export_query"
+    if path == "/wiki/v2/spaces/get_node":
+        return "get_node"
+    if len(parts) == 5 and parts[:3] == ["wiki", "v2", "spaces"] and parts[4] == "nodes":
+        return "list_nodes"
+    return "unknown"
+
+
+class MockTree:
+    # Container paths look like "r", "r-0", "r-0-2"; documents are "<path>.<index>".
+    def __init__(self, config: MockConfig, started_at: int) -> None:
+        self.config = config
+        self.started_at = started_at
+
+    def _rng(self, token: str) -> random.Random:
+        return random.Random(f"{self.config.seed}:{token}")
+
+    @staticmethod
+    def depth_of(path: str) -> int:
+        return path.count("-")
+
+    def doc_type(self, index: int) -> str:
+        return self.config.types[index % len(self.config.types)]
+
+    def modified_time(self, token: str) -> str:
+        rng = self._rng(token)
+        if self.config.edit_rate and rng.random() < self.config.edit_rate:
+            return str(self.started_at)
+        return str(BASE_MODIFIED_TIME + rng.randrange(86400))
+
+    def size(self, token: str, mean: int) -> int:
+        return max(1, int(mean * (0.5 + self._rng(token + "#size").random())))
+
+    def subfolders(self, path: str) -> List[str]:
+        if self.depth_of(path) >= self.config.depth:
+            return []
+        return [f"{path}-{index}" for index in range(self.config.folders)]
+
+    def folder_items(self, path: str) -> List[Dict[str, Any]]:
+        items: List[Dict[str, Any]] = []
+        for child in self.subfolders(path):
+            items.append(
+                {
+                    "token": f"fld{child}",
+                    "type": "folder",
+                    "name": f"Folder {child.rsplit('-', 1)[-1]}",
+                    "modified_time": self.modified_time(f"fld{child}"),
+                }
+            )
+        for index in range(self.config.files):
+            doc_type = self.doc_type(index)
+            token = f"{'wik' if doc_type == 'wiki' else 'obj'}{path}.{index}"
+            # Every third name repeats, so the client has to de-duplicate file names.
+            name = "Untitled" if index % 3 == 0 else f"Doc {index}"
+            if doc_type == "file":
+                name += ".bin"
+            items.append(
+                {
+                    "token": token,
+                    "type": doc_type,
+                    "name": name,
+                    "modified_time": self.modified_time(token),
+                    "size": self.size(token, self.config.file_bytes if doc_type == "file" else self.config.export_bytes),
+                }
+            )
+        return items
+
+    def library_items(self, path: str) -> List[Dict[str, Any]]:
+        items: List[Dict[str, Any]] = []
+        for child in self.subfolders(path):
+            items.append(
+                {
+                    "node_token": f"nod{child}",
+                    "obj_token": f"objn{child}",
+                    "obj_type": "docx",
+                    "title": f"Page {child.rsplit('-', 1)[-1]}",
+                    "has_child": True,
+                    "obj_edit_time": self.modified_time(f"objn{child}"),
+                }
+            )
+        for index in range(self.config.files):
+            doc_type = self.doc_type(index)
+            token = f"obj{path}.{index}"
+            items.append(
+                {
+                    "node_token": f"nod{path}.{index}",
+                    "obj_token": token,
+                    "obj_type": "docx" if doc_type == "wiki" else doc_type,
+                    "title": "Untitled" if index % 3 == 0 else f"Doc {index}",
+                    "has_child": False,
+                    "obj_edit_time": self.modified_time(token),
+                }
+            )
+        return items
+
+    def wiki_node(self, token: str) -> Optional[Dict[str, Any]]:
+        if not token.startswith("wik"):
+            return None
+        shared = int(hashlib.sha1(token.encode()).hexdigest(), 16) % max(1, self.config.shared_docs)
+        obj_token = f"objshared.{shared}"
+        return {
+            "node_token": token,
+            "obj_token": obj_token,
+            "obj_type": "docx",
+            "obj_edit_time": self.modified_time(obj_token),
+        }
+
+    def pattern(self, token: str) -> bytes:
+        block = b""
+        seed = token.encode()
+        while len(block) < PATTERN_BYTES:
+            seed = hashlib.sha256(seed).digest()
+            block += seed
+        return block[:PATTERN_BYTES]
+
+
+class TokenBucket:
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self.capacity = max(1.0, rate)  # one second of burst
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class MockState:
+    def __init__(self, config: MockConfig) -> None:
+        self.config = config
+        self.tree = MockTree(config, int(time.time()))
+        self.rng = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.tickets: Dict[str, Dict[str, Any]] = {}
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.counts: Dict[str, Dict[str, int]] = {}
+        self.access_tokens: Dict[str, float] = {}  # token -> expiry (monotonic)
+        self.cut_ranges: Set[Tuple[str, int, int]] = set()  # (token, start, end) already cut by download_cut_rate
+
+    def issue_token(self) -> Dict[str, Any]:
+        with self.lock:
+            serial = len(self.access_tokens)
+            access_token = f"mock-at-{serial}"
+            ttl = self.config.token_ttl or 7200
+            self.access_tokens[access_token] = time.monotonic() + ttl
+        return {
+            "code": 0,
+            "access_token": access_token,
+            "refresh_token": f"mock.refresh.{serial}",
+            "expires_in": ttl,
+            "token_type": "Bearer",
+        }
+
+    def token_error(self, authorization: str) -> Optional[int]:
+        if not authorization.startswith("Bearer "):
+            return INVALID_TOKEN_CODE
+        if not self.config.token_ttl:
+            return None
+        with self.lock:
+            expires_at = self.access_tokens.get(authorization[len("Bearer "):])
+        if expires_at is None:
+            return INVALID_TOKEN_CODE
+        return EXPIRED_TOKEN_CODE if time.monotonic() >= expires_at else None
+
+    def reset(self) -> None:
+        with self.lock:
+            self.tickets.clear()
+            self.buckets.clear()
+            self.cut_ranges.clear()
+            self.counts.clear()
+
+    def count(self, endpoint: str, key: str, amount: int = 1) -> None:
+        with self.lock:
+            counters = self.counts.setdefault(endpoint, {})
+            counters[key] = counters.get(key, 0) + amount
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            counts = {endpoint: dict(counters) for endpoint, counters in self.counts.items()}
+        return {
+            "config": asdict(self.config),
+            "endpoints": counts,
+            "requests": sum(counters.get("requests", 0) for counters in counts.values()),
+            "bytes_sent": sum(counters.get("bytes", 0) for counters in counts.values()),
+        }
+
+    def chaos(self, endpoint: str) -> Optional[int]:
+        # Returns the HTTP status to fail this request with, if any.
+        with self.lock:
+            if self.config.qps_limit > 0:
+                bucket = self.buckets.setdefault(endpoint, TokenBucket(self.config.qps_limit))
+                if not bucket.take():
+                    return 429
+            roll = self.rng.random()
+        if roll < self.config.throttle_rate:
+            throttled = not self.config.throttle_endpoints or endpoint in self.config.throttle_endpoints
+            return 429 if throttled else None
+        if roll < self.config.throttle_rate + self.config.error_rate:
+            return 500
+        return None
+
+    def cut_download(self, token: str, start: int, end: int) -> bool:
+        # A given byte range is cut at most once, so a client that retries without progress
+        # (the cut landed inside its read buffer) gets the whole range the second time.
+        if self.config.download_cut_rate <= 0:
+            return False
+        with self.lock:
+            if (token, start, end) in self.cut_ranges or self.rng.random() >= self.config.download_cut_rate:
+                return False
+            self.cut_ranges.add((token, start, end))
+            return True
+
+    def create_ticket(self, body: Dict[str, Any]) -> str:
+        with self.lock:
+            ticket = f"tkt{len(self.tickets)}"
+            jitter = self.config.export_jitter * (2 * self.rng.random() - 1)
+            self.tickets[ticket] = {
+                "token": str(body.get("token") or ""),
+                "type": str(body.get("type") or ""),
+                "extension": str(body.get("file_extension") or "pdf"),
+                "ready_at": time.monotonic() + max(0.0, self.export_delay(str(body.get("type") or "")) * (1 + jitter)),
+                "fails": self.rng.random() < self.config.export_fail_rate,
+            }
+        return ticket
+
+    def export_delay(self, doc_type: str) -> float:
+        return self.config.export_delay_by_type.get(doc_type, self.config.export_delay)
+
+    def ticket(self, ticket: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            return self.tickets.get(ticket)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "MockHTTPServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        return
+
+    def do_GET(self) -> None:
+        self._handle("GET")
+
+    def do_POST(self) -> None:
+        self._handle("POST")
+
+    def _send_json(self, endpoint: str, payload: Dict[str, Any], status: int = 200) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.state.count(endpoint, "bytes", len(body))
+
+    def _send_payload(self, endpoint: str, token: str, size: int) -> None:
+        start, end, status = 0, size - 1, 200
+        requested = self.headers.get("Range") or ""
+        if requested.startswith("bytes="):
+            first, _, last = requested[len("bytes="):].partition("-")
+            start = int(first or 0)
+            end = min(int(last), size - 1) if last else size - 1
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+
+        block = self.server.state.tree.pattern(token)
+        bandwidth = self.server.state.config.bandwidth
+        last = end
+        if self.server.state.cut_download(token, start, end):
+            # Stop halfway (at least one byte in) and drop the connection; the client sees a short body.
+            last = start + (end - start) // 2
+            self.close_connection = True
+            self.server.state.count(endpoint, "cut")
+        chunk_bytes = 64 * 1024
+        position = start
+        started_at = time.monotonic()
+        while position <= last:
+            length = min(chunk_bytes, last - position + 1)
+            offset = position % PATTERN_BYTES
+            repeated = block[offset:] + block * (length // PATTERN_BYTES + 1)
+            self.wfile.write(repeated[:length])
+            position += length
+            if bandwidth > 0:
+                ahead = (position - start) / bandwidth - (time.monotonic() - started_at)
+                if ahead > 0:
+                    time.sleep(ahead)
+        self.server.state.count(endpoint, "bytes", last - start + 1)
+
+    def _handle(self, method: str) -> None:
+        state = self.server.state
+        url = urlparse(self.path)
+        path = url.path[len("/open-apis"):] if url.path.startswith("/open-apis") else url.path
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+
+        if path == "/_mock/stats":
+            self._send_json("mock", state.stats())
+            return
+        if path == "/_mock/reset" and method == "POST":
+            state.reset()
+            self._send_json("mock", {"code": 0})
+            return
+
+        endpoint = endpoint_name(method, path)
+        state.count(endpoint, "requests")
+        if state.config.latency:
+            time.sleep(state.config.latency)
+        failure = state.chaos(endpoint)
+        if failure == 429:
+            state.count(endpoint, "throttled")
+            self._send_json(endpoint, {"code": THROTTLE_CODE, "msg": "request trigger frequency limit"}, 429)
+            return
+        if failure is not None:
+            state.count(endpoint, "errors")
+            self._send_json(endpoint, {"code": SERVER_ERROR_CODE, "msg": "internal error"}, failure)
+            return
+
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            self._send_json(endpoint, {"code": 400, "msg": "invalid json body"}, 400)
+            return
+        token_error = state.token_error(self.headers.get("Authorization") or "")
+        # Exported files may come back as a signed URL; those are fetched without auth.
+        if token_error is not None and endpoint not in {"oauth_token", "export_download"}:
+            state.count(endpoint, "unauthorized")
+            self._send_json(endpoint, {"code": token_error, "msg": "invalid or expired access token"}, 401)
+            return
+        self._route(endpoint, path, query, body)
+
+    def _page(self, endpoint: str, items: List[Dict[str, Any]], query: Dict[str, str], key: str, cursor: str) -> None:
+        page_size = min(int(query.get("page_size") or self.server.state.config.page_size), self.server.state.config.page_size)
+        offset = int(query.get("page_token") or 0)
+        page = items[offset:offset + page_size]
+        has_more = offset + page_size < len(items)
+        data: Dict[str, Any] = {key: page, "has_more": has_more}
+        data[cursor] = str(offset + page_size) if has_more else ""
+        self._send_json(endpoint, {"code": 0, "data": data})
+
+    def _route(self, endpoint: str, path: str, query: Dict[str, str], body: Dict[str, Any]) -> None:
+        state = self.server.state
+        tree = state.tree
+        if endpoint == "oauth_token":
+            self._send_json(endpoint, state.issue_token())
+        elif endpoint == "list_files":
+            folder = query.get("folder_token") or "fldr"
+            self._page(endpoint, tree.folder_items(folder[len("fld"):]), query, "files", "next_page_token")
+        elif endpoint == "list_nodes":
+            parent = query.get("parent_node_token") or "nodr"
+            self._page(endpoint, tree.library_items(parent[len("nod"):]), query, "items", "page_token")
+        elif endpoint == "get_node":
+            node = tree.wiki_node(query.get("token") or "")
+            if node is None:
+                self._send_json(endpoint, {"code": 131005, "msg": "node not found"}, 404)
+                return
+            self._send_json(endpoint, {"code": 0, "data": {"node": node}})
+        elif endpoint == "export_create":
+            self._send_json(endpoint, {"code": 0, "data": {"ticket": state.create_ticket(body)}})
+        elif endpoint == "export_query":
+            ticket_id = path.rsplit("/", 1)[-1]
+            ticket = state.ticket(ticket_id)
+            if ticket is None:
+                self._send_json(endpoint, {"code": 1069902, "msg": "ticket not found"}, 404)
+                return
+            if ticket["type"] == "file":
+                result = {"job_status": 3, "job_error_msg": "file type does not support export"}
+            elif time.monotonic() < ticket["ready_at"]:
+                result = {"job_status": 2}
+            elif ticket["fails"]:
+                result = {"job_status": 3, "job_error_msg": "export failed"}
+            else:
+                file_token = f"exp{ticket['token']}.{ticket['extension']}"
+                result = {
+                    "job_status": 0,
+                    "file_token": file_token,
+                    "file_name": ticket["token"],
+                    "file_extension": ticket["extension"],
+                    "file_size": tree.size(file_token, state.config.export_bytes),
+                }
+            self._send_json(endpoint, {"code": 0, "data": {"result": result}})
+        elif endpoint == "export_download":
+            file_token = path.split("/")[-2]
+            self._send_payload(endpoint, file_token, tree.size(file_token, state.config.export_bytes))
+        elif endpoint == "file_download":
+            file_token = path.split("/")[-2]
+            self._send_payload(endpoint, file_token, tree.size(file_token, state.config.file_bytes))
+        else:
+            self._send_json(endpoint, {"code": 404, "msg": f"no mock for {path}"}, 404)
+
+
+class MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], state: MockState) -> None:
+        super().__init__(address, MockHandler)
+        self.state = state
+
+
+class MockFeishuServer:
+    # Runs the mock on a background thread; base_url is what main.BASE_URL should point at.
+    def __init__(self, config: MockConfig, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.state = MockState(config)
+        self.httpd = MockHTTPServer((host, port), self.state)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/open-apis"
+
+    def start(self) -> "MockFeishuServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-feishu", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = MockConfig()
+    parser.add_argument("--depth", type=int, default=defaults.depth, help="根目录以下的目录层数")
+    parser.add_argument("--folders", type=int, default=defaults.folders, help="每个目录下的子目录数")
+    parser.add_argument("--files", type=int, default=defaults.files, help="每个目录下的文档数")
+    parser.add_argument("--page-size", type=int, default=defaults.page_size, help="列目录每页最多条数")
+    parser.add_argument("--types", default=",".join(defaults.types), help="文档类型，按顺序循环分配")
+    parser.add_argument("--shared-docs", type=int, default=defaults.shared_docs, help="wiki 快捷方式指向的共享文档数")
+    parser.add_argument("--export-delay", type=float, default=defaults.export_delay, help="导出任务完成耗时（秒）")
+    parser.add_argument(
+        "--export-delay-by-type",
+        default="",
+        help="按类型覆盖导出耗时，例如 bitable=30,sheet=5",
+    )
+    parser.add_argument("--export-jitter", type=float, default=defaults.export_jitter, help="导出耗时的上下浮动比例")
+    parser.add_argument("--export-bytes", type=int, default=defaults.export_bytes, help="导出文件平均大小（字节）")
+    parser.add_argument("--file-bytes", type=int, default=defaults.file_bytes, help="附件平均大小（字节）")
+    parser.add_argument("--latency", type=float, default=defaults.latency, help="每个请求附加的延迟（秒）")
+    parser.add_argument("--bandwidth", type=int, default=defaults.bandwidth, help="每个下载流的带宽上限（字节/秒），0 不限")
+    parser.add_argument("--download-cut-rate", type=float, default=defaults.download_cut_rate, help="下载响应体中途断开的比例")
+    parser.add_argument("--throttle-rate", type=float, default=defaults.throttle_rate, help="随机返回 429 的比例")
+    parser.add_argument("--throttle-endpoints", default="", help="只对这些接口随机返回 429（逗号分隔，如 oauth_token），默认全部")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="随机返回 500 的比例")
+    parser.add_argument("--export-fail-rate", type=float, default=defaults.export_fail_rate, help="导出任务失败的比例")
+    parser.add_argument("--qps-limit", type=float, default=defaults.qps_limit, help="每个接口的限频（次/秒），0 不限")
+    parser.add_argument("--edit-rate", type=float, default=defaults.edit_rate, help="修改时间为服务启动时间的文档比例")
+    parser.add_argument("--token-ttl", type=int, default=defaults.token_ttl, help="签发的 access_token 有效期（秒），0 表示接受任意 token")
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="随机种子")
+
+
+def config_from_args(args: argparse.Namespace) -> MockConfig:
+    return MockConfig(
+        depth=args.depth,
+        folders=args.folders,
+        files=args.files,
+        page_size=args.page_size,
+        types=tuple(item.strip() for item in args.types.split(",") if item.strip()),
+        shared_docs=args.shared_docs,
+        export_delay=args.export_delay,
+        export_jitter=args.export_jitter,
+        export_delay_by_type={
+            name.strip(): float(value)
+            for name, value in (item.split("=", 1) for item in args.export_delay_by_type.split(",") if "=" in item)
+        },
+        export_bytes=args.export_bytes,
+        file_bytes=args.file_bytes,
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        download_cut_rate=args.download_cut_rate,
+        throttle_rate=args.throttle_rate,
+        throttle_endpoints=tuple(item.strip() for item in args.throttle_endpoints.split(",") if item.strip()),
+        error_rate=args.error_rate,
+        export_fail_rate=args.export_fail_rate,
+        qps_limit=args.qps_limit,
+        edit_rate=args.edit_rate,
+        token_ttl=args.token_ttl,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="本地模拟飞书开放平台接口，用于离线压测与回归")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    server = MockFeishuServer(config_from_args(args), args.host, args.port)
+    print(f"[INFO] Mock Feishu API listening on {server.base_url}")
+    print(f"[INFO] Stats: GET http://{args.host}:{args.port}/_mock/stats, reset: POST /_mock/reset")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
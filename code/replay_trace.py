@@ -0,0 +1,259 @@
+import argparse
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+
+import main
+
+# Offline analysis and replay of a request trace written with TRACE_REQUESTS = True.
+# --analyze only reads the trace: per-endpoint latency split into DNS / connect / TLS / TTFB / body,
+# retries, status codes and bytes. Without it every recorded attempt is sent again to --url (by
+# default the BASE_URL the trace was recorded against), one replay thread per recorded thread,
+# each call at its original offset from the start (scaled by --speed), and the replayed latency
+# is compared with the recorded one. Export tickets and exported file tokens returned during the
+# replay replace the recorded ones in later calls; response bodies are not recorded, so anything
+# else that depends on server state (e.g. a listing that changed since) can differ.
+
+PHASES = ("dns_ms", "connect_ms", "tls_ms", "ttfb_ms", "body_ms", "total_ms")
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def trace_span(records: List[Dict[str, Any]]) -> float:
+    return max((record.get("at", 0) + record.get("total_ms", 0) / 1000 for record in records), default=0.0)
+
+
+def print_analysis(header: Dict[str, Any], records: List[Dict[str, Any]], slowest: int) -> None:
+    threads = {record.get("thread") for record in records}
+    print(
+        f"[INFO] {len(records)} requests from {len(threads)} threads over {trace_span(records):.1f}s, "
+        f"recorded against {header.get('base_url', '?')}"
+    )
+    by_endpoint: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records:
+        by_endpoint.setdefault(record.get("endpoint", "other"), []).append(record)
+    for endpoint, items in sorted(by_endpoint.items(), key=lambda item: -sum(r.get("total_ms", 0) for r in item[1])):
+        statuses: Dict[str, int] = {}
+        for record in items:
+            key = str(record.get("status") or record.get("error", "?"))
+            if record.get("code"):
+                key += f"/{record['code']}"
+            statuses[key] = statuses.get(key, 0) + 1
+        retries = sum(1 for record in items if record.get("attempt", 1) > 1)
+        connects = [record for record in items if "connect_ms" in record]
+        size = sum(record.get("bytes", 0) for record in items)
+        print(
+            f"- {endpoint}: n={len(items)} retries={retries} new_connections={len(connects)} "
+            f"{size / 1024 / 1024:.1f} MiB, status {', '.join(f'{k}x{v}' for k, v in sorted(statuses.items()))}"
+        )
+        for phase in PHASES:
+            values = [record[phase] for record in items if phase in record]
+            if values:
+                print(
+                    f"    {phase[:-3]:<7} n={len(values)} p50={percentile(values, 0.5):.1f}ms "
+                    f"p95={percentile(values, 0.95):.1f}ms max={max(values):.1f}ms"
+                )
+    if slowest > 0:
+        print(f"\n[SLOWEST {slowest}]")
+        for record in sorted(records, key=lambda r: -r.get("total_ms", 0))[:slowest]:
+            print(
+                f"- at={record.get('at', 0):.2f}s {record.get('method')} {record.get('path') or record.get('url')} "
+                f"status={record.get('status', record.get('error'))} total={record.get('total_ms', 0):.1f}ms "
+                f"attempt={record.get('attempt', 1)}"
+            )
+
+
+class TraceReplayer:
+    def __init__(self, base_url: str, tokens: main.AccessTokenManager, speed: float, timeout: float, verbose: bool) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.tokens = tokens
+        self.speed = speed
+        self.timeout = timeout
+        self.verbose = verbose
+        self.session = main.build_http_session(main.API_POOL_SIZE + main.DOWNLOAD_POOL_SIZE)
+        # recorded id -> id the replay target returned for the same call
+        self._ids: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.results: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+        self.started = 0.0
+
+    def _substitute(self, value: Any) -> Any:
+        if isinstance(value, str):
+            with self._lock:
+                for recorded, replayed in self._ids.items():
+                    value = value.replace(recorded, replayed)
+            return value
+        if isinstance(value, dict):
+            return {key: self._substitute(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._substitute(item) for item in value]
+        return value
+
+    def _url(self, record: Dict[str, Any]) -> str:
+        if record.get("path") is not None:
+            return self.base_url + self._substitute(record["path"])
+        # Absolute URLs (export download links) keep their path but go to the replay target.
+        target = urlsplit(self.base_url)
+        original = urlsplit(self._substitute(record.get("url", "")))
+        return urlunsplit((target.scheme, target.netloc, original.path, original.query, ""))
+
+    def send(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        headers: Dict[str, str] = {}
+        if record.get("path") is not None:
+            headers["Authorization"] = f"Bearer {self.tokens.token()}"
+            headers["Content-Type"] = "application/json; charset=utf-8"
+        if record.get("range"):
+            headers["Range"] = record["range"]
+        result: Dict[str, Any] = {"at": round(time.monotonic() - self.started, 4)}
+        started = time.perf_counter()
+        try:
+            response = self.session.request(
+                method=record.get("method", "GET"),
+                url=self._url(record),
+                headers=headers,
+                params=self._substitute(record.get("params")),
+                json=self._substitute(record.get("json")),
+                timeout=self.timeout,
+                stream=True,
+            )
+            try:
+                result["ttfb_ms"] = round(response.elapsed.total_seconds() * 1000, 1)
+                result["status"] = response.status_code
+                ids: Dict[str, str] = {}
+                if "json" in response.headers.get("Content-Type", ""):
+                    result["bytes"] = len(response.content)
+                    result["code"], ids = main.FeishuDriveBackup._trace_payload(response)
+                else:
+                    # Downloads are counted and dropped, never held in memory.
+                    result["bytes"] = sum(len(chunk) for chunk in response.iter_content(main.DOWNLOAD_CHUNK_BYTES))
+            finally:
+                response.close()
+            with self._lock:
+                for key, recorded in (record.get("ids") or {}).items():
+                    if ids.get(key):
+                        self._ids[recorded] = ids[key]
+        except requests.RequestException as exc:
+            result["error"] = type(exc).__name__
+        result["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    def _replay_thread(self, records: List[Dict[str, Any]]) -> None:
+        for record in records:
+            if self.speed > 0:
+                delay = self.started + record.get("at", 0) / self.speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            result = self.send(record)
+            if self.verbose:
+                print(
+                    f"[INFO] {record.get('endpoint')} {result.get('status', result.get('error'))} "
+                    f"{result['total_ms']:.1f}ms (recorded {record.get('status', record.get('error'))} "
+                    f"{record.get('total_ms', 0):.1f}ms)"
+                )
+            with self._lock:
+                self.results.append((record, result))
+
+    def replay(self, records: List[Dict[str, Any]]) -> float:
+        by_thread: Dict[str, List[Dict[str, Any]]] = {}
+        for record in records:
+            by_thread.setdefault(record.get("thread", ""), []).append(record)
+        threads = [
+            threading.Thread(target=self._replay_thread, args=(items,), name=f"replay-{name}", daemon=True)
+            for name, items in by_thread.items()
+        ]
+        self.started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.monotonic() - self.started
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def print_comparison(results: List[Tuple[Dict[str, Any], Dict[str, Any]]], recorded_span: float, elapsed: float, speed: float) -> int:
+    by_endpoint: Dict[str, List[Tuple[Dict[str, Any], Dict[str, Any]]]] = {}
+    for record, result in results:
+        by_endpoint.setdefault(record.get("endpoint", "other"), []).append((record, result))
+    mismatches = 0
+    print("\n[REPLAY]")
+    for endpoint, pairs in sorted(by_endpoint.items()):
+        recorded = [record.get("total_ms", 0) for record, _ in pairs]
+        replayed = [result["total_ms"] for _, result in pairs]
+        different = sum(
+            1
+            for record, result in pairs
+            if (record.get("status"), record.get("code"), record.get("error")) != (result.get("status"), result.get("code"), result.get("error"))
+        )
+        mismatches += different
+        lag = [result["at"] - record.get("at", 0) / speed for record, result in pairs] if speed > 0 else [0.0]
+        print(
+            f"- {endpoint}: n={len(pairs)} total p50 {percentile(recorded, 0.5):.1f} -> {percentile(replayed, 0.5):.1f}ms, "
+            f"p95 {percentile(recorded, 0.95):.1f} -> {percentile(replayed, 0.95):.1f}ms, "
+            f"status/code differs={different}, max start lag={max(lag):.2f}s"
+        )
+    target = recorded_span / speed if speed > 0 else 0
+    print(f"Wall time: recorded {recorded_span:.1f}s{f' (x{speed:g} = {target:.1f}s)' if speed not in (0, 1) else ''}, replayed {elapsed:.1f}s")
+    print(f"Status / API code mismatches: {mismatches}")
+    return mismatches
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="分析或按原始时序重放 TRACE_REQUESTS 记录的请求")
+    parser.add_argument("trace", help=f"请求记录文件（运行目录下的 {main.TRACE_FILENAME}）")
+    parser.add_argument("--analyze", action="store_true", help="只分析记录，不发送请求")
+    parser.add_argument("--slowest", type=int, default=10, help="--analyze 时列出最慢的请求数")
+    parser.add_argument("--url", help="重放目标（例如 http://127.0.0.1:18080/open-apis），默认为记录时的 BASE_URL")
+    parser.add_argument("--token", help="重放使用的 user_access_token，默认按 main.py 配置刷新")
+    parser.add_argument("--endpoint", action="append", help="只重放这些 endpoint（可多次给出）")
+    parser.add_argument("--speed", type=float, default=1.0, help="时间倍速，2 为两倍速，0 为不等待")
+    parser.add_argument("--timeout", type=float, default=main.REQUEST_TIMEOUT_SECONDS)
+    parser.add_argument("--json", dest="json_path", help="把每个请求的记录与重放结果写入 JSON 文件")
+    parser.add_argument("--verbose", action="store_true", help="逐个输出重放结果")
+    return parser.parse_args(argv)
+
+
+def main_replay() -> None:
+    args = parse_args()
+    header, records = main.RequestTrace.read(Path(args.trace))
+    if args.endpoint:
+        records = [record for record in records if record.get("endpoint") in set(args.endpoint)]
+    if not records:
+        print(f"[ERROR] No requests in {args.trace}")
+        sys.exit(1)
+    if args.analyze:
+        print_analysis(header, records, args.slowest)
+        return
+
+    base_url = args.url or header.get("base_url") or main.BASE_URL
+    # Token refreshes are not traced; the replay gets its own token.
+    main.BASE_URL = base_url
+    tokens = main.AccessTokenManager(access_token=args.token) if args.token else main.get_runtime_token_manager()
+    replayer = TraceReplayer(base_url, tokens, args.speed, args.timeout, args.verbose)
+    print(f"[INFO] Replaying {len(records)} requests against {base_url}, speed={args.speed:g}")
+    try:
+        elapsed = replayer.replay(records)
+    finally:
+        replayer.close()
+    mismatches = print_comparison(replayer.results, trace_span(records), elapsed, args.speed)
+    if args.json_path:
+        payload = [{"recorded": record, "replayed": result} for record, result in replayer.results]
+        Path(args.json_path).write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[INFO] Results written to {args.json_path}")
+    sys.exit(2 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main_replay()
@@ -0,0 +1,116 @@
+import hashlib
+import itertools
+import json
+from pathlib import Path
+
+import pytest
+
+import main
+from mock_feishu_server import MockConfig, MockFeishuServer
+
+# Regression checks against the in-process mock server: python3 -m pytest -q
+
+
+def test_rejected_export_falls_back_with_original_extension(tmp_path: Path) -> None:
+    # The mock rejects every export of type=file; with the run journal on, the direct download
+    # must not reuse the journaled export target ("Doc 5.pdf").
+    server = MockFeishuServer(MockConfig(depth=0, files=6, types=("file",), export_delay=0)).start()
+    base_url = main.BASE_URL
+    main.BASE_URL = server.base_url
+    run_dir = tmp_path / "run"
+    backup = main.FeishuDriveBackup(
+        user_access_token="mock-token",
+        output_dir=run_dir,
+        poll_interval_seconds=0.05,
+        journal=main.RunJournal(run_dir / main.JOURNAL_FILENAME, run_dir),
+        export_routes=main.ExportRouteTable(None),
+        scan_existing_names=False,
+    )
+    try:
+        assert backup.run() == 0
+    finally:
+        backup.close()
+        server.stop()
+        main.BASE_URL = base_url
+
+    entries = [json.loads(line) for line in (run_dir / main.MANIFEST_FILENAME).read_text(encoding="utf-8").splitlines()]
+    assert backup.stats["fallback_downloaded"] == len(entries) == 6
+    for entry in entries:
+        assert entry["mode"] == "downloaded"
+        assert Path(entry["path"]).suffix == ".bin"
+    assert not list(run_dir.glob("*.pdf"))
+
+
+def test_throttled_token_refresh_is_retried(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Tokens live one second and only the oauth endpoint is throttled, so the 401 renewals in
+    # _request go through refreshes that may first get HTTP 429.
+    monkeypatch.setattr(main, "TOKEN_STORE_FILE", str(tmp_path / "token_store.json"))
+    monkeypatch.setattr(main, "TOKEN_REFRESH_ATTEMPTS", 20)
+    config = MockConfig(
+        depth=1,
+        folders=2,
+        files=4,
+        types=("docx", "sheet"),
+        export_delay=1.5,
+        token_ttl=1,
+        throttle_rate=0.5,
+        throttle_endpoints=("oauth_token",),
+    )
+    server = MockFeishuServer(config).start()
+    # Chaos rolls alternate 0.0 / 0.99, so the very first refresh is always throttled.
+    rolls = itertools.cycle((0.0, 0.99))
+    monkeypatch.setattr(server.state.rng, "random", lambda: next(rolls))
+    monkeypatch.setattr(main, "BASE_URL", server.base_url)
+    tokens = main.AccessTokenManager("mock.refresh.token")
+    backup = main.FeishuDriveBackup(
+        user_access_token="",
+        output_dir=tmp_path / "run",
+        poll_interval_seconds=0.2,
+        token_manager=tokens,
+        scan_existing_names=False,
+    )
+    try:
+        tokens.refresh("")
+        exit_code = backup.run()
+    finally:
+        backup.close()
+        server.stop()
+
+    assert exit_code == 0
+    assert backup.stats["failed"] == 0
+    assert backup.stats["files"] > 0
+    assert server.state.stats()["endpoints"]["oauth_token"].get("throttled", 0) > 0
+
+
+def test_interrupted_segments_are_resumed(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Attachments go through the multi-range download and the first body of every range is
+    # dropped halfway, so segments are cut mid-range and must resume from the byte they reached.
+    # Small chunks let the bytes before the cut reach the file instead of dying in a partial read.
+    monkeypatch.setattr(main, "PARALLEL_DOWNLOAD_MIN_BYTES", 64 * 1024)
+    monkeypatch.setattr(main, "DOWNLOAD_CHUNK_BYTES", 8 * 1024)
+    server = MockFeishuServer(MockConfig(depth=0, files=3, types=("file",), file_bytes=512 * 1024, download_cut_rate=1.0)).start()
+    monkeypatch.setattr(main, "BASE_URL", server.base_url)
+    backup = main.FeishuDriveBackup(
+        user_access_token="mock-token",
+        output_dir=tmp_path / "run",
+        poll_interval_seconds=0.05,
+        export_routes=main.ExportRouteTable(None),
+        scan_existing_names=False,
+    )
+    try:
+        exit_code = backup.run()
+    finally:
+        backup.close()
+        server.stop()
+
+    assert exit_code == 0
+    assert server.state.stats()["endpoints"]["file_download"].get("cut", 0) > 0
+    entries = [json.loads(line) for line in (tmp_path / "run" / main.MANIFEST_FILENAME).read_text(encoding="utf-8").splitlines()]
+    assert len(entries) == 3
+    for entry in entries:
+        size = server.state.tree.size(entry["token"], server.state.config.file_bytes)
+        expected = (server.state.tree.pattern(entry["token"]) * (size // 4096 + 1))[:size]
+        data = (tmp_path / "run" / entry["path"]).read_bytes()
+        assert data == expected
+        assert entry["digest"] == hashlib.sha256(expected).hexdigest()
+    assert not list((tmp_path / "run").glob("*.part"))